@@ -11,3 +11,32 @@ TABLE_HISTORY_DATE_FACTOR_INFO = "hh_quant_history_date_factor_info"
 TABLE_HISTORY_ALPHA101_FACTOR_INFO = "hh_quant_history_alpha101_factor_info"
 TABLE_HISTORY_ALPHA184_FACTOR_INFO = "hh_quant_history_alpha184_factor_info"
 TABLE_HISTORY_ALPHA191_FACTOR_INFO = "hh_quant_history_alpha191_factor_info"
+TABLE_HISTORY_ALPHAGP_FACTOR_INFO = "hh_quant_history_alphagp_factor_info"
+
+# 因子增量计算的窗口状态目录(每个因子库一个状态文件)
+FACTOR_STATE_DIR = "./db_factor_prebuilder/factor_state"
+
+# 因子计算性能统计报告目录(按算子/因子的耗时与失败情况), 默认None不统计; 需要分析耗时时设为目录, 如"./db_factor_prebuilder/factor_profile"
+FACTOR_PROFILE_DIR = None
+
+# 因子面板计算精度: "float64" / "float32"(内存减半, 与float64的逐因子偏差见db_factor_prebuilder/factor_ref/precision_float32.csv)
+FACTOR_PRECISION = "float64"
+
+# 因子全量计算时每块的交易日数(按时间分块, 每块额外加载因子库所需的回看历史, 结果与不分块一致), 设为None则不分块
+FACTOR_CHUNK_DAYS = 500
+
+# 因子面板计算的并行线程数(按DAG调度互不依赖的节点, 中间结果用完即释放), 设为None则逐节点顺序计算
+FACTOR_SCHEDULER_WORKERS = None
+
+# 因子库dry-run清单目录(由expression_dryrun生成, 每个因子库一个{因子库名称}_manifest.json), 清单中已知失败/常数的因子不计算, 设为None则不使用清单
+FACTOR_MANIFEST_DIR = "./db_factor_prebuilder/factor_ref"
+
+# 是否同时跳过清单中隔离(过慢/有效区间NaN过多)的因子, 默认照常计算, 只跳过已知失败/常数的因子
+FACTOR_EXCLUDE_QUARANTINE = False
+
+# 遗传规划挖掘的因子库(由PrebuilderFactor._mine_start生成, 存在时随其他因子库一起更新)及挖掘参数
+FACTOR_MINER_LIBRARY = "./db_factor_prebuilder/factor_lib/alpha_gp.json"
+FACTOR_MINER_GENERATIONS = 10
+FACTOR_MINER_POPULATION = 500
+FACTOR_MINER_HOLDOUT = 0.3  # 样本外交易日占比, 入选因子须在样本外同样有效
+FACTOR_MINER_WORKERS = None  # 并行线程数, None为CPU核数
@@ -79,7 +79,8 @@ if __name__ == "__main__":
             # 1. 开始更新基础数据至本地数据库
             db_uploader_baostock._update_start(start_date, end_date)
             # 2. 开始更新基础特征至本地数据库
-            # db_prebuilder_factor._update_start(start_date, end_date)
+            # db_prebuilder_factor._update_start(start_date, end_date, incremental=True)  # 增量模式: 从上一交易日保存的窗口状态继续计算
+            # db_prebuilder_factor._mine_start("2020-01-01", end_date)  # 遗传规划挖掘新因子(保存为factor_lib/alpha_gp.json, 之后随因子库一起更新)
         else:
             print(f"已经是最新数据啦...start: {start_date}, end: {end_date}")
 
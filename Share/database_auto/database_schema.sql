@@ -538,4 +538,10 @@ CREATE TABLE hh_quant_history_alpha191_factor_info (
     , alpha_191_190 REAL
     , alpha_191_191 REAL
     , PRIMARY KEY(code, datetime)
-  );
\ No newline at end of file
+  );
+-- 遗传规划挖掘的因子库(FACTOR_MINER_LIBRARY), 因子名随每次挖掘增加, 因子列由PrebuilderFactor入库时按需添加(ALTER TABLE ADD COLUMN)
+CREATE TABLE hh_quant_history_alphagp_factor_info (
+    code TEXT NOT NULL
+    , datetime DATE NOT NULL
+    , PRIMARY KEY(code, datetime)
+  );
@@ -27,6 +27,14 @@ class DownloaderBase:
         dataframe = pd.read_sql_query(query, self.db_conn)
         return dataframe
 
+    def _download_all_history_base_info(self, start_date=None, end_date=None):
+        if start_date and end_date:
+            query = f"select * from {self.db_config.TABLE_HISTORY_BASE_INFO} where datetime between '{start_date}' and '{end_date}';"
+        else:
+            query = f"select * from {self.db_config.TABLE_HISTORY_BASE_INFO};"
+        dataframe = pd.read_sql_query(query, self.db_conn)
+        return dataframe
+
     def _download_history_indicator_info(self, code, start_date=None, end_date=None):
         if start_date and end_date:
             query = f"select * from {self.db_config.TABLE_HISTORY_INDICATOR_INFO} where code = '{code}' and datetime between '{start_date}' and '{end_date}';"
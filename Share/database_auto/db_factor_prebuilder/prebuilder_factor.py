@@ -1,21 +1,21 @@
 import os
 import sys
+import bisect
+import traceback
 
 cur_path = os.path.split(os.path.realpath(__file__))[0]
 sys.path.append(os.path.abspath(os.path.join(cur_path, "..")))
 
-import json
 import pandas as pd
 import numpy as np
 import akshare as ak
 import sys
 import database_config as db_config
 
-from tqdm import tqdm
 from db_data_downloader.downloader_base import DownloaderBase
 from db_factor_prebuilder.utils.expression_excutor import AlphaExpressionExcutor
-from datetime import datetime
-from dateutil.relativedelta import relativedelta
+from db_factor_prebuilder.utils.expression_manifest import load_manifest, manifest_path, manifest_exclusions
+from db_factor_prebuilder.utils.expression_miner import AlphaFactorMiner
 
 
 class PrebuilderFactor:
@@ -24,42 +24,129 @@ class PrebuilderFactor:
         self.db_config = db_config
         self.db_downloader = db_downloader
         self.exp_excutor = AlphaExpressionExcutor()  # 表达式引擎
+        self._trade_dates = None  # 交易日历(升序), 每次更新读取一次, 见_trade_calendar
+        self.exp_excutor.set_precision(getattr(db_config, "FACTOR_PRECISION", "float64"))  # 面板计算精度
+        if getattr(db_config, "FACTOR_SCHEDULER_WORKERS", None):
+            self.exp_excutor.enable_scheduler(db_config.FACTOR_SCHEDULER_WORKERS)  # 面板计算按DAG并行调度
+        if getattr(db_config, "FACTOR_PROFILE_DIR", None):
+            self.exp_excutor.enable_profiling()  # 统计各算子/因子的耗时与失败情况, 每次更新后输出报告
 
     def _upload_factor_to_db(self, dataframe, table_name, method="append"):
         # 插入数据库
+        if method == "append":
+            self._add_missing_columns(dataframe, table_name)
         dataframe.to_sql(table_name, self.db_conn, if_exists=method, index=False)
 
-    def _update_start(self, start_date, end_date):
+    def _add_missing_columns(self, dataframe, table_name):
+        # 已有的表缺少的列(如遗传规划因子库新挖掘的因子)先添加, 否则追加写入时报错"table has no column named ..."; 表不存在时由to_sql建表
+        table_columns = {row[1] for row in self.db_conn.execute(f'PRAGMA table_info("{table_name}")')}
+        if not table_columns:
+            return
+        for column in dataframe.columns:
+            if column not in table_columns:
+                column_type = "REAL" if pd.api.types.is_numeric_dtype(dataframe[column]) else "TEXT"
+                self.db_conn.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{column}" {column_type}')
+        self.db_conn.commit()
+
+    def _update_start(self, start_date, end_date, incremental=False):
+        self._trade_dates = None  # 交易日表可能已由uploader更新, 本次更新重新读取一次
         # 1. 更新日期相关特征
         self._upload_date_factor(start_date, end_date)
-        # 2. 更新Alpha因子特征
+        # 2. 更新Alpha因子特征(incremental=True时从上次保存的窗口状态增量计算)
         all_stock_info = self.db_downloader._download_all_stock_info()
         stock_list = list(sorted(all_stock_info[all_stock_info["code"].str.startswith(("sh", "sz"))]["code"].unique()))
+        stock_industry = all_stock_info.set_index("code")["industry"]  # 行业信息, 用于截面行业中性化
+        _upload_alpha_factor = self._upload_alpha_factor_incremental if incremental else self._upload_alpha_factor
         # 2.1 更新alpha184因子库
-        self._upload_alpha_factor(
+        _upload_alpha_factor(
             stock_list,
             start_date,
             end_date,
             alpha_dict_path="./db_factor_prebuilder/factor_lib/alpha_184.json",
             db_save_path=self.db_config.TABLE_HISTORY_ALPHA184_FACTOR_INFO,
+            stock_industry=stock_industry,
         )
         # 2.2 更新alpha101因子库
-        self._upload_alpha_factor(
+        _upload_alpha_factor(
             stock_list,
             start_date,
             end_date,
             alpha_dict_path="./db_factor_prebuilder/factor_lib/alpha_101.json",
             db_save_path=self.db_config.TABLE_HISTORY_ALPHA101_FACTOR_INFO,
+            stock_industry=stock_industry,
+        )
+        # 2.3 更新alpha191因子库(无法计算的因子由dry-run清单跳过)
+        _upload_alpha_factor(
+            stock_list,
+            start_date,
+            end_date,
+            alpha_dict_path="./db_factor_prebuilder/factor_lib/alpha_191.json",
+            db_save_path=self.db_config.TABLE_HISTORY_ALPHA191_FACTOR_INFO,
+            stock_industry=stock_industry,
         )
-        # 2.1 更新alpha191因子库
-        # self._upload_alpha_factor(
-        #     stock_list,
-        #     start_date,
-        #     end_date,
-        #     alpha_dict_path="./db_factor_prebuilder/factor_lib/alpha_191.json",
-        #     db_save_path=self.db_config.TABLE_HISTORY_ALPHA191_FACTOR_INFO,
-        # )
+        # 2.4 更新遗传规划挖掘的因子库(见_mine_start)
+        miner_library = getattr(self.db_config, "FACTOR_MINER_LIBRARY", None)
+        if miner_library and os.path.exists(miner_library):
+            _upload_alpha_factor(
+                stock_list,
+                start_date,
+                end_date,
+                alpha_dict_path=miner_library,
+                db_save_path=self.db_config.TABLE_HISTORY_ALPHAGP_FACTOR_INFO,
+                stock_industry=stock_industry,
+            )
         # 3. 更新其他特征
+        # 4. 输出因子计算的性能统计报告
+        self._dump_factor_profile(start_date, end_date)
+
+    def _mine_start(self, start_date, end_date):
+        # 在[start_date, end_date]的全市场行情上用遗传规划挖掘因子, 结果保存为FACTOR_MINER_LIBRARY因子库, 之后随_update_start一起入库
+        try:
+            print("开始挖掘Alpha因子...")
+            all_stock_info = self.db_downloader._download_all_stock_info()
+            stock_list = list(sorted(all_stock_info[all_stock_info["code"].str.startswith(("sh", "sz"))]["code"].unique()))
+            history_base = self.db_downloader._download_all_history_base_info(start_date, end_date)
+            history_base = history_base[history_base["code"].isin(stock_list)].sort_values(["code", "datetime"])
+            history_base["vwap"] = history_base[["open", "high", "low", "close"]].mean(axis=1)
+            history_base["returns"] = history_base.groupby("code")["close"].pct_change()
+            _, _, panel = self.exp_excutor.build_panel(history_base, codes=stock_list)
+            factor_miner = AlphaFactorMiner(
+                self.exp_excutor,
+                population_size=getattr(self.db_config, "FACTOR_MINER_POPULATION", 500),
+                holdout=getattr(self.db_config, "FACTOR_MINER_HOLDOUT", 0.3),
+                max_workers=getattr(self.db_config, "FACTOR_MINER_WORKERS", None),
+            )
+            factor_miner.mine(panel, generations=getattr(self.db_config, "FACTOR_MINER_GENERATIONS", 10))
+            winners = factor_miner.winners()
+            library = factor_miner.save_library(winners, self.db_config.FACTOR_MINER_LIBRARY)
+            print(f"挖掘到{len(winners)}个因子, 因子库共{len(library)}个因子, 已保存: {self.db_config.FACTOR_MINER_LIBRARY}")
+        except KeyboardInterrupt:
+            sys.exit(0)
+        except Exception:
+            print("挖掘Alpha因子失败:")
+            traceback.print_exc()
+
+    def _dump_factor_profile(self, start_date, end_date):
+        profiler = self.exp_excutor.profiler
+        if profiler is None:
+            return
+        os.makedirs(self.db_config.FACTOR_PROFILE_DIR, exist_ok=True)
+        profile_path = os.path.join(self.db_config.FACTOR_PROFILE_DIR, f"factor_profile_{start_date}_{end_date}")
+        profiler.dump(json_path=f"{profile_path}.json", text_path=f"{profile_path}.txt")
+        print(profiler.report_text(top=10))
+        profiler.reset()
+
+    def _trade_calendar(self):
+        if self._trade_dates is None:
+            self._trade_dates = sorted(self.db_downloader._download_history_trade_date()["datetime"])
+        return self._trade_dates
+
+    def _lookback_start_date(self, start_date, lookback):
+        # start_date之前第lookback个交易日(按交易日表), 历史不足时取最早的交易日
+        prior_count = bisect.bisect_left(self._trade_calendar(), start_date)
+        if lookback <= 0 or prior_count == 0:
+            return start_date
+        return self._trade_calendar()[prior_count - min(lookback, prior_count)]
 
     def _upload_date_factor(self, start_date, end_date):
         try:
@@ -94,27 +181,112 @@ class PrebuilderFactor:
         except Exception as e:
             print(e)
 
-    def _upload_alpha_factor(self, stock_list, start_date, end_date, alpha_dict_path, db_save_path):
+    def _upload_alpha_factor(self, stock_list, start_date, end_date, alpha_dict_path, db_save_path, stock_industry=None):
         try:
             print("开始更新Alpha因子...")
-            alpha_factor_dict = json.loads(open(alpha_dict_path, "r").read())
-            new_start_date = datetime.strftime(datetime.strptime(start_date, "%Y-%m-%d") - relativedelta(months=3), "%Y-%m-%d")
-            for code in tqdm(stock_list):  # 此处运行需优化
-                history_base = self.db_downloader._download_history_base_info(code, new_start_date, end_date)
+            # 整个因子库构建为共享DAG, 公共子表达式只计算一次
+            alpha_graph = self.exp_excutor.compile_graph(alpha_dict_path, skip_constant=True, exclude=self._manifest_exclusions(alpha_dict_path))
+            print(f"因子库DAG去重统计: {alpha_graph.report()}")
+            self._report_constant_factors(alpha_dict_path)
+            lookback = self.exp_excutor.library_lookback(alpha_dict_path)  # 因子库所需的回看交易日数(静态分析)
+            # 按交易日分块计算(FACTOR_CHUNK_DAYS), 每块只加载本块及之前lookback个交易日的行情, 峰值内存由块大小决定
+            for chunk_start, chunk_end in self._chunk_date_ranges(start_date, end_date):
+                new_start_date = self._lookback_start_date(chunk_start, lookback)
+                print(f"因子库回看交易日数: {lookback}, 计算区间: {chunk_start} ~ {chunk_end}, 行情起始日期: {new_start_date}")
+                # 一次加载全市场行情, 构建(日期 x 股票)面板
+                history_base = self.db_downloader._download_all_history_base_info(new_start_date, chunk_end)
+                history_base = history_base[history_base["code"].isin(stock_list)].sort_values(["code", "datetime"])
                 # 计算额外的columns
                 history_base["vwap"] = history_base[["open", "high", "low", "close"]].mean(axis=1)
-                history_base["returns"] = history_base["close"].pct_change()
-                # 构建factor
-                dataframe = history_base[["code", "datetime"]]
-                for alpha_name, alpha_expression in alpha_factor_dict.items():
-                    try:
-                        dataframe[alpha_name] = self.exp_excutor.excute(history_base, alpha_expression)
-                    except Exception as e:
-                        dataframe[alpha_name] = np.NaN
+                history_base["returns"] = history_base.groupby("code")["close"].pct_change()
+                dates, codes, panel = self.exp_excutor.build_panel(history_base, codes=stock_list)
+                if stock_industry is not None:
+                    panel["industry"] = self.exp_excutor.build_panel_groups(codes, stock_industry)  # 行业分组编号
+                # 构建factor: 每个因子对全市场只计算一次(失败的因子填充NaN), 只保留有行情的(日期, 股票)
+                panel_results = self.exp_excutor.execute_panel(alpha_graph, panel)
+                if self.exp_excutor.scheduler is not None:
+                    self._report_schedule(self.exp_excutor.scheduler.last_stats)
+                dataframe = self.exp_excutor.panel_to_frame(dates, codes, panel_results, mask=~np.isnan(panel["close"]))
                 dataframe = dataframe.replace([np.inf, -np.inf], np.nan)
-                dataframe = dataframe[(dataframe["datetime"] >= start_date) & (dataframe["datetime"] <= end_date)]
+                dataframe = dataframe[(dataframe["datetime"] >= chunk_start) & (dataframe["datetime"] <= chunk_end)]
                 self._upload_factor_to_db(dataframe, db_save_path)
         except KeyboardInterrupt:
             sys.exit(0)
-        except Exception as e:
-            print(e)
+        except Exception:
+            print("更新Alpha因子失败:")
+            traceback.print_exc()
+
+    def _report_schedule(self, stats):
+        # 并行调度统计: 墙钟时间, 计算耗时之和, 关键路径耗时(并行的下界), 峰值内存 / 不释放中间结果时的内存
+        print(
+            f"并行调度: {stats['workers']}线程, 耗时{stats['wall_seconds']:.2f}s, 计算{stats['work_seconds']:.2f}s, 关键路径{stats['critical_path_seconds']:.2f}s,"
+            f" 峰值内存{stats['peak_bytes'] / 1024**2:.0f}MB / {stats['total_bytes'] / 1024**2:.0f}MB"
+        )
+
+    def _report_constant_factors(self, alpha_dict_path):
+        # 常数因子(如close/close)对模型没有信息量, 不计算也不入库
+        constant_factors = self.exp_excutor.constant_factors(alpha_dict_path)
+        if constant_factors:
+            print(f"跳过常数因子: {sorted(constant_factors)}")
+
+    def _manifest_exclusions(self, alpha_dict_path):
+        # dry-run清单(见expression_dryrun, 读取见expression_manifest)中已知失败的因子(及设置FACTOR_EXCLUDE_QUARANTINE时隔离的因子)不计算也不入库; 没有清单时全部计算
+        manifest_dir = getattr(self.db_config, "FACTOR_MANIFEST_DIR", None)
+        if not manifest_dir:
+            return {}
+        exclusions = manifest_exclusions(
+            load_manifest(manifest_path(alpha_dict_path, manifest_dir)),
+            alpha_dict_path,
+            self.exp_excutor,
+            exclude_quarantine=getattr(self.db_config, "FACTOR_EXCLUDE_QUARANTINE", False),
+        )
+        if exclusions:
+            print(f"按dry-run清单跳过{len(exclusions)}个因子: {sorted(exclusions)}")
+        return exclusions
+
+    def _chunk_date_ranges(self, start_date, end_date):
+        # 按FACTOR_CHUNK_DAYS个交易日切分[start_date, end_date], 未设置时不分块
+        chunk_days = getattr(self.db_config, "FACTOR_CHUNK_DAYS", None)
+        if not chunk_days:
+            return [(start_date, end_date)]
+        trade_calendar = self._trade_calendar()
+        trade_dates = trade_calendar[bisect.bisect_left(trade_calendar, start_date) : bisect.bisect_right(trade_calendar, end_date)]
+        return [(trade_dates[i], trade_dates[min(i + chunk_days, len(trade_dates)) - 1]) for i in range(0, len(trade_dates), chunk_days)]
+
+    def _upload_alpha_factor_incremental(self, stock_list, start_date, end_date, alpha_dict_path, db_save_path, stock_industry=None):
+        try:
+            print("开始增量更新Alpha因子...")
+            alpha_graph = self.exp_excutor.compile_graph(alpha_dict_path, skip_constant=True, exclude=self._manifest_exclusions(alpha_dict_path))
+            self._report_constant_factors(alpha_dict_path)
+            state_path = os.path.join(self.db_config.FACTOR_STATE_DIR, f"{db_save_path}.pkl")  # 每个因子库一个窗口状态文件
+            codes = np.asarray(stock_list)
+            static_fields = {} if stock_industry is None else {"industry": self.exp_excutor.build_panel_groups(codes, stock_industry)}
+            alpha_stream = self.exp_excutor.create_stream(alpha_graph, codes, static_fields, state_path=state_path)
+            if alpha_stream.last_date is None:
+                # 首次运行: 按静态分析的回看交易日数加载历史, 预热各节点的窗口
+                new_start_date = self._lookback_start_date(start_date, self.exp_excutor.library_lookback(alpha_dict_path))
+            else:
+                # 状态中已有窗口历史, 只需从最后日期开始加载(用于计算returns)
+                new_start_date = min(alpha_stream.last_date, start_date)
+            history_base = self.db_downloader._download_all_history_base_info(new_start_date, end_date)
+            history_base = history_base[history_base["code"].isin(stock_list)].sort_values(["code", "datetime"])
+            history_base["vwap"] = history_base[["open", "high", "low", "close"]].mean(axis=1)
+            history_base["returns"] = history_base.groupby("code")["close"].pct_change()
+            dates, codes, panel = self.exp_excutor.build_panel(history_base, codes=codes)
+            warmup_count = int(np.searchsorted(dates, start_date))
+            if alpha_stream.last_date is None and warmup_count > 0:
+                alpha_stream.warmup(dates[:warmup_count], {field: array[:warmup_count] for field, array in panel.items()})
+            # 逐个交易日追加截面行情, 每个节点只计算新的一行
+            new_dates, panel_results = alpha_stream.update_panel(dates, panel)
+            close = panel["close"][np.isin(dates, new_dates)]
+            dataframe = self.exp_excutor.panel_to_frame(new_dates, codes, panel_results, mask=~np.isnan(close))
+            dataframe = dataframe.replace([np.inf, -np.inf], np.nan)
+            dataframe = dataframe[(dataframe["datetime"] >= start_date) & (dataframe["datetime"] <= end_date)]
+            self._upload_factor_to_db(dataframe, db_save_path)
+            os.makedirs(self.db_config.FACTOR_STATE_DIR, exist_ok=True)
+            alpha_stream.save(state_path)
+        except KeyboardInterrupt:
+            sys.exit(0)
+        except Exception:
+            print("更新Alpha因子失败:")
+            traceback.print_exc()
@@ -0,0 +1,477 @@
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from .expression_kernels import rolling_rank, rolling_quantile, rolling_weighted_mean, rolling_argmax, rolling_argmin, rolling_linregress, rolling_product
+from .expression_kernels import rolling_comoments_windows, rolling_comoments_pairs, cross_section_rank
+from .expression_numba import NUMBA_AVAILABLE, NUMBA_KERNELS
+from .expression_graph import AlphaExpressionGraph
+from .expression_excutor import AlphaPanelOperations, AlphaExpressionExcutor
+
+# 算子性能基准(在Share/database_auto目录下运行):
+#   python -m db_factor_prebuilder.utils.expression_benchmark
+
+BENCHMARK_WINDOWS = (5, 10, 20, 30, 60)
+BENCHMARK_LIBRARY = "./db_factor_prebuilder/factor_lib/alpha_101.json"
+BENCHMARK_LIBRARIES = [f"./db_factor_prebuilder/factor_lib/{library}.json" for library in ("alpha_101", "alpha_184", "alpha_191", "alpha_360")]
+PRECISION_REPORT = "./db_factor_prebuilder/factor_ref/precision_float32.csv"
+
+
+# 原始实现(逐窗口Python回调 / 逐只股票计算), 作为速度与数值的参照
+def reference_tsrank(frame, window):
+    return frame.rolling(window=window).apply(lambda x: x.rank(pct=True).iloc[-1], raw=False)
+
+
+def reference_quantile(frame, window, quantile):
+    return pd.DataFrame({code: frame[code].rolling(window=window).quantile(quantile) for code in frame.columns})
+
+
+def reference_weighted_mean(frame, weights):
+    return frame.rolling(window=len(weights)).apply(lambda x: np.dot(x, weights) / np.sum(weights), raw=True)
+
+
+WEIGHTED_MEAN_OPERATORS = {
+    "decaylinear": lambda window: np.arange(1, window + 1),
+    "wma": lambda window: np.power(0.9, np.arange(window)[::-1]),
+    "sma": lambda window: np.full(window, 1),
+}
+
+
+def make_random_panel(n_dates, n_codes, nan_ratio=0.01, seed=1024):
+    # 模拟价格面板: 随机游走 + 少量缺失值
+    rng = np.random.default_rng(seed)
+    panel = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, (n_dates, n_codes)), axis=0))
+    panel[rng.random((n_dates, n_codes)) < nan_ratio] = np.nan
+    return panel
+
+
+# Numba内核与回退实现的对照: 内核名称 -> (回退实现, 输入类型)
+NUMBA_FALLBACKS = {
+    "rolling_argmax": (rolling_argmax, "price"),
+    "rolling_argmin": (rolling_argmin, "price"),
+    "rolling_rank": (rolling_rank, "price"),
+    "rolling_count": (lambda array, window: pd.DataFrame(array).rolling(window=window).sum().to_numpy().reshape(array.shape), "condition"),
+    "rolling_product": (rolling_product, "ratio"),
+    "rolling_linregress": (rolling_linregress, "price"),
+}
+
+
+def make_random_input(kind, n_dates, n_codes, seed):
+    # 随机输入: 含NaN/±inf/并列值/常数段, 条件序列为0/1
+    rng = np.random.default_rng(seed)
+    if kind == "condition":
+        array = (rng.random((n_dates, n_codes)) < 0.5).astype(np.float64)
+    elif kind == "ratio":
+        array = 1 + rng.normal(0, 0.02, (n_dates, n_codes))
+    else:
+        array = make_random_panel(n_dates, n_codes, seed=seed)
+        array[:, : n_codes // 2] = np.round(array[:, : n_codes // 2], 1)  # 一半股票保留1位小数, 制造并列值
+        array[n_dates // 3 : n_dates // 3 + 10] = array[n_dates // 3]  # 常数段
+    array[rng.random((n_dates, n_codes)) < 0.02] = np.nan
+    array[rng.random((n_dates, n_codes)) < 0.002] = np.inf
+    return array
+
+
+def kernel_diff(left, right):
+    # 两个内核结果的最大绝对误差(linregress逐个统计量比较)
+    if isinstance(left, dict):
+        return max(max_abs_diff(left[name], right[name]) for name in left)
+    return max_abs_diff(left, right)
+
+
+def make_random_stock(n_dates, seed=1024):
+    # 模拟单只股票的日线行情(含停牌导致的缺失值)
+    rng = np.random.default_rng(seed)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n_dates)))
+    open_ = close * (1 + rng.normal(0, 0.01, n_dates))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, n_dates)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, n_dates)))
+    volume = rng.integers(10**5, 10**7, n_dates).astype(np.float64)
+    df = pd.DataFrame({"open": open_, "high": high, "low": low, "close": close, "volume": volume, "amount": volume * close})
+    df.loc[rng.random(n_dates) < 0.01] = np.nan
+    df["vwap"] = df["amount"] / df["volume"]
+    df["returns"] = df["close"].pct_change(fill_method=None)
+    return df
+
+
+def make_random_market(n_dates, n_codes, n_industries=10, seed=1024, suspended_ratio=0.01):
+    # 模拟全市场行情面板(与AlphaExpressionExcutor.build_panel的输出格式一致), 含停牌导致的缺失值(每个格子独立以suspended_ratio的概率缺失)
+    rng = np.random.default_rng(seed)
+    close = make_random_panel(n_dates, n_codes, nan_ratio=0, seed=seed)
+    open_ = close * (1 + rng.normal(0, 0.01, close.shape))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, close.shape)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, close.shape)))
+    volume = rng.integers(10**5, 10**7, close.shape).astype(np.float64)
+    panel = {"open": open_, "high": high, "low": low, "close": close, "volume": volume, "amount": volume * close}
+    suspended = rng.random(close.shape) < suspended_ratio
+    for array in panel.values():
+        array[suspended] = np.nan
+    panel["vwap"] = (open_ + high + low + close) / 4
+    panel["returns"] = np.vstack([np.full((1, n_codes), np.nan), close[1:] / close[:-1] - 1])
+    panel["industry"] = rng.integers(0, n_industries, n_codes)
+    return panel
+
+
+def time_call(func, *args, repeat=3):
+    # 取多次运行的最短耗时
+    best, result = np.inf, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def max_abs_diff(left, right):
+    left, right = np.asarray(left, dtype=np.float64), np.asarray(right, dtype=np.float64)
+    if not np.array_equal(np.isnan(left), np.isnan(right)):
+        return np.inf
+    valid = ~np.isnan(left)
+    return float(np.max(np.abs(left[valid] - right[valid]))) if valid.any() else 0.0
+
+
+def benchmark_window_operator(name, reference, kernel, panel, windows=BENCHMARK_WINDOWS, repeat=3):
+    rows = []
+    frame = pd.DataFrame(panel)
+    for window in windows:
+        reference_time, reference_result = time_call(reference, frame, window, repeat=1)
+        kernel_time, kernel_result = time_call(kernel, panel, window, repeat=repeat)
+        rows.append(
+            {
+                "operator": name,
+                "window": window,
+                "reference_s": reference_time,
+                "kernel_s": kernel_time,
+                "speedup": reference_time / kernel_time,
+                "max_abs_diff": max_abs_diff(reference_result, kernel_result),
+            }
+        )
+    return rows
+
+
+def run_benchmark(n_dates=1000, n_codes=50):
+    panel = make_random_panel(n_dates, n_codes)
+    rows = []
+    rows += benchmark_window_operator("tsrank", reference_tsrank, rolling_rank, panel)
+    rows += benchmark_window_operator(
+        "quantile(0.8)",
+        lambda frame, window: reference_quantile(frame, window, 0.8),
+        lambda array, window: rolling_quantile(array, window, 0.8),
+        panel,
+    )
+    return pd.DataFrame(rows)
+
+
+def run_weighted_mean_benchmark(n_dates=5000, n_codes=50):
+    # 约20年日线历史
+    panel = make_random_panel(n_dates, n_codes)
+    rows = []
+    for name, make_weights in WEIGHTED_MEAN_OPERATORS.items():
+        rows += benchmark_window_operator(
+            name,
+            lambda frame, window: reference_weighted_mean(frame, make_weights(window)),
+            lambda array, window: rolling_weighted_mean(array, make_weights(window)),
+            panel,
+        )
+    return pd.DataFrame(rows)
+
+
+def run_pair_benchmark(n_dates=1000, n_codes=1000, n_series=6, windows=(5, 10, 20), repeat=1):
+    # 多个序列对的correlation/covariance/std(如alpha_101中不同rank(x)/rank(y)的组合): 逐对调用多窗口内核 vs 序列对内核一次计算
+    # 序列对内核共享各序列的离差累加, 结果与逐对计算逐位一致
+    arrays = [cross_section_rank(make_random_panel(n_dates, n_codes, seed=seed)) for seed in range(n_series)]
+    pairs = [(i, j, list(windows)) for i in range(n_series) for j in range(i, n_series)]  # i == j为std
+    single_time, single_results = time_call(lambda: [rolling_comoments_windows(arrays[i], arrays[j], windows) for i, j, windows in pairs], repeat=repeat)
+    pair_time, pair_results = time_call(lambda: rolling_comoments_pairs(arrays, pairs), repeat=repeat)
+    return pd.DataFrame(
+        [
+            {
+                "series": n_series,
+                "pairs": len(pairs),
+                "windows": len(windows),
+                "single_s": single_time,
+                "pairs_s": pair_time,
+                "speedup": single_time / pair_time,
+                "identical": all(
+                    np.array_equal(left, right, equal_nan=True)
+                    for single, batch in zip(single_results, pair_results)
+                    for window in windows
+                    for left, right in zip(single[window], batch[window])
+                ),
+            }
+        ]
+    )
+
+
+def run_window_batch_benchmark(n_dates=5000, n_codes=50, windows=BENCHMARK_WINDOWS):
+    # 同一输入的多个窗口: 逐窗口pandas rolling / 逐窗口内核 / 多窗口内核一次遍历
+    panel, other = make_random_panel(n_dates, n_codes), make_random_panel(n_dates, n_codes, seed=2048)
+    frame, other_frame = pd.DataFrame(panel), pd.DataFrame(other)
+    references = {
+        "mean": lambda window: frame.rolling(window).mean(),
+        "std": lambda window: frame.rolling(window).std(),
+        "tsmax": lambda window: frame.rolling(window).max(),
+        "correlation": lambda window: frame.rolling(window).corr(other_frame),
+    }
+    rows = []
+    for name, reference in references.items():
+        kernel, finish = AlphaPanelOperations.WINDOW_BATCH_KERNELS[name]
+        arrays = (panel, other) if name == "correlation" else (panel,)
+        single = getattr(AlphaPanelOperations, name)
+        reference_time, reference_results = time_call(lambda: [reference(window) for window in windows], repeat=1)
+        single_time, single_results = time_call(lambda: [single(*arrays, window) for window in windows])
+        if name in AlphaExpressionGraph.PAIR_OPERATORS:
+            batch_time, batch_results = time_call(lambda: kernel(list(arrays), [(0, len(arrays) - 1, windows)])[0])
+        else:
+            batch_time, batch_results = time_call(lambda: kernel(*arrays, windows))
+        rows.append(
+            {
+                "operator": name,
+                "windows": len(windows),
+                "reference_s": reference_time,
+                "single_s": single_time,
+                "batch_s": batch_time,
+                "speedup_vs_single": single_time / batch_time,
+                "max_abs_diff": max(max_abs_diff(reference_results[i], finish(batch_results[window], window)) for i, window in enumerate(windows)),
+                "identical_to_single": all(np.array_equal(single_results[i], finish(batch_results[window], window), equal_nan=True) for i, window in enumerate(windows)),
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def run_numba_parity(n_dates=300, n_codes=8, windows=(1, 2, 5, 20), seeds=(0, 1, 2)):
+    # 随机输入上对比Numba内核与回退实现(一维与面板输入), 未安装numba时检查的是未编译的同一循环
+    rows = []
+    for name, (fallback, kind) in NUMBA_FALLBACKS.items():
+        worst = 0.0
+        for seed in seeds:
+            panel = make_random_input(kind, n_dates, n_codes, seed)
+            for window in windows:
+                if name == "rolling_linregress" and window < 2:
+                    continue
+                worst = max(worst, kernel_diff(fallback(panel, window), NUMBA_KERNELS[name](panel, window)))
+                worst = max(worst, kernel_diff(fallback(panel[:, 0], window), NUMBA_KERNELS[name](panel[:, 0], window)))
+        rows.append({"kernel": name, "compiled": NUMBA_AVAILABLE, "cases": len(seeds) * len(windows), "max_abs_diff": worst})
+    return pd.DataFrame(rows)
+
+
+def run_numba_benchmark(n_dates=5000, n_codes=50, windows=BENCHMARK_WINDOWS):
+    # 每个内核/窗口: 回退实现 vs Numba实现(首次调用的编译耗时不计入)
+    if not NUMBA_AVAILABLE:
+        return pd.DataFrame()
+    rows = []
+    for name, (fallback, kind) in NUMBA_FALLBACKS.items():
+        panel = make_random_input(kind, n_dates, n_codes, seed=1024)
+        NUMBA_KERNELS[name](panel[:10], 2)
+        for window in windows:
+            fallback_time, fallback_result = time_call(fallback, panel, window, repeat=1)
+            numba_time, numba_result = time_call(NUMBA_KERNELS[name], panel, window)
+            rows.append(
+                {
+                    "kernel": name,
+                    "window": window,
+                    "fallback_s": fallback_time,
+                    "numba_s": numba_time,
+                    "speedup": fallback_time / numba_time,
+                    "max_abs_diff": kernel_diff(fallback_result, numba_result),
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def measure_call(func):
+    # 单次运行的耗时与峰值内存分配(tracemalloc, 字节)
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak, result
+
+
+def run_factor_benchmark(alpha_dict_path=BENCHMARK_LIBRARY, n_dates=2500):
+    # 逐因子对比单只股票的两种执行后端: pandas Series算子(backend="series") / ndarray算子(backend="numpy")
+    # 每个因子单独建图执行, 耗时取两次运行的较小值, 内存为计算过程中的峰值分配
+    excutor = AlphaExpressionExcutor()
+    df = make_random_stock(n_dates)
+    rows = []
+    for alpha_name, alpha_plan in excutor.compile_library(alpha_dict_path).items():
+        graph = AlphaExpressionGraph({alpha_name: alpha_plan}, excutor.op_names)
+        row = {"factor": alpha_name}
+        results = {}
+        for backend in ("series", "numpy"):
+            seconds, peak, results[backend] = measure_call(lambda: excutor.execute_graph(graph, df, backend=backend))
+            row[f"{backend}_s"] = min(seconds, time_call(lambda: excutor.execute_graph(graph, df, backend=backend), repeat=1)[0])
+            row[f"{backend}_peak_kb"] = peak / 1024
+        row["speedup"] = row["series_s"] / row["numpy_s"]
+        row["max_abs_diff"] = max_abs_diff(results["series"][alpha_name], results["numpy"][alpha_name])
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def run_precision_check(alpha_dict_paths=BENCHMARK_LIBRARIES, n_dates=500, n_codes=200, report_path=None):
+    # 面板模式下float32与float64逐因子对比: 最大绝对误差, 最大相对误差(|x32 - x64| / max(|x64|, 1e-6)), NaN位置不一致的个数
+    # 误差大的因子主要有三类: 排名类(float32舍入改变并列关系, 偏差为若干名次), 比较类(阈值附近0/1翻转), 相近数值相减(相对误差放大)
+    # 结果保存在factor_ref/precision_float32.csv(500个交易日 x 200只股票的模拟行情)
+    panel = make_random_market(n_dates, n_codes)
+    excutor = AlphaExpressionExcutor()
+    rows = []
+    for alpha_dict_path in alpha_dict_paths:
+        graph = excutor.compile_graph(alpha_dict_path)
+        results = {}
+        for precision in ("float64", "float32"):
+            excutor.set_precision(precision)
+            start = time.perf_counter()
+            results[precision] = excutor.execute_panel(graph, {field: array.astype(excutor.dtype) if field != "industry" else array for field, array in panel.items()})
+            print(f"{alpha_dict_path} {precision}: {time.perf_counter() - start:.2f}s")
+        excutor.set_precision("float64")
+        for alpha_name in graph.names:
+            reference, value = results["float64"][alpha_name], results["float32"][alpha_name].astype(np.float64)
+            reference, value = np.where(np.isinf(reference), np.nan, reference), np.where(np.isinf(value), np.nan, value)
+            valid = ~np.isnan(reference) & ~np.isnan(value)
+            error = np.abs(value[valid] - reference[valid])
+            rows.append(
+                {
+                    "factor": alpha_name,
+                    "max_abs_diff": float(error.max()) if valid.any() else 0.0,
+                    "max_rel_diff": float((error / np.maximum(np.abs(reference[valid]), 1e-6)).max()) if valid.any() else 0.0,
+                    "nan_mismatch": int((np.isnan(reference) != np.isnan(value)).sum()),
+                }
+            )
+    rows = pd.DataFrame(rows)
+    if report_path is not None:
+        rows.to_csv(report_path, index=False, float_format="%.3g")
+    return rows
+
+
+def run_chunk_benchmark(alpha_dict_path=BENCHMARK_LIBRARY, n_dates=2000, n_codes=100, chunk_sizes=(250, 500, 1000)):
+    # 分块计算 vs 整段计算: 耗时, 峰值内存分配(tracemalloc), 与整段计算结果的最大绝对误差(长窗口的分段前缀和只差舍入误差)
+    panel = make_random_market(n_dates, n_codes)
+    excutor = AlphaExpressionExcutor()
+    graph = excutor.compile_graph(alpha_dict_path)
+    full_time, full_peak, full_results = measure_call(lambda: excutor.execute_panel(graph, panel))
+    rows = [{"chunk_size": n_dates, "seconds": full_time, "peak_mb": full_peak / 1024**2, "max_abs_diff": 0.0}]
+    for chunk_size in chunk_sizes:
+        seconds, peak, chunks = measure_call(lambda: [(start, {alpha_name: result.copy() for alpha_name, result in results.items()}) for start, _, results in excutor.execute_panel_chunks(graph, panel, chunk_size)])
+        max_abs_diff = max((float(np.nanmax(np.abs(np.concatenate([results[alpha_name] for _, results in chunks]) - full_results[alpha_name]), initial=0)) for alpha_name in graph.names), default=0.0)
+        rows.append({"chunk_size": chunk_size, "seconds": seconds, "peak_mb": peak / 1024**2, "max_abs_diff": max_abs_diff})
+    return pd.DataFrame(rows)
+
+
+FUSION_EXPRESSIONS = {
+    "clv": "(2*close-high-low)/(high-low+1e-12)",
+    "kmid": "(close-open)/open",
+    "ksft": "(2*close-high-low)/open",
+    "alpha_191_chain": "((high+low)/2-(shift(high,1)+shift(low,1))/2)*(high-low)/volume",
+}
+
+
+def run_fusion_benchmark(n_dates=2500, n_codes=1000, repeat=3):
+    # 长逐元素表达式: 逐节点计算(每个二元运算一个临时数组) vs 融合为一个numexpr表达式, 面板模式
+    excutor = AlphaExpressionExcutor()
+    if excutor.fused_evaluate is None:
+        return pd.DataFrame()
+    panel = make_random_market(n_dates, n_codes)
+    fused_evaluate = excutor.fused_evaluate
+    rows = []
+    for name, expression in FUSION_EXPRESSIONS.items():
+        graph = AlphaExpressionGraph({name: excutor.compile(expression)}, excutor.op_names)
+        excutor.fused_evaluate = None
+        plain_time, plain_results = time_call(lambda: excutor.execute_panel(graph, panel), repeat=repeat)
+        plain_peak = measure_call(lambda: excutor.execute_panel(graph, panel))[1]
+        excutor.fused_evaluate = fused_evaluate
+        fused_time, fused_results = time_call(lambda: excutor.execute_panel(graph, panel), repeat=repeat)
+        fused_peak = measure_call(lambda: excutor.execute_panel(graph, panel))[1]
+        rows.append(
+            {
+                "expression": name,
+                "fused_groups": len(graph.fused_groups()),
+                "plain_s": plain_time,
+                "fused_s": fused_time,
+                "speedup": plain_time / fused_time,
+                "plain_peak_mb": plain_peak / 1024**2,
+                "fused_peak_mb": fused_peak / 1024**2,
+                "identical": np.array_equal(plain_results[name], fused_results[name], equal_nan=True),
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def run_thread_benchmark(alpha_dict_path=BENCHMARK_LIBRARY, n_stocks=64, n_dates=2500, n_codes=4000, thread_counts=(1, 2, 4, 8, 16, 32)):
+    # 同一个执行器/同一张DAG在线程池中并发计算的吞吐量 vs 线程数, 结果须与单线程逐位一致
+    # stock: 逐只股票执行(execute_graph_many, ndarray算子), 每次计算量小, Python调度开销(持有GIL)占比高
+    # panel: 全市场面板按股票切为n_threads块, 每块一个线程(截面算子只在块内计算, 一致性与同样分块的单线程结果比较)
+    excutor = AlphaExpressionExcutor()
+    graph = excutor.compile_graph(alpha_dict_path)
+    dfs = [make_random_stock(n_dates, seed=seed) for seed in range(n_stocks)]
+    panel = make_random_market(n_dates // 5, n_codes)
+    serial = excutor.execute_graph_many(graph, dfs, backend="numpy", max_workers=1)
+    rows = []
+    for n_threads in thread_counts:
+        seconds, results = time_call(lambda: excutor.execute_graph_many(graph, dfs, backend="numpy", max_workers=n_threads), repeat=1)
+        identical = all(left.equals(right) for left, right in zip(serial, results))
+        rows.append({"mode": "stock", "threads": n_threads, "seconds": seconds, "factors_per_sec": n_stocks * len(graph.names) / seconds, "identical": identical})
+    for n_threads in thread_counts:
+        blocks = [{field: array[:, codes] if np.ndim(array) == 2 else array[codes] for field, array in panel.items()} for codes in np.array_split(np.arange(n_codes), n_threads)]
+        serial_blocks = [excutor.execute_panel(graph, block) for block in blocks]
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            seconds, results = time_call(lambda: list(pool.map(lambda block: excutor.execute_panel(graph, block), blocks)), repeat=1)
+        identical = all(np.array_equal(left[alpha_name], right[alpha_name], equal_nan=True) for left, right in zip(serial_blocks, results) for alpha_name in graph.names)
+        rows.append({"mode": "panel", "threads": n_threads, "seconds": seconds, "factors_per_sec": len(graph.names) / seconds, "identical": identical})
+    rows = pd.DataFrame(rows)
+    rows["speedup"] = rows.groupby("mode")["seconds"].transform("first") / rows["seconds"]
+    return rows
+
+
+def run_scheduler_benchmark(alpha_dict_paths=BENCHMARK_LIBRARIES, n_dates=1000, n_codes=1000, worker_counts=(1, 4, 16)):
+    # 面板模式并行DAG调度 vs 逐节点顺序计算: 墙钟时间, 关键路径, 峰值内存(同时存活的节点结果), 结果是否逐位一致
+    panel = make_random_market(n_dates, n_codes)
+    excutor = AlphaExpressionExcutor()
+    rows = []
+    for alpha_dict_path in alpha_dict_paths:
+        graph = excutor.compile_graph(alpha_dict_path)
+        excutor.disable_scheduler()
+        serial_time, serial_results = time_call(lambda: excutor.execute_panel(graph, panel), repeat=1)
+        for n_workers in worker_counts:
+            scheduler = excutor.enable_scheduler(n_workers)
+            seconds, results = time_call(lambda: excutor.execute_panel(graph, panel), repeat=1)
+            stats = scheduler.last_stats
+            rows.append(
+                {
+                    "library": alpha_dict_path,
+                    "workers": n_workers,
+                    "serial_s": serial_time,
+                    "scheduled_s": seconds,
+                    "critical_path_s": stats["critical_path_seconds"],
+                    "parallelism": stats["parallelism"],
+                    "peak_mb": stats["peak_bytes"] / 1024**2,
+                    "unfreed_mb": stats["total_bytes"] / 1024**2,
+                    "identical": all(np.array_equal(serial_results[alpha_name], results[alpha_name], equal_nan=True) for alpha_name in graph.names),
+                }
+            )
+        excutor.disable_scheduler()
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    print(run_benchmark().to_string(index=False))
+    print(run_weighted_mean_benchmark().to_string(index=False))
+    print(run_window_batch_benchmark().to_string(index=False))
+    print(run_pair_benchmark().to_string(index=False))
+    print(run_numba_parity().to_string(index=False))
+    if NUMBA_AVAILABLE:
+        print(run_numba_benchmark().to_string(index=False))
+    else:
+        print("numba未安装, 跳过Numba内核基准")
+    precision_rows = run_precision_check(report_path=PRECISION_REPORT)
+    print(precision_rows.describe().to_string())
+    print(run_chunk_benchmark().to_string(index=False))
+    print(run_fusion_benchmark().to_string(index=False))
+    print(run_thread_benchmark().to_string(index=False))
+    print(run_scheduler_benchmark().to_string(index=False))
+    factor_rows = run_factor_benchmark()
+    print(factor_rows.to_string(index=False))
+    print(factor_rows[["series_s", "numpy_s", "series_peak_kb", "numpy_peak_kb"]].sum().to_string())
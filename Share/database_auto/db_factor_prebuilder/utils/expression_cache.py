@@ -0,0 +1,149 @@
+import os
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+
+from .expression_graph import _NodeError
+
+
+class AlphaExpressionCache:
+    # 表达式中间结果的磁盘缓存(内容寻址): key = hash(缓存版本, 执行后端(含精度与内核后端), 规范化子表达式, 子表达式用到的字段内容)
+    # 字段内容即行情数据的版本(不同股票/日期范围的数据内容不同), 数据更新后对应的缓存自然不再命中
+    # 每个结果保存为一个.npy文件, 读取时更新修改时间, 总大小超过上限时按最近最少使用淘汰
+    # 索引(_entries/_total_bytes/命中统计)的读写加锁, 文件读取在锁外进行, 可在多个线程中共用一个缓存
+    CACHE_VERSION = 2  # 算子实现的数值结果变化时递增, 使旧缓存全部失效(2: 长窗口分段前缀和/std/回归内核)
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024**3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._entries = {}  # key -> (最近使用时间, 文件大小)
+        for file_name in os.listdir(cache_dir):
+            if file_name.endswith(".npy"):
+                stat = os.stat(os.path.join(cache_dir, file_name))
+                self._entries[file_name[:-4]] = (stat.st_mtime, stat.st_size)
+        self._total_bytes = sum(size for _, size in self._entries.values())
+        self.hits, self.misses = 0, 0
+        self._lock = threading.RLock()
+
+    # ------------------------------------------
+    @staticmethod
+    def _digest(*parts):
+        digest = hashlib.sha1()
+        for part in parts:
+            digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+            digest.update(b"|")
+        return digest.hexdigest()
+
+    @staticmethod
+    def _values(value):
+        return value.to_numpy() if isinstance(value, pd.Series) else np.asarray(value)
+
+    def data_versions(self, data):
+        # 每个字段的数据版本: 字段内容(含dtype和形状)的hash
+        versions = {}
+        for field, value in data.items():
+            values = np.ascontiguousarray(self._values(value))
+            versions[field] = self._digest(values.dtype.str, values.shape, values.tobytes() if values.dtype != object else values.astype(str).tobytes())
+        return versions
+
+    def node_keys(self, graph, data, backend):
+        # 可缓存节点(算子调用及因子输出)的key, 只依赖子表达式本身和它用到的字段, 其余字段变化不影响命中
+        versions = self.data_versions({node.name: data[node.name] for node in graph.nodes if node.kind == "field" and node.name in data})
+        output_nodes = set(graph.outputs.values())
+        keys = {}
+        for node_id, node in enumerate(graph.nodes):
+            if node.kind == "call" or (node_id in output_nodes and node.kind not in ("const", "field")):
+                fields = sorted(graph.nodes[dependency].name for dependency in graph.dependencies(node_id) if graph.nodes[dependency].kind == "field")
+                keys[node_id] = self._digest(self.CACHE_VERSION, backend, graph.labels[node_id], *(f"{field}:{versions.get(field)}" for field in fields))
+        return keys
+
+    # ------------------------------------------
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def load(self, key):
+        # 只在查询/更新索引时加锁, 多个线程可同时读取不同的缓存文件; 读取期间被其他线程淘汰的文件视为未命中
+        with self._lock:
+            if key not in self._entries:
+                return None
+        try:
+            value = np.load(self._path(key), allow_pickle=False)
+            os.utime(self._path(key))
+            used_time = os.stat(self._path(key)).st_mtime
+        except (OSError, ValueError):
+            with self._lock:
+                if key in self._entries:
+                    self._discard(key)
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries[key] = (used_time, self._entries[key][1])
+        return value
+
+    def store(self, key, value):
+        values = self._values(value)
+        if values.dtype == object or key in self._entries:
+            return
+        temp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, values, allow_pickle=False)
+        with self._lock:
+            if key in self._entries:  # 其他线程已写入同一结果
+                os.remove(temp_path)
+                return
+            os.replace(temp_path, self._path(key))  # 先写临时文件再改名, 中断时不会留下不完整的缓存
+            stat = os.stat(self._path(key))
+            self._entries[key] = (stat.st_mtime, stat.st_size)
+            self._total_bytes += stat.st_size
+            self._evict()
+
+    def _discard(self, key):
+        _, size = self._entries.pop(key)
+        self._total_bytes -= size
+        if os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+    def _evict(self):
+        # 按最近使用时间从旧到新淘汰, 直到总大小不超过上限
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key, _ in sorted(self._entries.items(), key=lambda item: item[1][0]):
+            self._discard(key)
+            if self._total_bytes <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._discard(key)
+
+    # ------------------------------------------
+    def evaluate(self, graph, data, ops, backend, shape, wrap, **kwargs):
+        # 先读取已缓存的因子输出/子表达式, 只计算缺失因子所需且未缓存的节点, 新算出的节点写入缓存
+        # 只缓存形状为shape(与行情数据对齐)的结果, wrap把读出的ndarray还原为执行后端的数据类型(如带索引的Series)
+        keys = self.node_keys(graph, data, backend)
+        preloaded, required = {}, set()
+        stack = list(dict.fromkeys(graph.outputs.values()))
+        while stack:
+            node_id = stack.pop()
+            if node_id in required or node_id in preloaded:
+                continue
+            value = self.load(keys[node_id]) if node_id in keys else None
+            if value is not None:
+                with self._lock:
+                    self.hits += 1
+                preloaded[node_id] = wrap(value)
+                continue
+            if node_id in keys:
+                with self._lock:
+                    self.misses += 1
+            required.add(node_id)
+            stack.extend(graph.nodes[node_id].args)
+        values = graph.evaluate_nodes(data, ops, preloaded=preloaded, required=required, **kwargs)
+        for node_id in required:
+            value = values[node_id]
+            if node_id in keys and not isinstance(value, (_NodeError, dict)) and np.shape(value) == shape:
+                self.store(keys[node_id], value)
+        return graph.collect(values)
@@ -0,0 +1,101 @@
+import datetime
+import numpy as np
+
+from .expression_graph import AlphaExpressionGraph
+from .expression_excutor import AlphaExpressionExcutor
+from .expression_manifest import MANIFEST_SECTIONS, manifest_path, save_manifest
+
+# 因子库的dry-run校验与耗时估算(在Share/database_auto目录下运行):
+#   python -m db_factor_prebuilder.utils.expression_dryrun
+# 在小规模模拟行情面板上逐个计算因子库中的每个因子, 记录是否成功、有效区间的NaN比例、每个(日期, 股票)格子的耗时,
+# 按格子数线性外推到真实股票池的计算耗时, 并生成清单(manifest): skip为已知失败/没有信息量的因子, quarantine为过慢或NaN过多的因子,
+# PrebuilderFactor按清单跳过skip中的因子(见database_config.FACTOR_MANIFEST_DIR), 不在已知失败的因子上花费时间;
+# quarantine中的因子默认照常计算, 设置FACTOR_EXCLUDE_QUARANTINE时才跳过
+# 清单的读写与按清单跳过因子见expression_manifest, 清单文件纳入版本管理, 只保存 因子 -> 原因/表达式(耗时等与机器有关的统计只在运行时打印)
+# 小面板上固定开销(Python调度)占比更高, 外推值偏保守(偏大)
+
+UNIVERSE_DATES = 250  # 外推的交易日数(一年)
+UNIVERSE_CODES = 5000  # 外推的股票数(全A股)
+MAX_NAN_RATIO = 0.5  # 有效区间内NaN比例超过该值的因子隔离
+MAX_SECONDS_PER_CELL = 2e-6  # 每个格子耗时超过该值(约为全市场一年10分钟)的因子隔离
+
+
+def factor_status(row, max_nan_ratio=MAX_NAN_RATIO, max_seconds_per_cell=MAX_SECONDS_PER_CELL):
+    # 因子的处理方式: ("skip"/"quarantine"/None, 原因)
+    if row["error"] is not None:
+        return "skip", f"failed: {row['error']}"
+    if row["constant"] is not None:
+        return "skip", f"constant: {row['constant']}"
+    if row["nan_ratio"] >= 1:
+        return "skip", "all nan"
+    if row["nan_ratio"] > max_nan_ratio:
+        return "quarantine", f"nan ratio {row['nan_ratio']:.2f}"
+    if row["seconds_per_cell"] > max_seconds_per_cell:
+        return "quarantine", "slow"
+    return None, None
+
+
+def dry_run_library(alpha_dict_path, n_dates=500, n_codes=100, seed=2024, universe_dates=UNIVERSE_DATES, universe_codes=UNIVERSE_CODES, excutor=None, repeat=2):
+    # 逐因子计算(每个因子一张单独的图, 耗时不受公共子表达式的计算顺序影响), 再整库计算一次得到共享DAG的实际耗时
+    # 耗时取repeat次的最短值, 排除首次调用的初始化开销
+    # 基准与校验工具只在dry-run时导入, 入库流程只依赖expression_manifest
+    from .expression_benchmark import time_call
+    from .expression_verify import make_verify_market
+
+    excutor = excutor or AlphaExpressionExcutor()
+    # 停牌只保留整段缺失(不加逐格随机缺失): 随机缺失会使长窗口因子几乎全为NaN, 与真实行情不符
+    panel = make_verify_market(n_dates, n_codes, seed=seed, suspended_ratio=0)
+    listed = ~np.isnan(panel["close"])  # 与入库时一致, 只统计有行情的格子
+    cells, universe_cells = n_dates * n_codes, universe_dates * universe_codes
+    rows = []
+    for alpha_name, alpha_plan in excutor.compile_library(alpha_dict_path).items():
+        row = {"factor": alpha_name, "expression": alpha_plan.source, "constant": alpha_plan.constant, "error": None, "lookback": None, "nan_ratio": None, "seconds": 0.0}
+        graph = AlphaExpressionGraph({alpha_name: alpha_plan}, excutor.op_names)
+        if alpha_name in graph.errors:
+            row["error"] = repr(graph.errors[alpha_name])
+        else:
+            row["seconds"], (results, errors) = time_call(excutor.evaluate_panel, graph, panel, repeat=repeat)
+            row["lookback"] = graph.lookback(excutor.panel_op_funcs, excutor.FIELD_LOOKBACK).get(alpha_name)
+            if alpha_name in errors:
+                row["error"] = repr(errors[alpha_name])
+            else:
+                # 回看期之后的有效区间内非有限值(NaN/±inf, 入库时inf替换为NaN)的比例
+                result = np.broadcast_to(np.asarray(results[alpha_name], dtype=np.float64), listed.shape)[row["lookback"] or 0 :]
+                valid = listed[row["lookback"] or 0 :]
+                row["nan_ratio"] = float(np.mean(~np.isfinite(result[valid]))) if valid.any() else 1.0
+        row["seconds_per_cell"] = row["seconds"] / cells
+        row["estimated_seconds"] = row["seconds_per_cell"] * universe_cells
+        row["status"], row["reason"] = factor_status(row)
+        rows.append(row)
+    # 整个因子库(不含清单中的因子)按共享DAG计算的耗时, 即PrebuilderFactor的实际计算量
+    excluded = [row["factor"] for row in rows if row["status"] is not None]
+    graph = excutor.compile_graph(alpha_dict_path, skip_constant=True, exclude=excluded)
+    library_seconds, _ = time_call(excutor.evaluate_panel, graph, panel, repeat=repeat)
+    return {
+        "library": alpha_dict_path,
+        "created": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "panel": [n_dates, n_codes],
+        "universe": [universe_dates, universe_codes],
+        "factors": len(rows),
+        "estimated_seconds": library_seconds / cells * universe_cells,  # 共享DAG, 清单中的因子不计算
+        "estimated_seconds_unshared": sum(row["estimated_seconds"] for row in rows),  # 逐因子单独计算之和
+        "skip": {row["factor"]: {"expression": row["expression"], "reason": row["reason"]} for row in rows if row["status"] == "skip"},
+        "quarantine": {row["factor"]: {"expression": row["expression"], "reason": row["reason"]} for row in rows if row["status"] == "quarantine"},
+        "factor_stats": rows,
+    }
+
+
+if __name__ == "__main__":
+    from .expression_benchmark import BENCHMARK_LIBRARIES
+
+    for alpha_dict_path in BENCHMARK_LIBRARIES:
+        library_manifest = dry_run_library(alpha_dict_path)
+        save_manifest(library_manifest, manifest_path(alpha_dict_path))
+        print(
+            f"{alpha_dict_path}: {library_manifest['factors']}个因子, 跳过{len(library_manifest['skip'])}个, 隔离{len(library_manifest['quarantine'])}个,"
+            f" 预计耗时{library_manifest['estimated_seconds']:.0f}s(全市场{UNIVERSE_DATES}个交易日 x {UNIVERSE_CODES}只股票)"
+        )
+        factor_stats = {row["factor"]: row for row in library_manifest["factor_stats"]}
+        for section in MANIFEST_SECTIONS:
+            for alpha_name, entry in library_manifest[section].items():
+                print(f"  {section} {alpha_name}: {entry['reason']} (每个格子{factor_stats[alpha_name]['seconds_per_cell'] * 1e6:.2f}us)")
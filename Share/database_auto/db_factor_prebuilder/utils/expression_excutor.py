@@ -2,16 +2,48 @@ import warnings
 
 warnings.filterwarnings("ignore")
 
+import os
+import ast
+import json
 import pandas as pd
 import numpy as np
 import re
-from scipy.stats import linregress
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from .expression_graph import AlphaExpressionGraph
+from .expression_stream import AlphaExpressionStream
+from .expression_profiler import AlphaExpressionProfiler
+from .expression_cache import AlphaExpressionCache
+from .expression_kernels import rolling_sum, rolling_mean, rolling_std, rolling_cov, rolling_corr, rolling_max, rolling_min
+from .expression_kernels import rolling_sum_windows, rolling_comoments_pairs, rolling_max_windows, rolling_min_windows, rolling_rank_windows
+from .expression_kernels import comoments_std, comoments_cov, comoments_corr
+from .expression_kernels import rolling_argmax, rolling_argmin, rolling_rank, rolling_quantile, rolling_linregress, rolling_weighted_mean, rolling_product
+from .expression_kernels import cross_section_rank, cross_section_scale, cross_section_demean, cross_section_group_demean, float_values
+from .expression_numba import NUMBA_AVAILABLE, NUMBA_KERNELS
+from .expression_fusion import NUMEXPR_AVAILABLE, evaluate_fused
+from .expression_simplifier import AlphaExpressionSimplifier
+from .expression_scheduler import AlphaGraphScheduler
+
+
+KERNEL_BACKENDS = ("numba", "numpy")
+DEFAULT_KERNEL_BACKEND = "numba" if NUMBA_AVAILABLE else "numpy"
 
 
 class AlphaBaseOperations:
+    # 不便向量化的时间序列算子(argmax/argmin、tsrank、count、回归、累乘)的内核实现, 逐只股票与面板模式共用:
+    # "numba"为编译的循环实现(安装了numba时默认), "numpy"为向量化/pandas实现; 后端属于算子对象, 见AlphaExpressionExcutor.set_kernel_backend
+    def __init__(self, kernel_backend=DEFAULT_KERNEL_BACKEND):
+        self.kernel_backend = kernel_backend
+
+    def _kernel(self, name, fallback):
+        return NUMBA_KERNELS[name] if self.kernel_backend == "numba" else fallback
+
     # ------------------------------------------
     @staticmethod
     def rank(series):
+        # 逐只股票模式(execute_graph)下为单只股票整段时间序列内的百分位排序, 不是截面排序;
+        # 入库的因子值由面板模式计算(execute_panel, 见AlphaPanelOperations.rank), 为同一交易日全部股票之间的截面排序, 两者数值不同
         return series.rank(pct=True)
 
     @staticmethod
@@ -65,33 +97,26 @@ class AlphaBaseOperations:
     def tsmin(series, window):
         return series.rolling(window=window).min()
 
-    @staticmethod
-    def tsargmax(series, window):
-        return series.rolling(window=window).apply(lambda x: np.argmax(x), raw=True)
+    def tsargmax(self, series, window):
+        return pd.Series(self._kernel("rolling_argmax", rolling_argmax)(series, window), index=series.index)
 
-    @staticmethod
-    def tsargmin(series, window):
-        return series.rolling(window=window).apply(lambda x: np.argmin(x), raw=True)
+    def tsargmin(self, series, window):
+        return pd.Series(self._kernel("rolling_argmin", rolling_argmin)(series, window), index=series.index)
 
-    @staticmethod
-    def tsrank(series, window):
-        return series.rolling(window=window).apply(lambda x: x.rank(pct=True).iloc[-1], raw=False)
+    def tsrank(self, series, window):
+        return pd.Series(self._kernel("rolling_rank", rolling_rank)(series, window), index=series.index)
 
-    @staticmethod
-    def idxmax(series, window):
-        return series.rolling(window=window).apply(lambda x: (window - 1) - np.argmax(x), raw=True)
+    def idxmax(self, series, window):
+        return (window - 1) - self.tsargmax(series, window)
 
-    @staticmethod
-    def highday(series, window):
-        return series.rolling(window=window).apply(lambda x: (window - 1) - np.argmax(x), raw=True)
+    def highday(self, series, window):
+        return (window - 1) - self.tsargmax(series, window)
 
-    @staticmethod
-    def idxmin(series, window):
-        return series.rolling(window=window).apply(lambda x: (window - 1) - np.argmin(x), raw=True)
+    def idxmin(self, series, window):
+        return (window - 1) - self.tsargmin(series, window)
 
-    @staticmethod
-    def lowday(series, window):
-        return series.rolling(window=window).apply(lambda x: (window - 1) - np.argmax(x), raw=True)
+    def lowday(self, series, window):
+        return (window - 1) - self.tsargmax(series, window)  # 与原实现保持一致(基于最大值位置)
 
     # ------------------------------------------
     @staticmethod
@@ -115,33 +140,19 @@ class AlphaBaseOperations:
     def clip(series, min_value, max_value):
         return np.clip(series, min_value, max_value)
 
-    @staticmethod
-    def slope(series, window):
-        def linear_regression_slope(y_values):
-            x_values = np.arange(len(y_values))
-            slope, intercept, r_value, p_value, std_err = linregress(x_values, y_values)
-            return slope
+    def linregress(self, series, window):
+        # 滚动回归的全部统计量, slope/rsquare/resi/regbeta共享同一次计算
+        linregress = self._kernel("rolling_linregress", rolling_linregress)
+        return {name: pd.Series(values, index=series.index) for name, values in linregress(series, window).items()}
 
-        return series.rolling(window=window).apply(linear_regression_slope, raw=True)
+    def slope(self, series, window):
+        return self.linregress(series, window)["slope"]
 
-    @staticmethod
-    def rsquare(series, window):
-        def calculate_rsquare(y_values):
-            x_values = np.arange(len(y_values))
-            slope, intercept, r_value, p_value, std_err = linregress(x_values, y_values)
-            return r_value**2
-
-        return series.rolling(window=window).apply(calculate_rsquare, raw=True)
-
-    @staticmethod
-    def resi(series, window):
-        def calculate_residuals(y_values):
-            x_values = np.arange(len(y_values))
-            slope, intercept, r_value, p_value, std_err = linregress(x_values, y_values)
-            line = slope * x_values + intercept
-            return y_values - line
+    def rsquare(self, series, window):
+        return self.linregress(series, window)["rsquare"]
 
-        return series.rolling(window=window).apply(lambda y: calculate_residuals(y)[-1], raw=True)
+    def resi(self, series, window):
+        return self.linregress(series, window)["resi"]
 
     @staticmethod
     def signedpower(series, power):
@@ -150,53 +161,395 @@ class AlphaBaseOperations:
     @staticmethod
     def decaylinear(series, window):
         weights = np.arange(1, window + 1)
-        return series.rolling(window=window).apply(lambda x: np.dot(x, weights) / np.sum(weights), raw=True)
+        return pd.Series(rolling_weighted_mean(series, weights), index=series.index)
 
     @staticmethod
     def sma(series, window, weight=1):
         weights = np.full(window, weight)
-        return series.rolling(window=window).apply(lambda x: np.dot(x, weights) / np.sum(weights), raw=True)
+        return pd.Series(rolling_weighted_mean(series, weights), index=series.index)
 
     @staticmethod
     def wma(series, window):
         weights = np.power(0.9, np.arange(window)[::-1])
-        return series.rolling(window=window).apply(lambda x: np.dot(x, weights) / np.sum(weights), raw=True)
+        return pd.Series(rolling_weighted_mean(series, weights), index=series.index)
 
-    @staticmethod
-    def count(condition_series, window):
+    def count(self, condition_series, window):
         # 对符合条件的项进行计数
-        return condition_series.rolling(window=window).sum()
+        rolling_count = self._kernel("rolling_count", lambda series, window: series.rolling(window=window).sum().to_numpy())
+        return pd.Series(rolling_count(condition_series, window), index=condition_series.index)
 
     # (以下是不太确定的算子函数)------------------------------------------
     @staticmethod
     def scale(series, factor=1):
+        # 逐只股票模式下除以整段时间序列之和(不取绝对值); 入库的因子值为截面缩放(见AlphaPanelOperations.scale), 两者数值不同
         sum_inv = factor / series.sum()
         return series * sum_inv
 
-    @staticmethod
-    def product(series, window):
-        return series.rolling(window=window).apply(np.prod, raw=True)
+    def product(self, series, window):
+        rolling_product = self._kernel("rolling_product", lambda series, window: series.rolling(window=window).apply(np.prod, raw=True).to_numpy())
+        return pd.Series(rolling_product(series, window), index=series.index)
 
     @staticmethod
     def sequence(n):
         return np.arange(1, n + 1)
 
+    def regbeta(self, series, window):
+        # 对时间序列1..window回归的beta, 即斜率
+        return self.linregress(series, window)["slope"]
+
+
+class AlphaPanelOperations:
+    # 面板算子: 每个字段为(n_dates, n_codes)的二维数组, 时间序列算子沿axis=0对全部股票同时计算
+
+    # 多窗口批量计算: 算子名称 -> (多窗口内核, 由内核结果得到算子结果的函数)
+    # 内核相同且输入相同、只有窗口不同的节点(如mean(close,5)/mean(close,10)/sum(close,20))在DAG执行时一次遍历全部算出
+    WINDOW_BATCH_KERNELS = {
+        "sum": (rolling_sum_windows, lambda total, window: total),
+        "count": (rolling_sum_windows, lambda total, window: total),
+        "mean": (rolling_sum_windows, lambda total, window: total / window),
+        # std/covariance/correlation(PAIR_OPERATORS)为序列对内核: 不同输入的节点也可共用一次调用, 共享各序列的离差累加
+        "std": (rolling_comoments_pairs, comoments_std),
+        "covariance": (rolling_comoments_pairs, comoments_cov),
+        "correlation": (rolling_comoments_pairs, comoments_corr),
+        "tsmax": (rolling_max_windows, lambda result, window: result),
+        "tsmin": (rolling_min_windows, lambda result, window: result),
+        "tsrank": (rolling_rank_windows, lambda result, window: result),
+    }
+
+    def __init__(self, kernel_backend=DEFAULT_KERNEL_BACKEND):
+        self.kernel_backend = kernel_backend
+        # 本对象内核后端的多窗口批量内核表: tsrank的长窗口使用与tsrank算子相同的内核(Numba后端为树状数组内核)
+        self.window_batch_kernels = {**self.WINDOW_BATCH_KERNELS, "tsrank": (self._rank_windows, self.WINDOW_BATCH_KERNELS["tsrank"][1])}
+
+    def _kernel(self, name, fallback):
+        return NUMBA_KERNELS[name] if self.kernel_backend == "numba" else fallback
+
+    def _rank_windows(self, array, windows):
+        return rolling_rank_windows(array, windows, long_rank=self._kernel("rolling_rank", rolling_rank))
+
+    # 截面算子(面板模式下在同一交易日的全部股票之间计算)------------------------------------------
+    # 与AlphaBaseOperations中的同名算子语义不同: rank/scale在逐只股票模式(execute_graph)下作用于单只股票的整段时间序列,
+    # 在面板模式(execute_panel, 即入库的因子值)下作用于截面; 含rank/scale的因子在两种模式下的值不同,
+    # 需要与库表一致的因子值时应先build_panel再execute_panel, 不能逐只股票计算
+    @staticmethod
+    def rank(array):
+        return cross_section_rank(array)
+
+    @staticmethod
+    def scale(array, factor=1):
+        return cross_section_scale(array, factor)
+
+    @staticmethod
+    def demean(array):
+        return cross_section_demean(array)
+
+    @staticmethod
+    def industry_neutralize(array, industry):
+        # industry为每只股票的行业分组编号(见AlphaExpressionExcutor.build_panel_groups)
+        return cross_section_group_demean(array, industry)
+
+    @staticmethod
+    def indneutralize(array, industry):
+        return cross_section_group_demean(array, industry)
+
+    # ------------------------------------------
+    @staticmethod
+    def log(array):
+        return np.log(array)
+
+    @staticmethod
+    def sign(array):
+        return np.sign(array)
+
+    @staticmethod
+    def abs(array):
+        return np.abs(array)
+
+    # ------------------------------------------
+    @staticmethod
+    def min(array1, array2):
+        return np.minimum(array1, array2)
+
+    @staticmethod
+    def max(array1, array2):
+        return np.maximum(array1, array2)
+
+    # ------------------------------------------
+    @staticmethod
+    def shift(array, periods):
+        array = float_values(array)
+        result = np.full_like(array, np.nan)
+        if periods >= 0:
+            result[periods:] = array[: max(len(array) - periods, 0)]
+        else:
+            result[:periods] = array[-periods:]
+        return result
+
+    @staticmethod
+    def diff(array, periods):
+        return float_values(array) - AlphaPanelOperations.shift(array, periods)
+
+    # ------------------------------------------
+    @staticmethod
+    def std(array, window):
+        return rolling_std(array, window)
+
+    @staticmethod
+    def mean(array, window):
+        return rolling_mean(array, window)
+
+    @staticmethod
+    def sum(array, window):
+        return rolling_sum(array, window)
+
+    @staticmethod
+    def tsmax(array, window):
+        return rolling_max(array, window)
+
+    @staticmethod
+    def tsmin(array, window):
+        return rolling_min(array, window)
+
+    def tsargmax(self, array, window):
+        return self._kernel("rolling_argmax", rolling_argmax)(array, window)
+
+    def tsargmin(self, array, window):
+        return self._kernel("rolling_argmin", rolling_argmin)(array, window)
+
+    def tsrank(self, array, window):
+        return self._kernel("rolling_rank", rolling_rank)(array, window)
+
+    def idxmax(self, array, window):
+        return (window - 1) - self.tsargmax(array, window)
+
+    def highday(self, array, window):
+        return (window - 1) - self.tsargmax(array, window)
+
+    def idxmin(self, array, window):
+        return (window - 1) - self.tsargmin(array, window)
+
+    def lowday(self, array, window):
+        return (window - 1) - self.tsargmax(array, window)  # 与原实现保持一致(基于最大值位置)
+
+    # ------------------------------------------
+    @staticmethod
+    def correlation(array1, array2, window):
+        return rolling_corr(array1, array2, window)
+
+    @staticmethod
+    def covariance(array1, array2, window):
+        return rolling_cov(array1, array2, window)
+
+    # ------------------------------------------
+    @staticmethod
+    def where(condition, true_array, false_array):
+        return np.where(condition, true_array, false_array)
+
+    @staticmethod
+    def quantile(array, window, quantile):
+        return rolling_quantile(array, window, quantile)
+
+    @staticmethod
+    def clip(array, min_value, max_value):
+        return np.clip(array, min_value, max_value)
+
+    def linregress(self, array, window):
+        # 滚动回归的全部统计量, slope/rsquare/resi/regbeta共享同一次计算
+        return self._kernel("rolling_linregress", rolling_linregress)(array, window)
+
+    def slope(self, array, window):
+        return self.linregress(array, window)["slope"]
+
+    def rsquare(self, array, window):
+        return self.linregress(array, window)["rsquare"]
+
+    def resi(self, array, window):
+        return self.linregress(array, window)["resi"]
+
+    @staticmethod
+    def signedpower(array, power):
+        return np.sign(array) * np.abs(array) ** power
+
+    @staticmethod
+    def decaylinear(array, window):
+        weights = np.arange(1, window + 1)
+        return rolling_weighted_mean(array, weights)
+
     @staticmethod
-    def regbeta(series, window):
-        # 定义计算beta的函数，使用线性回归
-        def calculate_beta(x):
-            y = x
-            x = np.arange(1, len(x) + 1)  # 生成时间序列
-            slope, intercept, r_value, p_value, std_err = linregress(x, y)
-            return slope
+    def sma(array, window, weight=1):
+        weights = np.full(window, weight)
+        return rolling_weighted_mean(array, weights)
 
-        return series.rolling(window=window).apply(calculate_beta, raw=True)
+    @staticmethod
+    def wma(array, window):
+        weights = np.power(0.9, np.arange(window)[::-1])
+        return rolling_weighted_mean(array, weights)
+
+    def count(self, condition_array, window):
+        # 对符合条件的项进行计数
+        return self._kernel("rolling_count", rolling_sum)(condition_array, window)
+
+    # (以下是不太确定的算子函数)------------------------------------------
+    def product(self, array, window):
+        return self._kernel("rolling_product", rolling_product)(array, window)
+
+    @staticmethod
+    def sequence(n):
+        return np.arange(1, n + 1)
+
+    def regbeta(self, array, window):
+        # 对时间序列1..window回归的beta, 即斜率
+        return self.linregress(array, window)["slope"]
+
+
+class AlphaExpressionPlan:
+    # 编译后的表达式执行计划: 原始表达式 + 规范化表达式 + 语法树 + 字节码, 编译一次后可在任意数据上重复执行
+    def __init__(self, source, expression=None, tree=None, code=None, error=None, constant=None):
+        self.source = source
+        self.expression = expression
+        self.tree = tree  # 化简后的语法树
+        self.code = code
+        self.error = error  # 编译失败时记录异常, 执行时抛出
+        self.constant = constant  # 常数因子(如close/close)的常数值, 非常数因子为None
+
+    def __repr__(self):
+        return f"AlphaExpressionPlan({self.expression if self.error is None else self.source!r})"
+
+
+# 一次调用的执行上下文(不可变快照): 调用开始时从执行器的设置中取出, 调用过程中只读取快照,
+# 其他线程修改精度/融合/缓存/性能统计设置不影响正在进行的计算
+AlphaExecutionContext = namedtuple("AlphaExecutionContext", ["precision", "dtype", "kernel_backend", "series_ops", "ops", "batch_kernels", "fused_evaluate", "profiler", "cache", "scheduler"])
 
 
 class AlphaExpressionExcutor:
+    # 执行器可在多个线程中并发使用(同一份编译好的因子库/DAG): 每次调用的数据与中间结果都只属于本次调用, 算子表只读,
+    # 磁盘缓存与性能统计内部加锁; 计算量集中在numpy/Numba内核中(释放GIL), 见execute_graph_many
+    # 表达式允许出现的语法节点(仅四则运算/比较/逻辑运算/算子调用/变量/常量)
+    ALLOWED_NODES = (
+        ast.Expression,
+        ast.BinOp,
+        ast.UnaryOp,
+        ast.BoolOp,
+        ast.Compare,
+        ast.Call,
+        ast.Name,
+        ast.Constant,
+        ast.Load,
+        ast.operator,
+        ast.unaryop,
+        ast.boolop,
+        ast.cmpop,
+    )
+    _library_cache = {}  # 因子库编译缓存: 文件绝对路径 -> (修改时间, {alpha_name: plan})
+    _graph_cache = {}  # 因子库DAG缓存: (文件绝对路径, 是否跳过常数因子, 排除的因子) -> (修改时间, graph)
+
+    PANEL_FIELDS = ["open", "high", "low", "close", "volume", "amount", "vwap", "returns"]  # 面板模式默认加载的字段
+    INDUSTRY_OPERATORS = ("industry_neutralize", "indneutralize")  # 行业中性化算子
+    FIELD_LOOKBACK = {"returns": 1}  # 字段自身需要的历史交易日数(returns由前一日收盘价计算)
+    PRECISIONS = {"float64": np.float64, "float32": np.float32}  # 面板/ndarray计算的浮点精度, 见set_precision
+
     def __init__(self):
-        self.ops = AlphaBaseOperations()
-        self.local_ops = {func.lower(): getattr(self.ops, func) for func in dir(self.ops) if callable(getattr(self.ops, func)) and not func.startswith("__")}
+        self.kernel_backend = DEFAULT_KERNEL_BACKEND  # 时间序列内核的实现, 见set_kernel_backend
+        self._kernel_ops = {}  # 内核后端 -> (逐只股票算子表, 面板算子表, 多窗口批量内核表), 见_backend_ops
+        self.ops = AlphaBaseOperations(self.kernel_backend)
+        self.panel_ops = AlphaPanelOperations(self.kernel_backend)
+        self.op_funcs, self.panel_op_funcs = self._backend_ops(self.kernel_backend)[:2]  # 纯算子表(不含数据列, 默认内核后端), 只读
+        self.op_names = frozenset(self.op_funcs) | frozenset(self.panel_op_funcs)  # 合法算子名称, 编译期校验使用
+        self._plan_cache = {}  # 表达式字符串 -> plan, 供excute复用
+        self.profiler = None  # 性能统计(默认关闭), 见enable_profiling
+        self.cache = None  # 磁盘缓存(默认关闭), 见enable_cache
+        self.scheduler = None  # 面板模式的并行DAG调度(默认关闭, 逐节点顺序计算), 见enable_scheduler
+        self.precision = "float64"
+        self.dtype = np.float64
+        self._float32_ops = {}  # 内核后端 -> float32精度的算子表, 见_precision_ops
+        self.fused_evaluate = evaluate_fused if NUMEXPR_AVAILABLE else None  # 逐元素子树的融合求值(ndarray后端), 设为None则逐节点计算
+
+    def enable_profiling(self):
+        # 开启后按算子/因子累计耗时、调用次数、输入规模和失败次数, 多次执行的结果持续汇总
+        if self.profiler is None:
+            self.profiler = AlphaExpressionProfiler()
+        return self.profiler
+
+    def disable_profiling(self):
+        self.profiler = None
+
+    def enable_cache(self, cache_dir, max_bytes=2 * 1024**3):
+        # 开启中间结果的磁盘缓存: 同一份行情重复计算时直接读取已缓存的因子/子表达式, 只计算新增或变化的部分
+        self.cache = AlphaExpressionCache(cache_dir, max_bytes)
+        return self.cache
+
+    def disable_cache(self):
+        self.cache = None
+
+    def enable_scheduler(self, max_workers=None):
+        # 开启后面板模式按DAG并行调度: 互不依赖的节点在线程池中同时计算, 中间结果在最后一个使用者完成后释放(峰值内存降低)
+        # 每次计算的关键路径/峰值内存等统计见scheduler.last_stats; 开启磁盘缓存时仍按缓存的方式顺序计算
+        self.scheduler = AlphaGraphScheduler(max_workers)
+        return self.scheduler
+
+    def disable_scheduler(self):
+        self.scheduler = None
+
+    def set_precision(self, precision):
+        # 面板模式/ndarray后端的计算精度: "float32"时行情面板与全部中间结果为float32(内存带宽与峰值内存减半), 因子结果为float32
+        # 与float64的偏差见expression_benchmark.run_precision_check; pandas Series后端(backend="series")始终为float64
+        if precision not in self.PRECISIONS:
+            raise ValueError(f"unknown precision: {precision}")
+        self.precision = precision
+        self.dtype = self.PRECISIONS[precision]
+
+    def _backend_ops(self, kernel_backend):
+        # 每个内核后端各有一组算子对象, 切换后端只改变之后取得的算子表, 不影响正在进行的计算
+        if kernel_backend not in self._kernel_ops:
+            tables = []
+            panel_ops = AlphaPanelOperations(kernel_backend)
+            for ops in (AlphaBaseOperations(kernel_backend), panel_ops):
+                tables.append({func.lower(): getattr(ops, func) for func in dir(ops) if callable(getattr(ops, func)) and not func.startswith("_")})
+            tables.append(panel_ops.window_batch_kernels)
+            self._kernel_ops.setdefault(kernel_backend, tuple(tables))  # 并发时重复构造无害, 只保留先写入的算子表
+        return self._kernel_ops[kernel_backend]
+
+    def _precision_ops(self, precision=None, kernel_backend=None):
+        # float32精度下, 输出为float64的算子(如bool计数、多窗口内核的结果)转回float32, 避免中间结果逐步提升为float64
+        kernel_backend = self.kernel_backend if kernel_backend is None else kernel_backend
+        _, panel_op_funcs, window_batch_kernels = self._backend_ops(kernel_backend)
+        if (self.precision if precision is None else precision) == "float64":
+            return panel_op_funcs, window_batch_kernels
+        if kernel_backend not in self._float32_ops:
+            ops = {name: self._float32_output(func) for name, func in panel_op_funcs.items()}
+            batch_kernels = {name: (kernel, self._float32_output(finish)) for name, (kernel, finish) in window_batch_kernels.items()}
+            self._float32_ops.setdefault(kernel_backend, (ops, batch_kernels))
+        return self._float32_ops[kernel_backend]
+
+    def _context(self):
+        precision, kernel_backend = self.precision, self.kernel_backend  # 只读取一次, 精度、dtype、内核后端与算子表保持一致
+        ops, batch_kernels = self._precision_ops(precision, kernel_backend)
+        return AlphaExecutionContext(
+            precision, self.PRECISIONS[precision], kernel_backend, self._backend_ops(kernel_backend)[0], ops, batch_kernels, self.fused_evaluate, self.profiler, self.cache, self.scheduler
+        )
+
+    def execution_context(self):
+        # 当前的计算上下文(精度、dtype、内核后端、算子表、缓存/调度器), 供执行器之外自行调度DAG计算的调用方(如expression_miner)使用
+        # 返回的是快照, 之后调用set_precision/set_kernel_backend不影响已取得的上下文
+        return self._context()
+
+    @staticmethod
+    def _float32_output(func):
+        def cast(value):
+            if isinstance(value, dict):
+                return {key: cast(item) for key, item in value.items()}
+            return value.astype(np.float32) if isinstance(value, np.ndarray) and value.dtype == np.float64 else value
+
+        return lambda *args: cast(func(*args))
+
+    def set_kernel_backend(self, backend):
+        # 选择本执行器时间序列内核的实现("numba"/"numpy"), 不影响其他执行器; 每次计算开始时读取一次(见_context), 计算中途切换不影响本次结果
+        # 未安装numba时只能使用"numpy"
+        if backend not in KERNEL_BACKENDS:
+            raise ValueError(f"unknown kernel backend: {backend}")
+        if backend == "numba" and not NUMBA_AVAILABLE:
+            raise ImportError("numba is not installed")
+        self.kernel_backend = backend
 
     def expression_regex(self, expression):
         expression = re.sub(r"\^", "**", expression)  # 指数替换
@@ -204,9 +557,233 @@ class AlphaExpressionExcutor:
         expression = re.sub(r"\b[A-Za-z_][A-Za-z0-9_]*\b", lambda match: match.group().lower(), expression)  # 全部小写替换
         return expression
 
+    def expression_validate(self, tree):
+        for node in ast.walk(tree):
+            if not isinstance(node, self.ALLOWED_NODES):
+                raise SyntaxError(f"不支持的表达式语法: {type(node).__name__}")
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or node.func.id not in self.op_names:
+                    raise NameError(f"未知的算子: {ast.unparse(node.func)}")
+                if node.keywords:
+                    raise SyntaxError(f"算子不支持关键字参数: {node.func.id}")
+            if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+                raise SyntaxError(f"不支持的常量: {node.value!r}")
+
+    def expression_rewrite(self, tree):
+        # 行业中性化未指定分组时, 默认使用industry字段(面板模式下的行业分组编号)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in self.INDUSTRY_OPERATORS and len(node.args) == 1:
+                node.args.append(ast.Name(id="industry", ctx=ast.Load()))
+        ast.fix_missing_locations(tree)
+
+    def expression_simplify(self, tree):
+        # 常量折叠 + 去掉恒等运算 + 交换律运算的操作数规范排序, 返回化简后的语法树及常数因子的常数值(非常数为None)
+        simplifier = AlphaExpressionSimplifier()
+        tree = ast.fix_missing_locations(simplifier.visit(tree))
+        return tree, simplifier.constant_value(tree.body)
+
+    def compile(self, expression):
+        # 表达式修正 + 语法树解析 + 校验 + 化简, 只在编译阶段执行一次
+        try:
+            normalized = self.expression_regex(expression)
+            tree = ast.parse(normalized, mode="eval")
+            self.expression_rewrite(tree)
+            self.expression_validate(tree)
+            tree, constant = self.expression_simplify(tree)
+            code = compile(tree, "<alpha_expression>", "eval")
+        except Exception as e:
+            return AlphaExpressionPlan(expression, error=e)
+        return AlphaExpressionPlan(expression, normalized, tree, code, constant=constant)
+
+    def compile_library(self, alpha_dict_path):
+        # 按因子库文件缓存编译结果, 文件变更后自动重新编译
+        library_path = os.path.abspath(alpha_dict_path)
+        library_mtime = os.path.getmtime(library_path)
+        cached = self._library_cache.get(library_path)
+        if cached is None or cached[0] != library_mtime:
+            with open(library_path, "r") as f:
+                alpha_factor_dict = json.loads(f.read())
+            cached = (library_mtime, {alpha_name: self.compile(alpha_expression) for alpha_name, alpha_expression in alpha_factor_dict.items()})
+            self._library_cache[library_path] = cached
+        return cached[1]
+
+    def compile_graph(self, alpha_dict_path, skip_constant=False, exclude=()):
+        # 整个因子库构建为一张共享DAG, 相同子表达式只保留一个节点; skip_constant=True时不包含常数因子(不计算也不输出)
+        # exclude为不计算也不输出的因子名称(如dry-run清单中已知失败/隔离的因子, 见expression_dryrun)
+        library_path, exclude = os.path.abspath(alpha_dict_path), frozenset(exclude)
+        library_mtime = os.path.getmtime(library_path)
+        cached = self._graph_cache.get((library_path, skip_constant, exclude))
+        if cached is None or cached[0] != library_mtime:
+            alpha_plan_dict = self.compile_library(library_path)
+            alpha_plan_dict = {alpha_name: alpha_plan for alpha_name, alpha_plan in alpha_plan_dict.items() if not (skip_constant and alpha_plan.constant is not None) and alpha_name not in exclude}
+            cached = (library_mtime, AlphaExpressionGraph(alpha_plan_dict, self.op_names))
+            self._graph_cache[(library_path, skip_constant, exclude)] = cached
+        return cached[1]
+
+    def constant_factors(self, alpha_dict_path):
+        # 因子库中的常数因子: alpha_name -> 常数值
+        return {alpha_name: alpha_plan.constant for alpha_name, alpha_plan in self.compile_library(alpha_dict_path).items() if alpha_plan.constant is not None}
+
+    def compile_lookback(self, alpha_dict_path):
+        # 静态分析因子库中每个因子所需的回看交易日数(按面板算子的语义, 不读取数据)
+        return self.compile_graph(alpha_dict_path).lookback(self.panel_op_funcs, self.FIELD_LOOKBACK)
+
+    def library_lookback(self, alpha_dict_path):
+        # 整个因子库所需的回看交易日数(各因子的最大值)
+        return max(self.compile_lookback(alpha_dict_path).values(), default=0)
+
+    def execute_graph(self, graph, df, backend="series"):
+        # 逐只股票执行, 每个子表达式在当前数据上只计算一次, 失败的因子填充NaN
+        # 注意rank/scale在单只股票的整段时间序列上计算(见AlphaBaseOperations.rank), 与入库的截面因子值(execute_panel)不同
+        # backend="series"(默认)为pandas Series算子实现, 因子值与原实现一致
+        # backend="numpy"需显式指定: 只取出表达式用到的列(连续的浮点数组, 精度见set_precision), 算子直接在ndarray上计算(面板算子对一维数组即为单只股票的时间序列,
+        # rank/scale作用于整段序列, 与Series算子一致), 只在最后把因子结果包装为DataFrame; 与Series算子的数值不完全相同:
+        # 常数窗口的std/covariance/correlation为精确的0/NaN(pandas为舍入噪声值), 再经整段序列的rank放大后部分因子的值明显不同
+        # (见factor_ref/verify_baseline.json中"stock numpy"的已知差异)
+        context = self._context()
+        if backend == "series":
+            columns = {col_name.lower(): df[col_name] for col_name in df.columns}
+            ops, wrap, batch_kernels, fused_evaluate = context.series_ops, lambda values: pd.Series(values, index=df.index), None, None
+        else:
+            columns = self.build_arrays(df, {node.name for node in graph.nodes if node.kind == "field"}, context.dtype)
+            ops, wrap, batch_kernels, fused_evaluate = {**context.ops, "scale": self._stock_scale}, lambda values: values, context.batch_kernels, context.fused_evaluate
+        if context.cache is not None:
+            results, errors = context.cache.evaluate(graph, columns, ops, self._cache_backend(backend, context), (len(df),), wrap, profiler=context.profiler, batch_kernels=batch_kernels, fused_evaluate=fused_evaluate)
+        else:
+            results, errors = graph.evaluate(columns, ops, context.profiler, batch_kernels=batch_kernels, fused_evaluate=fused_evaluate)
+        if context.profiler is not None:
+            context.profiler.record_graph(graph, errors, len(df))
+        if backend != "series":
+            results = {alpha_name: np.broadcast_to(result, (len(df),)) for alpha_name, result in results.items()}
+        return pd.DataFrame(
+            {alpha_name: results[alpha_name] if alpha_name in results else np.nan for alpha_name in graph.names},
+            index=df.index,
+        )
+
+    @staticmethod
+    def _stock_scale(array, factor=1):
+        # 单只股票模式下scale与Series算子语义一致(除以整段序列之和, 不取绝对值), 面板模式为截面绝对值之和
+        return array * (factor / np.nansum(array))
+
+    def execute_graph_many(self, graph, dfs, backend="series", max_workers=None):
+        # 多只股票(多个DataFrame)在线程池中并发执行同一张DAG, 结果顺序与dfs一致; max_workers=1时在当前线程依次执行
+        # backend见execute_graph; numpy后端的计算集中在释放GIL的内核中, 多线程的加速比更高
+        if max_workers == 1:
+            return [self.execute_graph(graph, df, backend=backend) for df in dfs]
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(lambda df: self.execute_graph(graph, df, backend=backend), dfs))
+
+    def build_arrays(self, df, fields, dtype=None):
+        # 按需取出数据列(列名不区分大小写): 数值列转为dtype(默认为当前精度)的连续数组, 无法转换的列保持原样
+        dtype = self.dtype if dtype is None else dtype
+        columns = {col_name.lower(): col_name for col_name in df.columns}
+        arrays = {}
+        for field in fields:
+            if field in columns:
+                try:
+                    arrays[field] = np.ascontiguousarray(df[columns[field]].to_numpy(dtype=dtype))
+                except (TypeError, ValueError):
+                    arrays[field] = df[columns[field]].to_numpy()
+        return arrays
+
+    def build_panel(self, df, fields=None, codes=None):
+        # 长表(code, datetime, 字段...) -> 面板: 每个字段为(n_dates, n_codes)的二维数组, 缺失的交易日为NaN
+        # codes指定面板的股票列表(默认为数据中出现的全部股票)
+        fields = [field for field in (fields or self.PANEL_FIELDS) if field in df.columns]
+        frame = df.pivot(index="datetime", columns="code", values=fields).sort_index()
+        dates, codes = frame.index.to_numpy(), frame[fields[0]].columns.to_numpy() if codes is None else np.asarray(codes)
+        panel = {field: frame[field].reindex(columns=codes).to_numpy(dtype=self.dtype) for field in fields}
+        return dates, codes, panel
+
+    def build_panel_groups(self, codes, code_groups):
+        # 每只股票的分组编号(如行业), code_groups为code -> 分组名称的映射, 缺失的分组归为"其他"
+        group_names = pd.Series(codes).map(code_groups).fillna("其他").replace("", "其他")
+        return pd.factorize(group_names)[0]
+
+    def execute_panel(self, graph, panel):
+        # 面板模式: 每个因子对全市场只计算一次, 失败的因子填充NaN; rank/scale/demean为截面算子(见AlphaPanelOperations), 与入库的因子值一致
+        return self._execute_panel(graph, panel, self._context())
+
+    def evaluate_panel(self, graph, panel):
+        # 面板模式, 返回(因子结果, 因子异常), 结果不补齐形状/精度, 用于检查失败原因(见expression_dryrun)
+        return self._evaluate_panel(graph, panel, self._context())
+
+    def _execute_panel(self, graph, panel, context):
+        results, errors = self._evaluate_panel(graph, panel, context)
+        shape = next(array.shape for array in panel.values() if np.ndim(array) == 2)
+        return {alpha_name: np.broadcast_to(np.asarray(results[alpha_name], dtype=context.dtype), shape) if alpha_name in results else np.full(shape, np.nan, dtype=context.dtype) for alpha_name in graph.names}
+
+    def _evaluate_panel(self, graph, panel, context):
+        data = {field.lower(): array for field, array in panel.items()}
+        shape = next(array.shape for array in panel.values() if np.ndim(array) == 2)
+        if context.cache is not None:
+            results, errors = context.cache.evaluate(graph, data, context.ops, self._cache_backend("panel", context), shape, lambda values: values, profiler=context.profiler, batch_kernels=context.batch_kernels, fused_evaluate=context.fused_evaluate)
+        elif context.scheduler is not None:
+            results, errors = context.scheduler.evaluate(graph, data, context.ops, context.profiler, batch_kernels=context.batch_kernels, fused_evaluate=context.fused_evaluate)
+        else:
+            results, errors = graph.evaluate(data, context.ops, context.profiler, batch_kernels=context.batch_kernels, fused_evaluate=context.fused_evaluate)
+        if context.profiler is not None:
+            context.profiler.record_graph(graph, errors, shape[0] * shape[1])
+        return results, errors
+
+    def execute_panel_chunks(self, graph, panel, chunk_size, lookback=None):
+        # 沿时间轴分块计算面板: 每块前补lookback行历史(halo), 计算后去掉halo, 逐块返回(起始行, 结束行, 因子面板)
+        # 全部算子只依赖自身窗口内的数据(见expression_kernels), halo不少于因子所需的回看天数时结果与整段计算一致
+        # (短窗口逐位一致, 长窗口的分段前缀和只差舍入误差),
+        # 中间结果的峰值内存由chunk_size + lookback决定; 窗口参数不是常量的因子无法确定回看天数, 不保证一致
+        if lookback is None:
+            lookback = max(graph.lookback(self.panel_op_funcs, self.FIELD_LOOKBACK).values(), default=0)
+        n_dates = next(len(array) for array in panel.values() if np.ndim(array) == 2)
+        context = self._context()
+        for start in range(0, n_dates, chunk_size):
+            end = min(start + chunk_size, n_dates)
+            halo_start = max(start - lookback, 0)
+            chunk = {field: array[halo_start:end] if np.ndim(array) == 2 else array for field, array in panel.items()}
+            results = self._execute_panel(graph, chunk, context)
+            yield start, end, {alpha_name: result[start - halo_start :] for alpha_name, result in results.items()}
+
+    @staticmethod
+    def _cache_backend(backend, context):
+        # 缓存key中的执行后端: 不同精度、不同内核后端(numba/numpy)的结果分开缓存
+        return f"{backend}-{context.precision}-{context.kernel_backend}"
+
+    def create_stream(self, graph, codes, static_fields=None, state_path=None):
+        # 增量计算器(面板算子), state_path存在时从上次保存的窗口状态继续
+        alpha_stream = AlphaExpressionStream(graph, self._precision_ops()[0], codes, static_fields, profiler=self.profiler)
+        if state_path is not None and os.path.exists(state_path):
+            alpha_stream.load(state_path)
+        return alpha_stream
+
+    def panel_to_frame(self, dates, codes, panel_results, mask=None):
+        # 面板 -> 长表(code, datetime, 因子...), mask指定保留的(日期, 股票)位置(默认全部保留)
+        date_index, code_index = np.nonzero(np.ones((len(dates), len(codes)), dtype=bool) if mask is None else mask)
+        dataframe = pd.DataFrame({"code": codes[code_index], "datetime": dates[date_index]})
+        factor_frame = pd.DataFrame({alpha_name: array[date_index, code_index] for alpha_name, array in panel_results.items()})
+        return pd.concat([dataframe, factor_frame], axis=1)
+
+    def execute(self, plan, df):
+        profiler = self.profiler
+        if profiler is not None:
+            start = time.perf_counter()
+            try:
+                result = self._execute(plan, df)
+            except Exception as e:
+                profiler.record_factor(plan.source, time.perf_counter() - start, len(df), e)
+                raise
+            profiler.record_factor(plan.source, time.perf_counter() - start, len(df))
+            return result
+        return self._execute(plan, df)
+
+    def _execute(self, plan, df):
+        if plan.error is not None:
+            raise plan.error
+        # 每次调用新建命名空间(算子 + 本次dataframe的列), 不修改共享的算子表, 上一次调用的列不会残留
+        local_ops = dict(self._backend_ops(self.kernel_backend)[0])
+        local_ops.update({col_name.lower(): df[col_name] for col_name in df.columns})
+        return eval(plan.code, {"np": np, "nan": np.nan}, local_ops)
+
     def excute(self, df, expression):
-        # 创建包含列名和方法的本地字典
-        self.local_ops.update({col_name.lower(): df[col_name] for col_name in df.columns})  # 通过字典的方式映射dataframe中的column
-        # 表达式修正
-        expression = self.expression_regex(expression)
-        return eval(expression, {"np": np, "nan": np.nan}, self.local_ops)
+        plan = self._plan_cache.get(expression)
+        if plan is None:
+            plan = self._plan_cache.setdefault(expression, self.compile(expression))  # 并发时重复编译无害, 只保留先写入的plan
+        return self.execute(plan, df)
@@ -0,0 +1,14 @@
+# 逐元素子树的融合求值(见AlphaExpressionGraph.fused_groups): 整棵子树编译为一个numexpr表达式, 分块遍历一次输入,
+# 不为每个二元运算分配临时数组; 未安装numexpr时不融合, 逐节点计算
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+NUMEXPR_AVAILABLE = numexpr is not None
+
+
+def evaluate_fused(expression, leaf_values):
+    # leaf_values: 叶子变量名 -> float64数组/标量; numexpr按表达式文本缓存编译结果
+    return numexpr.evaluate(expression, local_dict=leaf_values, global_dict={})
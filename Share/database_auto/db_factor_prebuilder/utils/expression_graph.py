@@ -0,0 +1,464 @@
+import ast
+import time
+import operator
+import numpy as np
+
+
+class AlphaExpressionNode:
+    # DAG节点: field(数据列) / const(常量) / operator(运算符) / call(算子调用) / select(多输出算子取值), args为子节点编号
+    __slots__ = ("kind", "name", "args", "value")
+
+    def __init__(self, kind, name, args=(), value=None):
+        self.kind = kind
+        self.name = name
+        self.args = tuple(args)
+        self.value = value
+
+    @property
+    def key(self):
+        # 结构相同的子表达式拥有相同的key, 用于公共子表达式消除
+        return (self.kind, self.name, self.args, repr(self.value) if self.kind == "const" else None)
+
+    def __repr__(self):
+        if self.kind == "const":
+            return f"AlphaExpressionNode(const, {self.value!r})"
+        return f"AlphaExpressionNode({self.kind}, {self.name}, {self.args})"
+
+
+class AlphaExpressionGraph:
+    # 语法树运算符 -> operator模块函数名
+    BINARY_OPERATORS = {
+        ast.Add: "add",
+        ast.Sub: "sub",
+        ast.Mult: "mul",
+        ast.Div: "truediv",
+        ast.FloorDiv: "floordiv",
+        ast.Mod: "mod",
+        ast.Pow: "pow",
+        ast.BitAnd: "and_",
+        ast.BitOr: "or_",
+        ast.BitXor: "xor",
+    }
+    UNARY_OPERATORS = {
+        ast.USub: "neg",
+        ast.UAdd: "pos",
+        ast.Invert: "invert",
+        ast.Not: "not_",
+    }
+    COMPARE_OPERATORS = {
+        ast.Lt: "lt",
+        ast.LtE: "le",
+        ast.Gt: "gt",
+        ast.GtE: "ge",
+        ast.Eq: "eq",
+        ast.NotEq: "ne",
+    }
+
+    # 多输出算子: 改写为对共享节点的取值(select), 相同输入只计算一次
+    SHARED_CALLS = {
+        "slope": ("linregress", "slope"),
+        "regbeta": ("linregress", "slope"),
+        "rsquare": ("linregress", "rsquare"),
+        "resi": ("linregress", "resi"),
+    }
+
+    # 时间序列算子的窗口参数位置: 计算最新一行时, 数组参数需要最近window行
+    WINDOW_OPERATORS = {
+        "std": 1,
+        "mean": 1,
+        "sum": 1,
+        "tsmax": 1,
+        "tsmin": 1,
+        "tsargmax": 1,
+        "tsargmin": 1,
+        "tsrank": 1,
+        "idxmax": 1,
+        "highday": 1,
+        "idxmin": 1,
+        "lowday": 1,
+        "correlation": 2,
+        "covariance": 2,
+        "quantile": 1,
+        "linregress": 1,
+        "decaylinear": 1,
+        "sma": 1,
+        "wma": 1,
+        "count": 1,
+        "product": 1,
+    }
+    # 序列对算子: 算子名称 -> 两个序列参数的位置(std为序列与自身), 批量内核见_evaluate_batch
+    PAIR_OPERATORS = {"std": (0, 0), "covariance": (0, 1), "correlation": (0, 1)}
+    # 位移算子的周期参数位置: 计算最新一行需要最近periods+1行
+    SHIFT_OPERATORS = {"shift": 1, "diff": 1}
+
+    # 可融合为一个逐元素表达式(numexpr语法)的运算: operator模块函数名/算子名称 -> 表达式模板
+    # 只收录与numpy逐位一致的运算(四则运算/取负/绝对值/平方/开方); 比较运算的结果为bool, 只能作为融合子树的根
+    FUSED_OPERATORS = {"add": "({} + {})", "sub": "({} - {})", "mul": "({} * {})", "truediv": "({} / {})", "neg": "(-{})", "pos": "{}", "abs": "abs({})"}
+    FUSED_COMPARES = {"lt": "({} < {})", "le": "({} <= {})", "gt": "({} > {})", "ge": "({} >= {})", "eq": "({} == {})", "ne": "({} != {})"}
+    FUSED_POWERS = {2: "({} ** 2)", 0.5: "sqrt({})"}
+
+    def __init__(self, alpha_plan_dict, op_names):
+        self.op_names = frozenset(op_names)
+        self.names = list(alpha_plan_dict)  # 因子名称(保持因子库原有顺序)
+        self.nodes = []  # 按拓扑序排列(子节点总在父节点之前)
+        self.labels = []  # 节点的规范化表达式文本, 不依赖节点编号, 可跨因子库版本标识同一子表达式
+        self.outputs = {}  # alpha_name -> 节点编号
+        self.errors = {}  # alpha_name -> 编译/建图失败的异常
+        self.nodes_before = 0  # 不做去重时的节点总数
+        self._node_index = {}  # 节点key -> 节点编号
+        self._dependencies = {}  # 节点编号 -> 依赖的全部节点编号(含自身)
+        self._window_batches = (None, {})  # (batch_kernels, 节点编号 -> 同组节点), 见window_batches
+        self._fused_groups = None  # 融合子树的根节点编号 -> (表达式, 叶子节点编号, 子树内部节点编号), 见fused_groups
+        for alpha_name, alpha_plan in alpha_plan_dict.items():
+            if alpha_plan.error is not None:
+                self.errors[alpha_name] = alpha_plan.error
+                continue
+            node_count, nodes_before = len(self.nodes), self.nodes_before
+            try:
+                self.outputs[alpha_name] = self._lower(alpha_plan.tree.body)
+            except Exception as e:
+                # 建图失败时回滚该表达式已添加的节点
+                for node in self.nodes[node_count:]:
+                    del self._node_index[node.key]
+                del self.nodes[node_count:]
+                del self.labels[node_count:]
+                self.nodes_before = nodes_before
+                self.errors[alpha_name] = e
+
+    # ------------------------------------------
+    def _intern(self, kind, name, args=(), value=None):
+        node = AlphaExpressionNode(kind, name, args, value)
+        node_id = self._node_index.get(node.key)
+        if node_id is None:
+            node_id = self._node_index[node.key] = len(self.nodes)
+            self.nodes.append(node)
+            self.labels.append(self._label(node))
+        return node_id
+
+    def _label(self, node):
+        if node.kind == "const":
+            return repr(node.value)
+        if node.kind == "field":
+            return node.name
+        if node.kind == "select":
+            return f"{self.labels[node.args[0]]}.{node.name}"
+        args = ",".join(self.labels[arg] for arg in node.args)
+        return f"{node.name}({args})" if node.kind == "call" else f"operator.{node.name}({args})"
+
+    def _lower(self, tree):
+        # 将语法树转为DAG节点, 相同子表达式复用同一节点
+        self.nodes_before += 1
+        if isinstance(tree, ast.Constant):
+            return self._intern("const", None, value=tree.value)
+        if isinstance(tree, ast.Name):
+            if tree.id == "nan":
+                return self._intern("const", None, value=np.nan)
+            if tree.id in self.op_names:
+                raise SyntaxError(f"算子未调用: {tree.id}")
+            return self._intern("field", tree.id)
+        if isinstance(tree, ast.BinOp):
+            return self._intern("operator", self.BINARY_OPERATORS[type(tree.op)], (self._lower(tree.left), self._lower(tree.right)))
+        if isinstance(tree, ast.UnaryOp):
+            return self._intern("operator", self.UNARY_OPERATORS[type(tree.op)], (self._lower(tree.operand),))
+        if isinstance(tree, ast.Compare):
+            if len(tree.ops) != 1:
+                raise SyntaxError(f"不支持连续比较: {ast.unparse(tree)}")
+            return self._intern("operator", self.COMPARE_OPERATORS[type(tree.ops[0])], (self._lower(tree.left), self._lower(tree.comparators[0])))
+        if isinstance(tree, ast.Call):
+            args = tuple(self._lower(arg) for arg in tree.args)
+            if tree.func.id in self.SHARED_CALLS:
+                shared_name, field = self.SHARED_CALLS[tree.func.id]
+                return self._intern("select", field, (self._intern("call", shared_name, args),))
+            return self._intern("call", tree.func.id, args)
+        raise SyntaxError(f"不支持的表达式语法: {type(tree).__name__}")
+
+    # ------------------------------------------
+    @property
+    def nodes_after(self):
+        return len(self.nodes)
+
+    def report(self):
+        # 去重统计: 去重前后节点数及压缩比
+        return {
+            "factors": len(self.outputs),
+            "failed": len(self.errors),
+            "nodes_before": self.nodes_before,
+            "nodes_after": self.nodes_after,
+            "dedup_ratio": self.nodes_before / max(self.nodes_after, 1),
+        }
+
+    def static_values(self, ops, data=None):
+        # 不随日期变化的节点(常量, data中的静态字段, 以及只依赖它们的子表达式)的取值: 节点编号 -> 值
+        values = {}
+        data = data or {}
+        for node_id, node in enumerate(self.nodes):
+            if node.kind == "field" and node.name not in data:
+                continue
+            if all(arg in values for arg in node.args):
+                try:
+                    values[node_id] = self.evaluate_node(node, [values[arg] for arg in node.args], data, ops)
+                except Exception:
+                    continue
+        return values
+
+    def input_rows(self, node_id, static_values):
+        # 计算节点最新一行时, 每个非静态参数需要的最近行数(窗口/周期参数必须是静态值)
+        node = self.nodes[node_id]
+        if node.kind != "call":
+            return 1
+        if node.name in self.WINDOW_OPERATORS:
+            position, offset = self.WINDOW_OPERATORS[node.name], 0
+        elif node.name in self.SHIFT_OPERATORS:
+            position, offset = self.SHIFT_OPERATORS[node.name], 1
+        else:
+            return 1
+        if position >= len(node.args) or node.args[position] not in static_values:
+            raise ValueError(f"{node.name}的窗口参数不是常量: {self.labels[node_id]}")
+        window = static_values[node.args[position]]
+        if window < 0:
+            raise ValueError(f"{node.name}的周期参数为负数(使用未来数据): {self.labels[node_id]}")
+        return int(window) + offset
+
+    def lookback(self, ops, field_lookback=None):
+        # 每个因子产生非NaN值所需的此前交易日数: 窗口算子需要此前window-1行, 位移算子需要此前periods行, 嵌套时沿依赖路径累加
+        # field_lookback为字段自身需要的历史(如returns需要前一日收盘价); 窗口参数不是常量的因子无法确定, 不出现在结果中
+        field_lookback = field_lookback or {}
+        static_values = self.static_values(ops)
+        node_lookback = []
+        for node_id, node in enumerate(self.nodes):
+            if node_id in static_values:
+                days = 0
+            elif node.kind == "field":
+                days = field_lookback.get(node.name, 0)
+            else:
+                args = [node_lookback[arg] for arg in node.args]
+                try:
+                    days = None if None in args else max(args, default=0) + self.input_rows(node_id, static_values) - 1
+                except Exception:
+                    days = None
+            node_lookback.append(days)
+        return {alpha_name: node_lookback[node_id] for alpha_name, node_id in self.outputs.items() if node_lookback[node_id] is not None}
+
+    @staticmethod
+    def evaluate_node(node, args, data, ops):
+        if node.kind == "const":
+            return node.value
+        if node.kind == "field":
+            if node.name not in data:
+                raise NameError(f"name '{node.name}' is not defined")
+            return data[node.name]
+        if node.kind == "select":
+            return args[0][node.name]
+        func = getattr(operator, node.name) if node.kind == "operator" else ops[node.name]
+        return func(*args)
+
+    def dependencies(self, node_id):
+        # 计算该节点需要的全部节点编号(含自身)
+        if node_id not in self._dependencies:
+            result, stack = set(), [node_id]
+            while stack:
+                current = stack.pop()
+                if current not in result:
+                    result.add(current)
+                    stack.extend(self.nodes[current].args)
+            self._dependencies[node_id] = frozenset(result)
+        return self._dependencies[node_id]
+
+    def window_batches(self, batch_kernels):
+        # 多窗口分组: 内核相同、窗口之外的参数相同、窗口参数为常量的节点归为一组, 返回 节点编号 -> 同组的(节点编号, 窗口)
+        # 序列对算子(PAIR_OPERATORS)不要求输入相同: 按节点顺序贪心分组, 组内各节点的输入都在组内第一个节点之前算出, 一次内核调用算出全部序列对
+        cached = self._window_batches  # 读取一次, 并发时其他线程替换缓存不影响本次返回的结果
+        if cached[0] is not batch_kernels:
+            groups, pair_groups = {}, {}  # 序列对分组: 内核 -> [(组内第一个节点编号, 同组节点)]
+            for node_id, node in enumerate(self.nodes):
+                if node.kind != "call" or node.name not in batch_kernels:
+                    continue
+                position = self.WINDOW_OPERATORS[node.name]
+                if len(node.args) != position + 1 or self.nodes[node.args[position]].kind != "const":
+                    continue
+                window = self.nodes[node.args[position]].value
+                if not isinstance(window, (int, float)) or window != int(window) or window < 1:
+                    continue
+                if node.name in self.PAIR_OPERATORS:
+                    ready = max(node.args[:position])
+                    candidates = pair_groups.setdefault(batch_kernels[node.name][0], [])
+                    group = next((members for leader, members in candidates if leader > ready), None)
+                    if group is None:
+                        candidates.append((node_id, [(node_id, int(window))]))
+                    else:
+                        group.append((node_id, int(window)))
+                    continue
+                groups.setdefault((batch_kernels[node.name][0], node.args[:position]), []).append((node_id, int(window)))
+            groups = list(groups.values()) + [members for candidates in pair_groups.values() for _, members in candidates]
+            batches = {node_id: members for members in groups if len(members) > 1 for node_id, _ in members}
+            cached = self._window_batches = (batch_kernels, batches)
+        return cached[1]
+
+    def _evaluate_batch(self, members, values, batch_kernels):
+        # values: 节点编号 -> 取值(list/dict), 返回 节点编号 -> 结果
+        node = self.nodes[members[0][0]]
+        kernel = batch_kernels[node.name][0]
+        if node.name not in self.PAIR_OPERATORS:
+            # 同组节点的输入完全相同, 一次调用多窗口内核得到全部窗口的结果
+            args = [values[arg] for arg in node.args[:-1]]
+            for arg in args:
+                if isinstance(arg, _NodeError):
+                    raise arg.error
+            kernel_results = kernel(*args, [window for _, window in members])
+            return {node_id: batch_kernels[self.nodes[node_id].name][1](kernel_results[window], window) for node_id, window in members}
+        # 序列对分组: 内核为kernel(序列列表, [(序列编号1, 序列编号2, 窗口列表)]), 同一序列只传入一次; 输入异常只影响对应节点
+        results, series, pairs = {}, {}, {}
+        for node_id, window in members:
+            inputs = [self.nodes[node_id].args[position] for position in self.PAIR_OPERATORS[self.nodes[node_id].name]]
+            errors = [values[arg] for arg in inputs if isinstance(values[arg], _NodeError)]
+            if errors:
+                results[node_id] = errors[0]
+                continue
+            pairs.setdefault(tuple(series.setdefault(arg, len(series)) for arg in inputs), []).append((node_id, window))
+        if pairs:
+            kernel_results = kernel([values[arg] for arg in series], [(i, j, sorted({window for _, window in pair_members})) for (i, j), pair_members in pairs.items()])
+            for comoments, pair_members in zip(kernel_results, pairs.values()):
+                for node_id, window in pair_members:
+                    results[node_id] = batch_kernels[self.nodes[node_id].name][1](comoments[window], window)
+        return results
+
+    def _fused_operator(self, node_id):
+        # 节点对应的融合模板(不可融合时为None)
+        node = self.nodes[node_id]
+        if node.kind == "call" and node.name in self.FUSED_OPERATORS and len(node.args) == 1:
+            return self.FUSED_OPERATORS[node.name]
+        if node.kind != "operator":
+            return None
+        if node.name == "pow":
+            exponent = self.nodes[node.args[1]]
+            if exponent.kind == "const" and type(exponent.value) in (int, float) and exponent.value in self.FUSED_POWERS:
+                return self.FUSED_POWERS[exponent.value]
+            return None
+        return self.FUSED_OPERATORS.get(node.name, self.FUSED_COMPARES.get(node.name))
+
+    def fused_groups(self):
+        # 最大逐元素子树: 可融合节点只被一个可融合的父节点使用(且不是因子输出)时并入父节点, 子树整体求值一次, 中间结果不落地
+        # 其余子节点(字段/常量/算子调用/共享节点)作为叶子变量v{节点编号}; 常量不写入表达式文本, 避免numexpr把除以常数改写为乘以倒数
+        if self._fused_groups is None:
+            consumers = {}
+            for node_id, node in enumerate(self.nodes):
+                for arg in node.args:
+                    consumers.setdefault(arg, []).append(node_id)
+            outputs = set(self.outputs.values())
+
+            def inline(node_id):
+                parents = consumers.get(node_id, [])
+                return (
+                    len(parents) == 1
+                    and node_id not in outputs
+                    and self.nodes[node_id].name not in self.FUSED_COMPARES
+                    and self._fused_operator(node_id) is not None
+                    and self._fused_operator(parents[0]) is not None
+                )
+
+            def render(node_id, leaves, members):
+                # members为空时node_id为子树的根
+                node = self.nodes[node_id]
+                if members and not inline(node_id):
+                    leaves.append(node_id)
+                    return f"v{node_id}"
+                members.append(node_id)
+                args = node.args[:1] if node.kind == "operator" and node.name == "pow" else node.args
+                return self._fused_operator(node_id).format(*(render(arg, leaves, members) for arg in args))
+
+            groups = {}
+            for root in range(len(self.nodes)):
+                if self._fused_operator(root) is None or inline(root):
+                    continue
+                leaves, members = [], []
+                expression = render(root, leaves, members)
+                if len(members) > 1 and any(self.nodes[leaf].kind != "const" for leaf in leaves):
+                    groups[root] = (expression, tuple(dict.fromkeys(leaves)), frozenset(members) - {root})
+            self._fused_groups = groups
+        return self._fused_groups
+
+    def _evaluate_fused(self, root, group, values, data, ops, fused_evaluate):
+        # 叶子均为float64数组/数值标量时整棵子树交给fused_evaluate一次求值, 否则(或融合求值失败时)逐节点计算, 结果与不融合时一致
+        expression, leaves, members = group
+        leaf_values = {}
+        for leaf in leaves:
+            if isinstance(values[leaf], _NodeError):
+                raise values[leaf].error
+            leaf_values[f"v{leaf}"] = values[leaf]
+        if all((isinstance(value, (int, float)) and not isinstance(value, bool)) or (isinstance(value, np.ndarray) and value.dtype == np.float64) for value in leaf_values.values()):
+            try:
+                return fused_evaluate(expression, leaf_values)
+            except Exception:
+                pass
+        member_values = {}
+        for node_id in sorted(members) + [root]:
+            node = self.nodes[node_id]
+            args = [member_values[arg] if arg in member_values else values[arg] for arg in node.args]
+            member_values[node_id] = self.evaluate_node(node, args, data, ops)
+        return member_values[root]
+
+    def evaluate_nodes(self, data, ops, profiler=None, batch_kernels=None, preloaded=None, required=None, fused_evaluate=None):
+        # 每个节点在一批数据上只计算一次, 异常沿依赖向下传播, 返回全部节点的取值
+        # profiler不为None时记录每个节点的耗时(关闭时只多一次判断)
+        # batch_kernels不为None时, 同一输入不同窗口的节点(及序列对分组的节点)在遇到组内第一个节点时一次算出(见window_batches)
+        # fused_evaluate不为None时, 逐元素子树在根节点处一次求值(见fused_groups), 子树内部节点的取值为None
+        # preloaded为已有结果的节点(如缓存读出), required不为None时只计算其中的节点, 其余节点取值为None
+        values = []
+        batches = self.window_batches(batch_kernels) if batch_kernels else {}
+        batched = {}  # 已批量算出、尚未轮到的节点结果
+        fused = self.fused_groups() if fused_evaluate is not None else {}
+        fused_members = frozenset().union(*(members for _, _, members in fused.values()))
+        for node_id, node in enumerate(self.nodes):
+            if preloaded and node_id in preloaded:
+                values.append(preloaded[node_id])
+                continue
+            if (required is not None and node_id not in required) or node_id in fused_members:
+                values.append(None)
+                continue
+            start = time.perf_counter() if profiler is not None else None
+            args = [values[arg] for arg in node.args]
+            try:
+                for arg in args:
+                    if isinstance(arg, _NodeError):
+                        raise arg.error
+                if node_id in fused:
+                    value = self._evaluate_fused(node_id, fused[node_id], values, data, ops, fused_evaluate)
+                elif node_id in batched:
+                    value = batched.pop(node_id)
+                elif node_id in batches:
+                    # 组内尚未轮到、需要计算的节点(组内第一个节点失败时, 其余节点在各自轮到时重新分组计算)
+                    members = [(member, window) for member, window in batches[node_id] if member >= node_id and (required is None or member in required) and not (preloaded and member in preloaded)]
+                    batched.update(self._evaluate_batch(members, values, batch_kernels))
+                    value = batched.pop(node_id)
+                else:
+                    value = self.evaluate_node(node, args, data, ops)
+            except Exception as e:
+                value = _NodeError(e)
+            values.append(value)
+            if profiler is not None:
+                profiler.record_node(node_id, node, args, value, time.perf_counter() - start)
+        return values
+
+    def evaluate(self, data, ops, profiler=None, batch_kernels=None, fused_evaluate=None):
+        # 计算全部节点后分发到各因子
+        return self.collect(self.evaluate_nodes(data, ops, profiler, batch_kernels, fused_evaluate=fused_evaluate))
+
+    def collect(self, values):
+        # 全部节点的取值 -> (因子结果, 因子异常)
+        results, errors = {}, dict(self.errors)
+        for alpha_name, node_id in self.outputs.items():
+            value = values[node_id]
+            if isinstance(value, _NodeError):
+                errors[alpha_name] = value.error
+            else:
+                results[alpha_name] = value
+        return results, errors
+
+
+class _NodeError:
+    # 节点计算失败的标记, 依赖该节点的因子统一视为失败
+    __slots__ = ("error",)
+
+    def __init__(self, error):
+        # 不保留traceback: traceback引用的栈帧持有全部节点的取值, 形成引用环时这些中间结果要等到垃圾回收才能释放
+        self.error = error.with_traceback(None)
@@ -0,0 +1,504 @@
+import numpy as np
+import pandas as pd
+
+# 向量化滑动窗口算子: 输入为一维(n_dates,)或面板(n_dates, n_codes)数组, 统一沿axis=0计算,
+# 与pandas rolling(window)默认行为保持一致: ±inf视为NaN, 前window-1行及窗口内含NaN的位置输出NaN
+# float32输入(见AlphaExpressionExcutor.set_precision)按float32计算, 其余输入按float64计算
+# 窗口累加: 不超过WINDOW_LAG_LIMIT的窗口逐滞后期累加(每个输出只依赖自身窗口, 分段/增量计算与整段计算逐位一致),
+# 更长的窗口用分段前缀和(O(n), 与窗口长度无关), 分段/增量计算与整段计算只差舍入误差(相对误差~1e-15)
+# 窗口最大/最小值与排名没有舍入误差: 长窗口分别用分块前缀/后缀极值(O(n))与有序结构(O(n·log(window)))计算, 结果与逐滞后期比较逐位一致
+
+WINDOW_LAG_LIMIT = 20
+
+
+def float_values(array):
+    # float32保持float32, 其余(float64/整数/bool)转为float64
+    array = np.asarray(array)
+    return array.astype(np.float32 if array.dtype == np.float32 else np.float64, copy=False)
+
+
+def prep_values(array):
+    # 转为浮点数组, 并与pandas rolling一样将±inf视为缺失值
+    array = float_values(array)
+    return np.where(np.isinf(array), np.nan, array)
+
+
+def incomplete_window_mask(array, window):
+    # 窗口不完整(前window-1行)或窗口内包含NaN的位置为True
+    nan_count = np.cumsum(np.isnan(array), axis=0)
+    mask = np.ones(array.shape, dtype=bool)
+    if window <= len(array):
+        window_nan_count = nan_count[window - 1 :].copy()
+        window_nan_count[1:] -= nan_count[: len(array) - window]
+        mask[window - 1 :] = window_nan_count > 0
+    return mask
+
+
+def _check_windows(windows):
+    windows = sorted(set(int(window) for window in windows))
+    if not windows or windows[0] < 1:
+        raise ValueError("window must be an integer 1 or greater")
+    return windows
+
+
+def _window_segments(n, window):
+    # 长窗口的分段: (前缀和起点, 输出起点, 输出终点), 每段输出window行, 前缀和从该段第一个窗口的起点开始(最多2*window-1行),
+    # 舍入误差只与段内的值有关, 不随历史长度累积; 分段只由n与window决定, 与同批计算的其他窗口无关
+    for start in range(window - 1, n, window):
+        yield start - window + 1, start, min(start + window, n)
+
+
+def _local_prefix(block):
+    # 段内前缀和(float64累加), 首行为0: prefix[k]为前k行之和
+    prefix = np.zeros((len(block) + 1,) + block.shape[1:], dtype=np.float64)
+    np.cumsum(block, axis=0, out=prefix[1:])
+    return prefix
+
+
+def _window_differences(prefix, lo, start, end, window):
+    # 由段内前缀和相减得到输出行[start, end)的窗口和
+    return prefix[start + 1 - lo : end + 1 - lo] - prefix[start + 1 - window - lo : end + 1 - window - lo]
+
+
+def _segment_deviations(block):
+    # 段内以各列(非NaN值的)均值为基准的离差(float64, NaN记为0): 基准接近段内各窗口的均值, 减小Σd²-(Σd)²/w的相减抵消
+    valid = ~np.isnan(block)
+    filled = np.where(valid, block, 0).astype(np.float64)
+    anchor = filled.sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+    return np.where(valid, filled - anchor, 0)
+
+
+def constant_window_mask(array, window):
+    # 窗口内全部值相同的位置为True: 按相邻两行不相等的次数(整数累加, 没有舍入误差)判断, 含NaN的窗口不视为常数
+    changes = np.zeros(array.shape, dtype=np.int64)
+    np.cumsum(array[1:] != array[:-1], axis=0, out=changes[1:])
+    mask = np.zeros(array.shape, dtype=bool)
+    if window <= len(array):
+        mask[window - 1 :] = changes[window - 1 :] == changes[: len(array) - window + 1]
+    return mask
+
+
+def rolling_sum_windows(array, windows):
+    # 短窗口逐滞后期累加窗口内的值, 累加到第w个滞后期即得到窗口w的结果: 同一输入的多个短窗口只需遍历一次
+    # 长窗口(大于WINDOW_LAG_LIMIT)由分段前缀和相减得到, 窗口内的NaN记为0累加, 再按NaN计数标记
+    # pandas的rolling sum/mean/var为带删除的累计算法, 舍入误差随历史长度累积, 常数窗口的方差也可能不为0
+    windows = _check_windows(windows)
+    array = prep_values(array)
+    results = {window: np.full(array.shape, np.nan, dtype=array.dtype) for window in windows}
+    n = len(array)
+    short_windows = [window for window in windows if window <= WINDOW_LAG_LIMIT]
+    if short_windows:
+        total = array.copy()
+        for lag in range(min(short_windows[-1], n)):
+            if lag:
+                total[lag:] += array[: n - lag]
+            if lag + 1 in results:
+                results[lag + 1][lag:] = total[lag:]
+    long_windows = [window for window in windows if window > WINDOW_LAG_LIMIT]
+    if long_windows:
+        filled = np.where(np.isnan(array), 0, array)
+        for window in long_windows:
+            for lo, start, end in _window_segments(n, window):
+                results[window][start:end] = _window_differences(_local_prefix(filled[lo:end]), lo, start, end, window)
+            results[window][incomplete_window_mask(array, window)] = np.nan
+    return results
+
+
+def rolling_sum(array, window):
+    return rolling_sum_windows(array, [window])[window]
+
+
+def rolling_mean(array, window):
+    return rolling_sum(array, window) / window
+
+
+def rolling_comoments_windows(array1, array2, windows):
+    # 窗口内的离差平方和/离差乘积和: 短窗口以窗口最后一个值为基准做差d再累加Σd1/Σd2/Σd1d2, 长窗口用分段前缀和(见_comoments_segments),
+    # 常数窗口的离差严格为0; 返回 窗口 -> (ss1, ss2, ss12), 任一序列在窗口内含NaN时为NaN; 多个窗口共享同一遍累加
+    array1, array2 = prep_values(array1), prep_values(array2)
+    dtype = np.result_type(array1, array2)
+    array1, array2 = np.broadcast_arrays(array1.astype(dtype, copy=False), array2.astype(dtype, copy=False))
+    return _comoments_shared([array1, array2], [(0, 0, 1, windows)])[0]
+
+
+def rolling_comoments(array1, array2, window):
+    return rolling_comoments_windows(array1, array2, [window])[window]
+
+
+def rolling_comoments_pairs(arrays, pairs):
+    # rolling_comoments_windows的批量版本: arrays为输入序列列表, pairs为(序列编号1, 序列编号2, 窗口列表), 返回与pairs对应的 窗口 -> (ss1, ss2, ss12)
+    # 同一序列无论出现在多少个序列对中, 每个窗口只累加一次Σd/Σd², 每个序列对只额外累加Σd1d2(std为序列与自身的序列对, 不需要额外累加)
+    # 各窗口的结果只由序列与窗口决定, 与逐对调用rolling_comoments_windows逐位一致
+    # 形状/精度相同的序列一起计算, 其余(如与标量配对)逐对计算
+    values = [prep_values(array) for array in arrays]
+    results = [None] * len(pairs)
+    groups = {}
+    for index, (i, j, windows) in enumerate(pairs):
+        if values[i].ndim and values[i].shape == values[j].shape and values[i].dtype == values[j].dtype:
+            groups.setdefault((values[i].shape, values[i].dtype.str), []).append(index)
+        else:
+            results[index] = rolling_comoments_windows(values[i], values[j], windows)
+    for indexes in groups.values():
+        for index, comoments in _comoments_shared(values, [(index, *pairs[index]) for index in indexes]).items():
+            results[index] = comoments
+    return results
+
+
+def _comoments_shared(values, pairs):
+    # pairs为(结果编号, 序列编号1, 序列编号2, 窗口列表), 各序列形状与精度相同; 短窗口逐滞后期累加, 长窗口(大于WINDOW_LAG_LIMIT)用分段前缀和
+    pairs = [(index, i, j, _check_windows(windows)) for index, i, j, windows in pairs]
+    results = {index: {} for index, _, _, _ in pairs}
+    short_pairs = [(index, i, j, [window for window in windows if window <= WINDOW_LAG_LIMIT]) for index, i, j, windows in pairs]
+    long_pairs = [(index, i, j, [window for window in windows if window > WINDOW_LAG_LIMIT]) for index, i, j, windows in pairs]
+    _comoments_lags(values, [pair for pair in short_pairs if pair[3]], results)
+    _comoments_segments(values, [pair for pair in long_pairs if pair[3]], results)
+    return results
+
+
+def _comoments_lags(values, pairs, results):
+    # 逐滞后期累加: 每个窗口以自身最后一个值为基准做差(逐窗口重新锚定), 每个输出只依赖自身窗口(分段/增量计算逐位一致)
+    if not pairs:
+        return
+    spans = {}  # 序列编号 -> 需要累加的最大窗口
+    for _, i, j, windows in pairs:
+        spans[i], spans[j] = max(spans.get(i, 0), windows[-1]), max(spans.get(j, 0), windows[-1])
+    n = len(values[pairs[0][1]])
+    sum1 = {i: values[i] - values[i] for i in spans}  # 当前值自身的离差为0(NaN保持NaN)
+    sum11 = {i: total.copy() for i, total in sum1.items()}
+    sum12 = {index: sum1[i] + sum1[j] for index, i, j, _ in pairs if i != j}
+    moments = {}  # (序列编号, 窗口) -> 离差平方和, 多个序列对共用
+    for lag in range(max(spans.values())):
+        if lag < n and lag:
+            deviations = {}
+            for i, span in spans.items():
+                if span > lag:
+                    deviations[i] = values[i][: n - lag] - values[i][lag:]
+                    sum1[i][lag:] += deviations[i]
+                    sum11[i][lag:] += deviations[i] * deviations[i]
+            for index, i, j, windows in pairs:
+                if i != j and windows[-1] > lag:
+                    sum12[index][lag:] += deviations[i] * deviations[j]
+        window = lag + 1
+        for index, i, j, windows in pairs:
+            if window not in windows:
+                continue
+            for k in (i, j):
+                if (k, window) not in moments:
+                    moments[(k, window)] = np.full(values[k].shape, np.nan, dtype=values[k].dtype)
+                    moments[(k, window)][lag:] = np.maximum(sum11[k][lag:] - sum1[k][lag:] * sum1[k][lag:] / window, 0)
+            ss12 = np.full(values[i].shape, np.nan, dtype=values[i].dtype)
+            ss12[lag:] = (sum12[index] if i != j else sum11[i])[lag:] - sum1[i][lag:] * sum1[j][lag:] / window
+            results[index][window] = (moments[(i, window)], moments[(j, window)], ss12)
+
+
+def _comoments_segments(values, pairs, results):
+    # 长窗口: 按窗口分段(见_window_segments), 段内以各列均值为基准做差d, 由段内前缀和相减得到Σd/Σd²/Σd1d2, O(n)
+    # 每个(序列, 窗口)的Σd/Σd²只计算一次, 多个序列对共用; 常数窗口的离差平方和/离差乘积和为0(与逐滞后期累加一致), 含NaN时为NaN
+    members = {}  # 窗口 -> [(结果编号, 序列编号1, 序列编号2)]
+    for index, i, j, windows in pairs:
+        for window in windows:
+            members.setdefault(window, []).append((index, i, j))
+    for window, window_pairs in members.items():
+        series = sorted({k for _, i, j in window_pairs for k in (i, j)})
+        moments = {k: np.full(values[k].shape, np.nan, dtype=values[k].dtype) for k in series}
+        cross = {index: np.full(values[i].shape, np.nan, dtype=values[i].dtype) for index, i, j in window_pairs}
+        for lo, start, end in _window_segments(len(values[series[0]]), window):
+            deviations, sums, squares = {}, {}, {}
+            for k in series:
+                deviations[k] = _segment_deviations(values[k][lo:end])
+                sums[k] = _window_differences(_local_prefix(deviations[k]), lo, start, end, window)
+                squares[k] = _window_differences(_local_prefix(deviations[k] * deviations[k]), lo, start, end, window) - sums[k] * sums[k] / window
+                moments[k][start:end] = np.maximum(squares[k], 0)
+            for index, i, j in window_pairs:
+                if i == j:
+                    cross[index][start:end] = squares[i]
+                else:
+                    cross[index][start:end] = _window_differences(_local_prefix(deviations[i] * deviations[j]), lo, start, end, window) - sums[i] * sums[j] / window
+        constant = {k: constant_window_mask(values[k], window) for k in series}
+        incomplete = {k: incomplete_window_mask(values[k], window) for k in series}
+        for k in series:
+            moments[k][constant[k]] = 0
+            moments[k][incomplete[k]] = np.nan
+        for index, i, j in window_pairs:
+            cross[index][constant[i] | constant[j]] = 0
+            cross[index][incomplete[i] | incomplete[j]] = np.nan
+            results[index][window] = (moments[i], moments[j], cross[index])
+
+
+def comoments_std(comoments, window):
+    # 样本标准差(ddof=1), 与pandas rolling std一致
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.sqrt(comoments[0] / (window - 1))
+
+
+def comoments_cov(comoments, window):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return comoments[2] / (window - 1)
+
+
+def comoments_corr(comoments, window):
+    # 任一序列在窗口内为常数时相关系数无定义, 输出NaN
+    ss1, ss2, ss12 = comoments
+    denominator = np.sqrt(ss1 * ss2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(denominator > 0, np.clip(ss12 / denominator, -1, 1), np.nan)
+
+
+def rolling_std(array, window):
+    return comoments_std(rolling_comoments(array, array, window), window)
+
+
+def rolling_cov(array1, array2, window):
+    return comoments_cov(rolling_comoments(array1, array2, window), window)
+
+
+def rolling_corr(array1, array2, window):
+    return comoments_corr(rolling_comoments(array1, array2, window), window)
+
+
+def rolling_max_windows(array, windows, reverse=False):
+    # 多个窗口的滚动最大值(reverse=True时为最小值), 窗口内含NaN时为NaN(np.maximum/np.minimum传播NaN)
+    # 短窗口逐滞后期取较大值, 同一输入的多个短窗口只需遍历一次; 长窗口(大于WINDOW_LAG_LIMIT)见_block_extremes
+    windows = _check_windows(windows)
+    array = prep_values(array)
+    results = {window: np.full(array.shape, np.nan, dtype=array.dtype) for window in windows}
+    n = len(array)
+    extreme = np.minimum if reverse else np.maximum
+    short_windows = [window for window in windows if window <= WINDOW_LAG_LIMIT]
+    if short_windows:
+        running = array.copy()
+        for lag in range(min(short_windows[-1], n)):
+            if lag:
+                running[lag:] = extreme(running[lag:], array[: n - lag])
+            if lag + 1 in results:
+                results[lag + 1][lag:] = running[lag:]
+    for window in windows:
+        if window > WINDOW_LAG_LIMIT and window <= n:
+            results[window][window - 1 :] = _block_extremes(array, window, extreme)
+    return results
+
+
+def _block_extremes(array, window, extreme):
+    # van Herk/Gil-Werman: 按window行分块, 块内从前往后/从后往前的累计极值各一遍, 窗口[i-window+1, i]的极值为
+    # 起点所在块的后缀极值与终点所在块的前缀极值中的较大者, O(n)且与窗口长度无关; 返回输出行[window-1, n)的结果
+    n = len(array)
+    blocks = -(-n // window)
+    padded = np.full((blocks * window,) + array.shape[1:], np.nan, dtype=array.dtype)  # 末尾补NaN只影响超出n的窗口
+    padded[:n] = array
+    blocked = padded.reshape((blocks, window) + array.shape[1:])
+    prefix = extreme.accumulate(blocked, axis=1).reshape(padded.shape)
+    suffix = extreme.accumulate(blocked[:, ::-1], axis=1)[:, ::-1].reshape(padded.shape)
+    return extreme(suffix[: n - window + 1], prefix[window - 1 : n])
+
+
+def rolling_min_windows(array, windows):
+    return rolling_max_windows(array, windows, reverse=True)
+
+
+def rolling_max(array, window):
+    return rolling_max_windows(array, [window])[window]
+
+
+def rolling_min(array, window):
+    return rolling_max_windows(array, [window], reverse=True)[window]
+
+
+def rolling_argmax(array, window, reverse=False):
+    # 窗口内最大值(首次出现)相对窗口起点的位置, 稀疏表(倍增)实现, 复杂度O(n·log(window))
+    # reverse=True时计算最小值位置
+    if window < 1:
+        raise ValueError("window must be an integer 1 or greater")
+    array = prep_values(array)
+    result = np.full(array.shape, np.nan, dtype=array.dtype)
+    n = len(array)
+    if window > n:
+        return result
+    values = np.where(np.isnan(array), -np.inf, -array if reverse else array)
+    index = np.broadcast_to(np.arange(n).reshape((n,) + (1,) * (array.ndim - 1)), array.shape)
+    # 逐级倍增: 第k级保存[i, i + 2^k)区间的最大值及其首次出现位置
+    span = 1
+    while span * 2 <= window:
+        level_count = len(values) - span
+        left_values, right_values = values[:level_count], values[span:]
+        take_right = right_values > left_values  # 相等时保留靠前的位置
+        values = np.where(take_right, right_values, left_values)
+        index = np.where(take_right, index[span:], index[:level_count])
+        span *= 2
+    # 窗口[s, s + window)由两个可重叠的2^k区间覆盖
+    start_count = n - window + 1
+    left_values, right_values = values[:start_count], values[window - span : window - span + start_count]
+    take_right = right_values > left_values
+    position = np.where(take_right, index[window - span : window - span + start_count], index[:start_count])
+    result[window - 1 :] = position - np.arange(start_count).reshape((start_count,) + (1,) * (array.ndim - 1))
+    result[incomplete_window_mask(array, window)] = np.nan
+    return result
+
+
+def rolling_argmin(array, window):
+    return rolling_argmax(array, window, reverse=True)
+
+
+def rolling_rank_windows(array, windows, long_rank=None):
+    # 当前值在窗口内的百分位排名(rank(pct=True)的最后一项, 并列取平均名次)
+    # 短窗口逐个滞后期与当前值比较计数, 每个滞后期是一次整表向量运算, 多个窗口共享同一遍计数;
+    # 长窗口(大于WINDOW_LAG_LIMIT)逐个窗口调用long_rank(默认为rolling_rank_sorted, Numba后端为树状数组内核, 见expression_numba)
+    windows = _check_windows(windows)
+    array = prep_values(array)
+    results = {window: np.full(array.shape, np.nan, dtype=array.dtype) for window in windows}
+    n = len(array)
+    short_windows = [window for window in windows if window <= WINDOW_LAG_LIMIT]
+    if short_windows:
+        less_count = np.zeros(array.shape, dtype=array.dtype)
+        equal_count = np.ones(array.shape, dtype=array.dtype)
+        for lag in range(min(short_windows[-1], n)):
+            if lag:
+                less_count[lag:] += array[: n - lag] < array[lag:]
+                equal_count[lag:] += array[: n - lag] == array[lag:]
+            window = lag + 1
+            if window in results:
+                results[window][lag:] = (less_count[lag:] + (equal_count[lag:] + 1) / 2) / window
+                results[window][incomplete_window_mask(array, window)] = np.nan
+    for window in windows:
+        if window > WINDOW_LAG_LIMIT:
+            results[window] = (long_rank or rolling_rank_sorted)(array, window)
+    return results
+
+
+def rolling_rank_sorted(array, window):
+    # pandas的rolling rank基于有序跳表(每步O(log(window))), 名次为整数/半整数, 结果与逐滞后期计数逐位一致
+    array = prep_values(array)
+    frame = pd.DataFrame(array.reshape(len(array), -1))
+    return frame.rolling(window=window).rank(method="average", pct=True).to_numpy(dtype=array.dtype).reshape(array.shape)
+
+
+def rolling_rank(array, window):
+    return rolling_rank_windows(array, [window])[window]
+
+
+def rolling_quantile(array, window, quantile):
+    # pandas的rolling quantile本身是基于有序跳表的增量实现(每步O(log(window))), 这里整块面板一次计算
+    array = prep_values(array)
+    frame = pd.DataFrame(array.reshape(len(array), -1))
+    return frame.rolling(window=window).quantile(quantile).to_numpy(dtype=array.dtype).reshape(array.shape)
+
+
+def rolling_product(array, window):
+    # 窗口内累乘(逐窗口调用np.prod)
+    array = prep_values(array)
+    frame = pd.DataFrame(array.reshape(len(array), -1))
+    return frame.rolling(window=window).apply(np.prod, raw=True).to_numpy(dtype=array.dtype).reshape(array.shape)
+
+
+def rolling_linregress(array, window):
+    # 对x=0..window-1做滚动一元线性回归, 返回斜率/R²/最后一个点的残差(与scipy.stats.linregress一致)
+    # 闭式解: 以窗口最后一个值为基准做差d, 一次遍历滞后期累加Σd/Σd²/Σ(x-x̄)d, 常数窗口的方差严格为0
+    # 长窗口(大于WINDOW_LAG_LIMIT)由分段前缀和得到同样的三个累加量, 见_linregress_segments
+    if window < 2:
+        raise ValueError("window must be an integer 2 or greater")
+    array = prep_values(array)
+    slope, rsquare, resi = (np.full(array.shape, np.nan, dtype=array.dtype) for _ in range(3))
+    n = len(array)
+    if window > WINDOW_LAG_LIMIT:
+        _linregress_segments(array, window, slope, rsquare, resi)
+    elif window <= n:
+        x_center = (np.arange(window) - (window - 1) / 2).astype(array.dtype)  # 中心化的x, 下标0对应窗口最早的值
+        sxx = array.dtype.type(window * (window * window - 1) / 12)
+        current = array[window - 1 :]
+        sum_d = np.zeros(current.shape, dtype=array.dtype)
+        sum_dd = np.zeros(current.shape, dtype=array.dtype)
+        sum_xd = np.zeros(current.shape, dtype=array.dtype)
+        for lag in range(window):
+            d = array[window - 1 - lag : n - lag] - current
+            sum_d += d
+            sum_dd += d * d
+            sum_xd += x_center[window - 1 - lag] * d
+        syy = np.maximum(sum_dd - sum_d * sum_d / window, 0)
+        slope[window - 1 :] = sum_xd / sxx
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rsquare[window - 1 :] = np.where(syy > 0, np.minimum(sum_xd * sum_xd / (sxx * syy), 1), np.nan)  # 常数窗口与linregress一致输出NaN
+        resi[window - 1 :] = -sum_d / window - slope[window - 1 :] * (window - 1) / 2
+    return {"slope": slope, "rsquare": rsquare, "resi": resi}
+
+
+def _linregress_segments(array, window, slope, rsquare, resi):
+    # 每段以段内均值为基准做差d, 由段内前缀和相减得到Σd/Σd²/Σk·d(k为段内行号), Σ(x-x̄)d = Σk·d - (e-(w-1)/2)·Σd(e为窗口最后一行的段内行号), O(n)
+    # 常数窗口与逐滞后期累加一致: 斜率/残差为0, R²为NaN; 窗口不完整或含NaN时为NaN
+    sxx = window * (window * window - 1) / 12
+    for lo, start, end in _window_segments(len(array), window):
+        d = _segment_deviations(array[lo:end])
+        rows = np.arange(len(d), dtype=np.float64).reshape((-1,) + (1,) * (d.ndim - 1))
+        sum_d = _window_differences(_local_prefix(d), lo, start, end, window)
+        sum_dd = _window_differences(_local_prefix(d * d), lo, start, end, window)
+        sum_xd = _window_differences(_local_prefix(rows * d), lo, start, end, window) - (rows[start - lo :] - (window - 1) / 2) * sum_d
+        syy = np.maximum(sum_dd - sum_d * sum_d / window, 0)
+        slope[start:end] = sum_xd / sxx
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rsquare[start:end] = np.where(syy > 0, np.minimum(sum_xd * sum_xd / (sxx * syy), 1), np.nan)
+        resi[start:end] = d[start - lo :] - sum_d / window - sum_xd / sxx * (window - 1) / 2  # 最后一个点的离差减去窗口均值的离差与拟合值
+    constant = constant_window_mask(array, window)
+    slope[constant], rsquare[constant], resi[constant] = 0, np.nan, 0
+    incomplete = incomplete_window_mask(array, window)
+    slope[incomplete], rsquare[incomplete], resi[incomplete] = np.nan, np.nan, np.nan
+
+
+def rolling_weighted_mean(array, weights):
+    # 固定权重的滚动加权平均(weights[0]对应窗口最早的值), 等价于对整列做一次有限长卷积
+    # 逐滞后期整表累加, 每个输出只依赖自身窗口内的数据
+    window = len(weights)
+    if window < 1:
+        raise ValueError("window must be an integer 1 or greater")
+    array = prep_values(array)
+    weights = np.asarray(weights, dtype=np.float64).astype(array.dtype)
+    result = np.full(array.shape, np.nan, dtype=array.dtype)
+    n = len(array)
+    if window > n:
+        return result
+    total = np.zeros(array[window - 1 :].shape, dtype=array.dtype)
+    for lag in range(window):
+        total += weights[window - 1 - lag] * array[window - 1 - lag : n - lag]
+    result[window - 1 :] = total / np.sum(weights)
+    return result
+
+
+# ------------------------------------------
+# 截面算子: 面板每一行(同一交易日的全部股票)内计算, 忽略NaN
+
+
+def cross_section_rank(array):
+    array = float_values(array)
+    return pd.DataFrame(np.atleast_2d(array)).rank(axis=1, pct=True).to_numpy(dtype=array.dtype).reshape(array.shape)
+
+
+def cross_section_nansum(array):
+    # 每行非NaN值之和(保留最后一维): 按股票顺序依次累加(float64), 结果与面板行数无关(逐日增量计算与整段计算逐位一致);
+    # np.nansum的累加顺序随数组形状变化(单行为成对求和, 多行时按列向量化累加), 同一行在两种形状下相差~1e-16
+    return np.cumsum(np.where(np.isnan(array), 0, array), axis=-1, dtype=np.float64)[..., -1:].astype(array.dtype)
+
+
+def cross_section_scale(array, factor=1):
+    # 缩放使每行绝对值之和等于factor
+    array = float_values(array)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return array * (factor / cross_section_nansum(np.abs(array)))
+
+
+def cross_section_demean(array):
+    array = float_values(array)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return array - cross_section_nansum(array) / np.sum(~np.isnan(array), axis=-1, keepdims=True)
+
+
+def cross_section_group_demean(array, groups):
+    # 每行按分组(行业)去均值, groups为长度n_codes的整数分组编号
+    # 分组求和对(行, 分组)编号做一次bincount, 按股票顺序累加, 结果与面板行数无关(逐日增量计算与整段计算一致)
+    array = float_values(array)
+    groups = np.asarray(groups, dtype=np.int64)
+    rows = np.atleast_2d(array)
+    group_count_per_row = groups.max() + 1
+    bins = (np.arange(len(rows))[:, np.newaxis] * group_count_per_row + groups).ravel()
+    valid = ~np.isnan(rows)
+    group_sum = np.bincount(bins, weights=np.where(valid, rows, 0).ravel(), minlength=len(rows) * group_count_per_row)
+    group_count = np.bincount(bins, weights=valid.ravel(), minlength=len(rows) * group_count_per_row)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        group_mean = (group_sum / group_count).reshape(len(rows), group_count_per_row).astype(array.dtype)
+    return (rows - group_mean[:, groups]).reshape(array.shape)
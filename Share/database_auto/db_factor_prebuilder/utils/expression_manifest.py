@@ -0,0 +1,42 @@
+import os
+import json
+
+# 因子库的dry-run清单(由expression_dryrun生成)的读写与按清单跳过因子
+# 只依赖标准库, 入库流程(PrebuilderFactor)导入本模块时不加载dry-run/基准/校验等离线工具
+
+MANIFEST_DIR = "./db_factor_prebuilder/factor_ref"
+MANIFEST_SECTIONS = ("skip", "quarantine")
+
+
+def manifest_path(alpha_dict_path, manifest_dir=MANIFEST_DIR):
+    # 因子库对应的清单文件: factor_lib/alpha_191.json -> {manifest_dir}/alpha_191_manifest.json
+    library_name = os.path.splitext(os.path.basename(alpha_dict_path))[0]
+    return os.path.join(manifest_dir, f"{library_name}_manifest.json")
+
+
+def save_manifest(manifest, path):
+    # 只保存各部分的 因子 -> 原因/表达式, 不含生成时间与耗时(重新dry-run时只有清单内容变化才产生差异)
+    with open(path, "w") as f:
+        json.dump({section: manifest[section] for section in MANIFEST_SECTIONS}, f, indent=2, ensure_ascii=False)
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def manifest_exclusions(manifest, alpha_dict_path, excutor, exclude_quarantine=False):
+    # 清单中需要跳过的因子: alpha_name -> 原因; 默认只跳过skip中的因子, exclude_quarantine=True时同时跳过quarantine中的因子
+    # 只跳过表达式与当前因子库一致的因子(修改过的表达式需要重新dry-run)
+    if manifest is None:
+        return {}
+    sections = ("skip", "quarantine") if exclude_quarantine else ("skip",)
+    alpha_plan_dict = excutor.compile_library(alpha_dict_path)
+    return {
+        alpha_name: entry["reason"]
+        for section in sections
+        for alpha_name, entry in manifest.get(section, {}).items()
+        if alpha_name in alpha_plan_dict and alpha_plan_dict[alpha_name].source == entry["expression"]
+    }
@@ -0,0 +1,413 @@
+import os
+import ast
+import copy
+import json
+import time
+import hashlib
+import datetime
+import numpy as np
+
+from collections import OrderedDict
+from .expression_graph import AlphaExpressionGraph, _NodeError
+from .expression_scheduler import AlphaGraphScheduler
+from .expression_kernels import cross_section_rank
+from .expression_excutor import AlphaExpressionExcutor
+
+# 遗传规划因子挖掘(在Share/database_auto目录下运行, 模拟行情上的吞吐量测试):
+#   python -m db_factor_prebuilder.utils.expression_miner
+# 个体为表达式语法树(与因子库表达式同一语法), 由AlphaBaseOperations中的算子、四则运算、行情字段和窗口常量组成,
+# 每代在面板模式下计算全部新个体(整代构建为一张共享DAG, 相同子表达式只算一次, 按DAG并行调度; 精度与内核后端与执行器一致),
+# 以截面rank IC(因子与未来收益的逐日Spearman相关系数)的均值评分; 已评分的表达式跨代复用评分, 部分子表达式(不超过cache_bytes)
+# 按LRU保留在内存中, 下一代包含相同子树时直接读取
+# 交易日分为样本内(前1-holdout)与样本外(后holdout): 适应度只用样本内IC, 入选因子库须在样本外IC同号且不低于min_ic
+# 挖掘结果保存为因子库JSON(factor_lib/, 因子名由表达式的哈希决定), 评分明细保存在factor_ref/
+
+MINER_FIELDS = ("open", "high", "low", "close", "volume", "amount", "vwap", "returns")
+MINER_WINDOWS = (3, 5, 10, 20, 40, 60)
+# 算子名称 -> 参数类型("series"为子表达式, "window"为窗口常量), 只收录面板模式与单只股票模式都支持的算子
+MINER_OPERATORS = {
+    "rank": ("series",),
+    "abs": ("series",),
+    "sign": ("series",),
+    "max": ("series", "series"),
+    "min": ("series", "series"),
+    "mean": ("series", "window"),
+    "std": ("series", "window"),
+    "sum": ("series", "window"),
+    "tsmax": ("series", "window"),
+    "tsmin": ("series", "window"),
+    "tsrank": ("series", "window"),
+    "tsargmax": ("series", "window"),
+    "tsargmin": ("series", "window"),
+    "decaylinear": ("series", "window"),
+    "wma": ("series", "window"),
+    "diff": ("series", "window"),
+    "shift": ("series", "window"),
+    "slope": ("series", "window"),
+    "rsquare": ("series", "window"),
+    "correlation": ("series", "series", "window"),
+    "covariance": ("series", "series", "window"),
+}
+MINER_BINARY_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div)
+MINER_LIBRARY = "./db_factor_prebuilder/factor_lib/alpha_gp.json"
+MINER_REPORT_DIR = "./db_factor_prebuilder/factor_ref"
+
+
+class AlphaFactorMiner:
+    # 遗传规划: 随机生成初始种群(深度2~max_depth), 每代保留精英, 其余个体由锦标赛选出的父代交叉(交换子树)/变异(替换子树、更换算子或窗口、提升子树)产生
+    # 适应度 = |样本内rank IC均值| - parsimony * 节点数; 计算失败、常数、样本内有效交易日不足min_coverage的个体适应度为-inf
+    # 只使用当日及以前的数据(shift/diff的周期为正), 未来收益只用于评分
+    def __init__(
+        self,
+        excutor=None,
+        population_size=500,
+        max_depth=4,
+        tournament_size=5,
+        elite_size=20,
+        crossover_rate=0.6,
+        mutation_rate=0.35,
+        parsimony=0.0005,
+        horizon=1,
+        min_codes=10,
+        min_coverage=0.5,
+        holdout=0.3,
+        batch_size=100,
+        cache_bytes=1024**3,
+        max_workers=None,
+        seed=2024,
+    ):
+        self.excutor = excutor or AlphaExpressionExcutor()
+        self.operators = {name: kinds for name, kinds in MINER_OPERATORS.items() if name in self.excutor.panel_op_funcs}
+        self.population_size = population_size
+        self.max_depth = max_depth
+        self.tournament_size = tournament_size
+        self.elite_size = elite_size
+        self.crossover_rate = crossover_rate
+        self.mutation_rate = mutation_rate
+        self.parsimony = parsimony
+        self.horizon = horizon  # 未来收益的交易日数
+        self.min_codes = min_codes  # 计算当日IC所需的最少股票数
+        self.min_coverage = min_coverage  # 有IC的交易日占比下限
+        self.holdout = holdout  # 样本外(最后的)交易日占比, 只用于筛选入选因子, 不参与适应度
+        self.batch_size = batch_size  # 一张DAG中的新个体数
+        self.cache_bytes = cache_bytes  # 子表达式结果缓存的容量, 也是计算中为缓存额外保留的中间结果的上限
+        self.scheduler = AlphaGraphScheduler(max_workers)
+        self.rng = np.random.default_rng(seed)
+        self.scores = {}  # 规范化表达式 -> 评分, 跨代复用
+        self.history = []  # 每代的统计
+        self._cache = OrderedDict()  # (精度, 内核后端, 子表达式label) -> 面板结果(LRU)
+        self._cached_bytes = 0
+        self.cache_hits = 0
+
+    # 语法树生成与变换------------------------------------------
+    def random_tree(self, depth, full=False):
+        # 随机表达式(深度不超过depth): full=True时每个分支都长到depth, 否则提前以字段结束
+        if depth <= 1 or (not full and self.rng.random() < 0.3):
+            return ast.Name(id=str(self.rng.choice(MINER_FIELDS)), ctx=ast.Load())
+        names = list(self.operators)
+        choice = int(self.rng.integers(len(names) + len(MINER_BINARY_OPERATORS)))
+        if choice >= len(names):
+            return ast.BinOp(left=self.random_tree(depth - 1, full), op=MINER_BINARY_OPERATORS[choice - len(names)](), right=self.random_tree(depth - 1, full))
+        args = [self.random_tree(depth - 1, full) if kind == "series" else ast.Constant(value=int(self.rng.choice(MINER_WINDOWS))) for kind in self.operators[names[choice]]]
+        return ast.Call(func=ast.Name(id=names[choice], ctx=ast.Load()), args=args, keywords=[])
+
+    def random_expression(self):
+        # ramped half-and-half: 深度在2~max_depth之间均匀分布, 一半完全生长
+        return ast.Expression(body=self.random_tree(int(self.rng.integers(2, self.max_depth + 1)), full=bool(self.rng.random() < 0.5)))
+
+    @staticmethod
+    def depth(node):
+        if isinstance(node, ast.BinOp):
+            return 1 + max(AlphaFactorMiner.depth(node.left), AlphaFactorMiner.depth(node.right))
+        if isinstance(node, ast.Call):
+            return 1 + max((AlphaFactorMiner.depth(arg) for arg in node.args if not isinstance(arg, ast.Constant)), default=0)
+        return 1
+
+    @staticmethod
+    def positions(expression):
+        # 全部子表达式的位置(所属节点, 属性名, 下标), 窗口常量不作为子表达式
+        positions, stack = [], [(expression, "body", None)]
+        while stack:
+            position = stack.pop()
+            node = AlphaFactorMiner.get(position)
+            positions.append(position)
+            if isinstance(node, ast.BinOp):
+                stack += [(node, "left", None), (node, "right", None)]
+            elif isinstance(node, ast.Call):
+                stack += [(node, "args", index) for index, arg in enumerate(node.args) if not isinstance(arg, ast.Constant)]
+        return positions
+
+    @staticmethod
+    def get(position):
+        owner, attr, index = position
+        return getattr(owner, attr) if index is None else getattr(owner, attr)[index]
+
+    @staticmethod
+    def put(position, node):
+        owner, attr, index = position
+        if index is None:
+            setattr(owner, attr, node)
+        else:
+            getattr(owner, attr)[index] = node
+
+    def _pick(self, items):
+        return items[int(self.rng.integers(len(items)))]
+
+    def crossover(self, parent1, parent2):
+        # 父代1的随机子树替换为父代2的随机子树
+        child = copy.deepcopy(parent1)
+        self.put(self._pick(self.positions(child)), copy.deepcopy(self.get(self._pick(self.positions(parent2)))))
+        return child
+
+    def mutate(self, parent):
+        child = copy.deepcopy(parent)
+        position = self._pick(self.positions(child))
+        node, kind = self.get(position), self.rng.random()
+        if kind < 0.4:
+            # 子树替换为随机子树
+            self.put(position, self.random_tree(int(self.rng.integers(1, 3))))
+        elif kind < 0.8 and isinstance(node, ast.Call):
+            # 更换窗口, 或更换为参数类型相同的算子
+            windows = [index for index, arg in enumerate(node.args) if isinstance(arg, ast.Constant)]
+            if windows and self.rng.random() < 0.5:
+                node.args[self._pick(windows)] = ast.Constant(value=int(self.rng.choice(MINER_WINDOWS)))
+            else:
+                node.func.id = self._pick([name for name, kinds in self.operators.items() if kinds == self.operators[node.func.id]])
+        elif kind < 0.8 and isinstance(node, ast.BinOp):
+            node.op = self._pick(MINER_BINARY_OPERATORS)()
+        elif kind < 0.8:
+            node.id = str(self.rng.choice(MINER_FIELDS))
+        else:
+            # 提升: 以随机子树作为整个表达式
+            child.body = copy.deepcopy(node)
+        return child
+
+    def offspring(self, population, fitness):
+        # 由锦标赛选出的父代产生一个子代, 超过max_depth时重新产生(多次失败时复制父代)
+        parent = population[self._tournament(fitness)]
+        for _ in range(10):
+            draw = self.rng.random()
+            if draw < self.crossover_rate:
+                child = self.crossover(parent, population[self._tournament(fitness)])
+            elif draw < self.crossover_rate + self.mutation_rate:
+                child = self.mutate(parent)
+            else:
+                return copy.deepcopy(parent)
+            if self.depth(child.body) <= self.max_depth:
+                return child
+        return copy.deepcopy(parent)
+
+    def _tournament(self, fitness):
+        contestants = self.rng.integers(len(fitness), size=self.tournament_size)
+        return int(max(contestants, key=lambda index: fitness[index]))
+
+    # 评分------------------------------------------
+    def forward_returns(self, panel):
+        # 未来horizon个交易日的收益(最后horizon行为NaN)
+        close = np.asarray(panel["close"], dtype=np.float64)
+        forward = np.full(close.shape, np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            forward[: -self.horizon] = close[self.horizon :] / close[: -self.horizon] - 1
+        return forward
+
+    def rank_ic(self, factor, forward):
+        # 逐日截面rank IC: 两者都有限的股票上的Spearman相关系数, 股票数不足min_codes或截面为常数的交易日为NaN
+        factor = np.broadcast_to(np.asarray(factor, dtype=np.float64), forward.shape)
+        valid = np.isfinite(factor) & np.isfinite(forward)
+        x, y = cross_section_rank(np.where(valid, factor, np.nan)), cross_section_rank(np.where(valid, forward, np.nan))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            x, y = x - np.nanmean(x, axis=1, keepdims=True), y - np.nanmean(y, axis=1, keepdims=True)
+            ic = np.nansum(x * y, axis=1) / np.sqrt(np.nansum(x * x, axis=1) * np.nansum(y * y, axis=1))
+        ic[valid.sum(axis=1) < self.min_codes] = np.nan
+        return ic
+
+    def holdout_start(self, n_dates):
+        # 样本外的第一个交易日; 样本内只使用未来收益不进入样本外的交易日(最后horizon个交易日的IC不使用)
+        return n_dates - int(round(n_dates * self.holdout))
+
+    def score(self, expression, value, forward):
+        size = sum(1 for node in ast.walk(ast.parse(expression, mode="eval")) if isinstance(node, (ast.BinOp, ast.UnaryOp, ast.Call, ast.Name)))
+        result = {"expression": expression, "size": size, "mean_ic": None, "icir": None, "coverage": 0.0, "holdout_ic": None, "fitness": -np.inf, "error": None}
+        if isinstance(value, _NodeError):
+            result["error"] = repr(value.error)
+            return result
+        ic = self.rank_ic(value, forward)
+        split = self.holdout_start(len(ic))
+        train, test = ic[: max(split - self.horizon, 0)], ic[split:]
+        observed = np.isfinite(train)
+        result["coverage"] = float(observed.mean()) if len(train) else 0.0
+        if result["coverage"] >= self.min_coverage:
+            mean_ic, std_ic = float(np.mean(train[observed])), float(np.std(train[observed]))
+            result["mean_ic"], result["icir"] = mean_ic, mean_ic / std_ic if std_ic > 0 else 0.0
+            result["fitness"] = abs(mean_ic) - self.parsimony * size
+            if len(test) and np.isfinite(test).mean() >= self.min_coverage:
+                result["holdout_ic"] = float(np.nanmean(test))
+        return result
+
+    def _remember(self, label, value):
+        # 子表达式结果放入LRU缓存, 超出容量时淘汰最久未使用的结果
+        if label in self._cache or value.nbytes > self.cache_bytes:
+            return
+        self._cache[label] = value
+        self._cached_bytes += value.nbytes
+        while self._cached_bytes > self.cache_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= evicted.nbytes
+
+    def evaluate_population(self, population, data, forward, context=None):
+        # 返回每个个体的评分; 新的表达式按batch_size构建为共享DAG在面板模式下计算(context为执行器的计算上下文, 决定精度与内核后端),
+        # 已缓存的子表达式作为已有结果读入; 计算中只额外保留要放入缓存的中间结果(不超过cache_bytes), 其余用完即释放
+        context = context or self.excutor.execution_context()
+        plans, keys = {}, []
+        for expression in population:
+            plan = self.excutor.compile(ast.unparse(expression))
+            key = None if plan.error is not None or plan.constant is not None else ast.unparse(plan.tree)  # 化简后的规范表达式
+            if key is not None and key not in self.scores:
+                plans[key] = plan
+            keys.append(key)
+        shape = forward.shape
+        node_bytes = shape[0] * shape[1] * np.dtype(context.dtype).itemsize
+        new_keys = list(plans)
+        for start in range(0, len(new_keys), self.batch_size):
+            batch = new_keys[start : start + self.batch_size]
+            graph = AlphaExpressionGraph({key: plans[key] for key in batch}, self.excutor.op_names)
+            preloaded, required, stack = {}, set(), list(dict.fromkeys(graph.outputs.values()))
+            while stack:
+                node_id = stack.pop()
+                if node_id in required or node_id in preloaded:
+                    continue
+                cache_key = (context.precision, context.kernel_backend, graph.labels[node_id])
+                if cache_key in self._cache:
+                    self._cache.move_to_end(cache_key)
+                    preloaded[node_id] = self._cache[cache_key]
+                    self.cache_hits += 1
+                    continue
+                required.add(node_id)
+                stack.extend(graph.nodes[node_id].args)
+            # 放入缓存的中间结果: 按节点编号(子树由小到大)取前cache_bytes / 面板大小个, 只有这些节点在计算中不释放
+            cached = [node_id for node_id in sorted(required) if graph.nodes[node_id].kind not in ("field", "const")][: self.cache_bytes // node_bytes]
+            values = self.scheduler.evaluate_nodes(
+                graph,
+                data,
+                context.ops,
+                batch_kernels=context.batch_kernels,
+                fused_evaluate=context.fused_evaluate,
+                preloaded=preloaded,
+                required=required,
+                keep=cached,
+            )
+            for node_id in cached:
+                if isinstance(values[node_id], np.ndarray) and values[node_id].shape == shape:
+                    self._remember((context.precision, context.kernel_backend, graph.labels[node_id]), values[node_id])
+            for key in batch:
+                value = values[graph.outputs[key]] if key in graph.outputs else _NodeError(graph.errors.get(key))
+                self.scores[key] = self.score(key, value, forward)
+        invalid = {"fitness": -np.inf}
+        return [self.scores[key] if key is not None else invalid for key in keys]
+
+    # 进化------------------------------------------
+    def mine(self, panel, generations=10, verbose=True):
+        # panel为build_panel输出格式的行情面板(可含industry), 返回按适应度排序的评分
+        # 精度与内核后端在开始时读取一次(见AlphaExpressionExcutor.execution_context), 行情面板转为该精度
+        context = self.excutor.execution_context()
+        data = {field.lower(): np.asarray(array, dtype=context.dtype) if np.ndim(array) == 2 else array for field, array in panel.items()}
+        forward = self.forward_returns(panel)
+        population = [self.random_expression() for _ in range(self.population_size)]
+        for generation in range(generations):
+            start, scored = time.perf_counter(), len(self.scores)
+            scores = self.evaluate_population(population, data, forward, context)
+            fitness = [score["fitness"] for score in scores]
+            seconds = time.perf_counter() - start
+            finite = [value for value in fitness if np.isfinite(value)]
+            stats = {
+                "generation": generation,
+                "candidates": len(self.scores) - scored,  # 本代新计算的表达式数
+                "seconds": seconds,
+                "candidates_per_minute": (len(self.scores) - scored) / seconds * 60 if seconds > 0 else 0.0,
+                "best_fitness": max(finite, default=None),
+                "median_fitness": float(np.median(finite)) if finite else None,
+                "valid_ratio": len(finite) / len(fitness),
+                "cache_hits": self.cache_hits,
+                "cache_mb": self._cached_bytes / 1024**2,
+            }
+            self.history.append(stats)
+            if verbose:
+                print(
+                    f"第{generation}代: 新表达式{stats['candidates']}个, 耗时{seconds:.1f}s({stats['candidates_per_minute']:.0f}个/分钟),"
+                    f" 最优适应度{stats['best_fitness']}, 有效比例{stats['valid_ratio']:.2f}, 子表达式缓存命中{self.cache_hits}次"
+                )
+            if generation == generations - 1:
+                break
+            # 精英(不重复的表达式)直接进入下一代
+            order = sorted(range(len(population)), key=lambda index: fitness[index], reverse=True)
+            elites, seen = [], set()
+            for index in order:
+                key = scores[index].get("expression")
+                if key is not None and key not in seen and np.isfinite(fitness[index]):
+                    seen.add(key)
+                    elites.append(population[index])
+                if len(elites) >= self.elite_size:
+                    break
+            population = elites + [self.offspring(population, fitness) for _ in range(self.population_size - len(elites))]
+        return self.ranking()
+
+    def ranking(self):
+        return sorted((score for score in self.scores.values() if np.isfinite(score["fitness"])), key=lambda score: score["fitness"], reverse=True)
+
+    def winners(self, top=50, min_ic=0.02):
+        # 适应度(样本内)最高, 且样本外rank IC均值与样本内同号、绝对值不低于min_ic的表达式, IC为负的表达式取反(保存后的因子与未来收益正相关)
+        winners = []
+        for score in self.ranking():
+            if len(winners) >= top:
+                break
+            holdout_ic = score["holdout_ic"]
+            if holdout_ic is not None and abs(holdout_ic) >= min_ic and np.sign(holdout_ic) == np.sign(score["mean_ic"]):
+                winners.append({**score, "factor": score["expression"] if score["mean_ic"] > 0 else f"-1 * ({score['expression']})"})
+        return winners
+
+    @staticmethod
+    def factor_name(library_name, expression, taken):
+        # 因子名为表达式sha1的前缀(同一表达式在每次挖掘中同名); taken为已使用的 因子名 -> 表达式, 前缀冲突时加长, 不会把已有的因子名用于其他表达式
+        digest = hashlib.sha1(expression.encode("utf-8")).hexdigest()
+        for length in range(10, len(digest) + 1):
+            alpha_name = f"{library_name}_{digest[:length]}"
+            if taken.get(alpha_name, expression) == expression:
+                return alpha_name
+        raise ValueError(f"no free factor name for {expression}")
+
+    def save_library(self, winners, alpha_dict_path=MINER_LIBRARY, report_dir=MINER_REPORT_DIR):
+        # 因子库JSON(alpha_name -> 表达式), 评分明细与每代统计另存为{report_dir}/{因子库名称}_mining.json
+        # 已有的因子库中的因子名只用于原来的表达式(入库的因子列按名称区分)
+        library_name = os.path.splitext(os.path.basename(alpha_dict_path))[0]
+        library = {}
+        if os.path.exists(alpha_dict_path):
+            with open(alpha_dict_path, "r") as f:
+                library.update(json.load(f))
+        # 新挖掘的因子合并到已有的因子库(之前入库的因子继续按原名计算, 不会在库表中留下不再更新的列), 已有的表达式沿用原来的因子名
+        factors = {}
+        for winner in winners:
+            alpha_name = self.factor_name(library_name, winner["factor"], library)
+            library[alpha_name] = winner["factor"]
+            factors[alpha_name] = winner
+        with open(alpha_dict_path, "w") as f:
+            json.dump(library, f, indent=4)
+        report = {
+            "created": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "horizon": self.horizon,
+            "holdout": self.holdout,
+            "factors": factors,  # 本次挖掘的因子
+            "history": self.history,
+        }
+        with open(os.path.join(report_dir, f"{library_name}_mining.json"), "w") as f:
+            json.dump(report, f, indent=2)
+        return library
+
+
+if __name__ == "__main__":
+    from .expression_benchmark import make_random_market
+
+    # 模拟行情上的吞吐量测试(随机游走行情没有可挖掘的信号, 不保存结果)
+    factor_miner = AlphaFactorMiner(population_size=300)
+    factor_miner.mine(make_random_market(250, 300), generations=5)
+    for factor_score in factor_miner.ranking()[:10]:
+        print(f"{factor_score['fitness']:.4f} IC={factor_score['mean_ic']:.4f} ICIR={factor_score['icir']:.3f} 样本外IC={factor_score['holdout_ic']} {factor_score['expression']}")
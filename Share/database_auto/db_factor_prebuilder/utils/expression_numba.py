@@ -0,0 +1,233 @@
+import numpy as np
+
+from .expression_kernels import WINDOW_LAG_LIMIT, prep_values, rolling_sum, rolling_linregress
+
+# Numba编译的滑动窗口内核: 逐列逐窗口的显式循环, 用于不便向量化的算子(argmax/argmin、tsrank、count、回归、累乘)
+# 与expression_kernels中的实现语义一致(窗口不完整或含NaN时输出NaN), 未安装numba时回退到原实现(见AlphaExpressionExcutor.set_kernel_backend)
+# 未安装numba时循环函数保持为普通Python函数, 仍可用于小数据上的一致性检查
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+NUMBA_AVAILABLE = numba is not None
+
+
+def _jit(func):
+    return numba.njit(cache=True, nogil=True)(func) if NUMBA_AVAILABLE else func
+
+
+@_jit
+def _argmax_loop(values, window, reverse):
+    n, m = values.shape
+    result = np.full((n, m), np.nan)
+    for j in range(m):
+        for i in range(window - 1, n):
+            start = i - window + 1
+            position = -1
+            best = 0.0
+            for k in range(start, i + 1):
+                value = values[k, j]
+                if np.isnan(value):
+                    position = -1
+                    break
+                if reverse:
+                    value = -value
+                if position < 0 or value > best:  # 相等时保留靠前的位置
+                    best = value
+                    position = k - start
+            if position >= 0:
+                result[i, j] = position
+    return result
+
+
+@_jit
+def _rank_loop(values, window):
+    n, m = values.shape
+    result = np.full((n, m), np.nan)
+    for j in range(m):
+        for i in range(window - 1, n):
+            current = values[i, j]
+            less, equal = 0.0, 0.0
+            valid = True
+            for k in range(i - window + 1, i + 1):
+                value = values[k, j]
+                if np.isnan(value):
+                    valid = False
+                    break
+                if value < current:
+                    less += 1
+                elif value == current:
+                    equal += 1
+            if valid:
+                result[i, j] = (less + (equal + 1) / 2) / window
+    return result
+
+
+@_jit
+def _rank_tree_loop(values, window):
+    # 长窗口的排名: 每列按值排序后, 窗口内的值以排序位置登记在树状数组(Fenwick)中, 每步加入/移出一个值并查询小于/不大于当前值的个数,
+    # O(n·log(n))且与窗口长度无关; 窗口内含NaN时输出NaN(NaN排在最后, 不计入任何有限值的名次)
+    n, m = values.shape
+    result = np.full((n, m), np.nan)
+    tree = np.zeros(n + 1, dtype=np.int64)
+    lower = np.empty(n, dtype=np.int64)  # 小于该值的个数(并列段的起点)
+    upper = np.empty(n, dtype=np.int64)  # 不大于该值的个数(并列段的终点)
+    position = np.empty(n, dtype=np.int64)
+    for j in range(m):
+        column = values[:, j]
+        order = np.argsort(column, kind="mergesort")
+        start = 0
+        for p in range(n):
+            if p > 0 and column[order[p]] != column[order[p - 1]]:
+                start = p
+            lower[order[p]] = start
+            position[order[p]] = p
+        end = n
+        for p in range(n - 1, -1, -1):
+            if p < n - 1 and column[order[p]] != column[order[p + 1]]:
+                end = p + 1
+            upper[order[p]] = end
+        tree[:] = 0
+        nan_count = 0
+        for i in range(n):
+            if np.isnan(column[i]):
+                nan_count += 1
+            k = position[i] + 1
+            while k <= n:
+                tree[k] += 1
+                k += k & -k
+            if i >= window:
+                if np.isnan(column[i - window]):
+                    nan_count -= 1
+                k = position[i - window] + 1
+                while k <= n:
+                    tree[k] -= 1
+                    k += k & -k
+            if i >= window - 1 and nan_count == 0:
+                less, k = 0, lower[i]
+                while k > 0:
+                    less += tree[k]
+                    k -= k & -k
+                not_greater, k = 0, upper[i]
+                while k > 0:
+                    not_greater += tree[k]
+                    k -= k & -k
+                result[i, j] = (less + (not_greater - less + 1) / 2) / window
+    return result
+
+
+@_jit
+def _sum_loop(values, window):
+    n, m = values.shape
+    result = np.full((n, m), np.nan)
+    for j in range(m):
+        for i in range(window - 1, n):
+            total = 0.0
+            for k in range(i - window + 1, i + 1):
+                total += values[k, j]
+            result[i, j] = total
+    return result
+
+
+@_jit
+def _product_loop(values, window):
+    n, m = values.shape
+    result = np.full((n, m), np.nan)
+    for j in range(m):
+        for i in range(window - 1, n):
+            total = 1.0
+            for k in range(i - window + 1, i + 1):
+                total *= values[k, j]
+            result[i, j] = total
+    return result
+
+
+@_jit
+def _linregress_loop(values, window, x_center, sxx):
+    # 与rolling_linregress相同的累加顺序(以窗口最后一个值为基准, 滞后期从近到远), 结果逐位一致
+    n, m = values.shape
+    slope, rsquare, resi = np.full((n, m), np.nan), np.full((n, m), np.nan), np.full((n, m), np.nan)
+    for j in range(m):
+        for i in range(window - 1, n):
+            current = values[i, j]
+            sum_d, sum_dd, sum_xd = 0.0, 0.0, 0.0
+            for lag in range(window):
+                d = values[i - lag, j] - current
+                sum_d += d
+                sum_dd += d * d
+                sum_xd += x_center[window - 1 - lag] * d
+            syy = sum_dd - sum_d * sum_d / window
+            if syy < 0:
+                syy = 0.0
+            slope[i, j] = sum_xd / sxx
+            if syy > 0:
+                rsquare[i, j] = min(sum_xd * sum_xd / (sxx * syy), 1.0)
+            resi[i, j] = -sum_d / window - slope[i, j] * (window - 1) / 2
+    return slope, rsquare, resi
+
+
+# ------------------------------------------
+def _columns(array):
+    # 一维/二维输入统一为(n_dates, n_codes)的连续数组, 循环内按float64累加, 结果转回输入的精度
+    array = prep_values(array)
+    return np.ascontiguousarray(array.reshape(len(array), -1)), array.shape
+
+
+def _check_window(window, minimum=1):
+    if window < minimum:
+        raise ValueError(f"window must be an integer {minimum} or greater")
+    return int(window)
+
+
+def numba_rolling_argmax(array, window, reverse=False):
+    values, shape = _columns(array)
+    return _argmax_loop(values, _check_window(window), reverse).astype(values.dtype, copy=False).reshape(shape)
+
+
+def numba_rolling_argmin(array, window):
+    return numba_rolling_argmax(array, window, reverse=True)
+
+
+def numba_rolling_rank(array, window):
+    # 长窗口用树状数组(O(n·log(n))), 逐窗口比较计数只用于短窗口
+    values, shape = _columns(array)
+    loop = _rank_tree_loop if _check_window(window) > WINDOW_LAG_LIMIT else _rank_loop
+    return loop(values, _check_window(window)).astype(values.dtype, copy=False).reshape(shape)
+
+
+def numba_rolling_count(array, window):
+    # 条件序列(bool转为0/1)的滚动计数, 窗口内含NaN时NaN沿求和自然传播; 长窗口用分段前缀和(O(n), 0/1的累加没有舍入误差, 结果相同)
+    if _check_window(window) > WINDOW_LAG_LIMIT:
+        return rolling_sum(array, window)
+    values, shape = _columns(array)
+    return _sum_loop(values, _check_window(window)).astype(values.dtype, copy=False).reshape(shape)
+
+
+def numba_rolling_product(array, window):
+    values, shape = _columns(array)
+    return _product_loop(values, _check_window(window)).astype(values.dtype, copy=False).reshape(shape)
+
+
+def numba_rolling_linregress(array, window):
+    # 长窗口用分段前缀和(O(n)), 逐窗口循环只用于短窗口
+    window = _check_window(window, minimum=2)
+    if window > WINDOW_LAG_LIMIT:
+        return rolling_linregress(array, window)
+    values, shape = _columns(array)
+    x_center = np.arange(window) - (window - 1) / 2
+    sxx = window * (window * window - 1) / 12
+    results = _linregress_loop(values, window, x_center, sxx)
+    return {name: result.astype(values.dtype, copy=False).reshape(shape) for name, result in zip(("slope", "rsquare", "resi"), results)}
+
+
+# 内核名称 -> Numba实现, 名称与expression_kernels中的回退实现对应
+NUMBA_KERNELS = {
+    "rolling_argmax": numba_rolling_argmax,
+    "rolling_argmin": numba_rolling_argmin,
+    "rolling_rank": numba_rolling_rank,
+    "rolling_count": numba_rolling_count,
+    "rolling_product": numba_rolling_product,
+    "rolling_linregress": numba_rolling_linregress,
+}
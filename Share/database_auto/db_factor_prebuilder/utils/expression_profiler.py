@@ -0,0 +1,107 @@
+import json
+import threading
+import numpy as np
+
+from .expression_graph import _NodeError
+
+
+class AlphaExpressionProfiler:
+    # 表达式引擎的性能统计: 按算子和按因子累计耗时/调用次数/输入规模/失败次数, 跨多次执行汇总
+    # 算子耗时为节点自身耗时; 因子耗时为其依赖的全部节点耗时之和(共享节点计入每个用到它的因子)
+    # 多线程并发执行时: 统计的累加加锁, 每次执行的节点耗时按线程分开记录
+    def __init__(self):
+        self.operators = {}  # 算子名称 -> 统计
+        self.factors = {}  # 因子名称 -> 统计
+        self._lock = threading.Lock()
+        self._local = threading.local()  # 当前线程本次执行中: 节点编号 -> 耗时(node_seconds)
+
+    @staticmethod
+    def _new_record():
+        return {"calls": 0, "seconds": 0.0, "input_size": 0, "failures": 0, "last_error": None}
+
+    @staticmethod
+    def _input_size(args):
+        # 输入规模: 最大数组参数的元素个数
+        return max((int(np.size(arg)) for arg in args if not isinstance(arg, (dict, _NodeError))), default=0)
+
+    def _node_seconds(self):
+        if not hasattr(self._local, "node_seconds"):
+            self._local.node_seconds = {}
+        return self._local.node_seconds
+
+    def record_node(self, node_id, node, args, value, seconds):
+        self._node_seconds()[node_id] = seconds
+        if node.kind not in ("call", "operator"):
+            return
+        input_size = self._input_size(args)
+        with self._lock:
+            record = self.operators.setdefault(node.name if node.kind == "call" else f"operator.{node.name}", self._new_record())
+            record["calls"] += 1
+            record["seconds"] += seconds
+            record["input_size"] += input_size
+            # 只统计节点自身的失败, 上游失败沿依赖传播的不计入
+            if isinstance(value, _NodeError) and not any(isinstance(arg, _NodeError) for arg in args):
+                record["failures"] += 1
+                record["last_error"] = repr(value.error)
+
+    def record_graph(self, graph, errors, input_length):
+        # 一次DAG执行结束: 按因子汇总依赖节点的耗时, 记录失败的因子及原因
+        node_seconds, self._local.node_seconds = self._node_seconds(), {}
+        factor_seconds = {alpha_name: sum(node_seconds.get(node_id, 0.0) for node_id in graph.dependencies(node_id)) for alpha_name, node_id in graph.outputs.items()}
+        with self._lock:
+            for alpha_name in graph.names:
+                record = self.factors.setdefault(alpha_name, self._new_record())
+                record["calls"] += 1
+                record["input_size"] += input_length
+                record["seconds"] += factor_seconds.get(alpha_name, 0.0)
+                if alpha_name in errors:
+                    record["failures"] += 1
+                    record["last_error"] = repr(errors[alpha_name])
+
+    def record_factor(self, alpha_name, seconds, input_length, error=None):
+        # 逐表达式执行(execute)时按因子记录
+        with self._lock:
+            record = self.factors.setdefault(alpha_name, self._new_record())
+            record["calls"] += 1
+            record["seconds"] += seconds
+            record["input_size"] += input_length
+            if error is not None:
+                record["failures"] += 1
+                record["last_error"] = repr(error)
+
+    # ------------------------------------------
+    def report(self):
+        # 按累计耗时降序(加锁取快照, 执行中也可以调用)
+        with self._lock:
+            operators, factors = {name: dict(record) for name, record in self.operators.items()}, {name: dict(record) for name, record in self.factors.items()}
+        return {
+            "operators": dict(sorted(operators.items(), key=lambda item: -item[1]["seconds"])),
+            "factors": dict(sorted(factors.items(), key=lambda item: -item[1]["seconds"])),
+        }
+
+    def report_text(self, top=30):
+        report = self.report()
+        lines = []
+        for title, records in (("算子", report["operators"]), ("因子", report["factors"])):
+            total = sum(record["seconds"] for record in records.values())
+            failed = [name for name, record in records.items() if record["failures"]]
+            lines.append(f"[{title}] 共{len(records)}个, 累计耗时{total:.3f}s, 失败{len(failed)}个")
+            lines.append(f"{'名称':<24}{'耗时(s)':>12}{'占比':>8}{'调用':>8}{'输入规模':>14}{'失败':>6}")
+            for name, record in list(records.items())[:top]:
+                ratio = record["seconds"] / total if total else 0.0
+                lines.append(f"{name:<24}{record['seconds']:>12.4f}{ratio:>8.1%}{record['calls']:>8}{record['input_size']:>14}{record['failures']:>6}")
+            for name in failed:
+                lines.append(f"  失败: {name} {records[name]['last_error'][:120]}")
+        return "\n".join(lines)
+
+    def dump(self, json_path=None, text_path=None, top=30):
+        if json_path is not None:
+            with open(json_path, "w") as f:
+                json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        if text_path is not None:
+            with open(text_path, "w") as f:
+                f.write(self.report_text(top))
+
+    def reset(self):
+        with self._lock:
+            self.operators, self.factors, self._local = {}, {}, threading.local()
@@ -0,0 +1,168 @@
+import os
+import heapq
+import threading
+import time
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .expression_graph import _NodeError
+
+
+class AlphaGraphScheduler:
+    # 因子库DAG的并行调度: 按拓扑序把就绪的节点交给线程池计算(numpy/Numba内核释放GIL, 互不依赖的分支同时计算),
+    # 某个中间结果的最后一个使用者完成后立即释放该结果, 峰值内存只取决于同时存活的中间结果
+    # 计算单元(task): 普通节点一个task; 多窗口分组(见AlphaExpressionGraph.window_batches)一组一个task; 融合子树(见fused_groups)以根节点为task
+    # 字段/常量节点不占用线程, 直接在调度线程中取值; 结果与AlphaExpressionGraph.evaluate逐位一致
+    # 每次evaluate的统计(耗时、关键路径、峰值内存)保存在last_stats, 多个线程共用一个调度器时为最后完成的一次
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.last_stats = None
+        self._lock = threading.Lock()
+
+    # ------------------------------------------
+    @staticmethod
+    def _nbytes(value):
+        return value.nbytes if isinstance(value, np.ndarray) else 0
+
+    @staticmethod
+    def build_tasks(graph, batch_kernels=None, fused_evaluate=None, preloaded=None, required=None):
+        # task编号(组内第一个需要计算的节点) -> (产出的节点编号, 依赖的节点编号), 按节点编号(拓扑序)排列
+        # preloaded/required与AlphaExpressionGraph.evaluate_nodes相同: 已有结果的节点不计算, required不为None时只计算其中的节点
+        batches = graph.window_batches(batch_kernels) if batch_kernels else {}
+        fused = graph.fused_groups() if fused_evaluate is not None else {}
+        fused_members = frozenset().union(*(members for _, _, members in fused.values()))
+
+        def needed(node_id):
+            return (required is None or node_id in required) and not (preloaded and node_id in preloaded)
+
+        tasks = {}
+        for node_id, node in enumerate(graph.nodes):
+            if node.kind in ("field", "const") or node_id in fused_members or not needed(node_id):
+                continue
+            if node_id in fused:
+                tasks[node_id] = ((node_id,), tuple(fused[node_id][1]))
+            elif node_id in batches:
+                members = tuple(member for member, _ in batches[node_id] if needed(member))
+                if members[0] == node_id:
+                    tasks[node_id] = (members, tuple(dict.fromkeys(arg for member in members for arg in graph.nodes[member].args)))
+            else:
+                tasks[node_id] = ((node_id,), node.args)
+        return tasks
+
+    @staticmethod
+    def _run_task(graph, task_id, outputs, args, data, ops, batch_kernels, fused_evaluate):
+        # 在工作线程中计算一个task, 返回(节点编号 -> 取值, 耗时); 异常沿依赖传播的方式与evaluate_nodes一致
+        start = time.perf_counter()
+        node = graph.nodes[task_id]
+        try:
+            if len(outputs) > 1:
+                # 分组task的输入异常由_evaluate_batch处理(序列对分组中只影响对应节点)
+                values = graph._evaluate_batch([member for member in graph.window_batches(batch_kernels)[task_id] if member[0] in outputs], args, batch_kernels)
+            else:
+                for value in args.values():
+                    if isinstance(value, _NodeError):
+                        raise value.error
+                if fused_evaluate is not None and task_id in graph.fused_groups():
+                    values = {task_id: graph._evaluate_fused(task_id, graph.fused_groups()[task_id], args, data, ops, fused_evaluate)}
+                else:
+                    values = {task_id: graph.evaluate_node(node, [args[arg] for arg in node.args], data, ops)}
+        except Exception as e:
+            values = {member: _NodeError(e) for member in outputs}
+        return values, time.perf_counter() - start
+
+    # ------------------------------------------
+    def evaluate(self, graph, data, ops, profiler=None, batch_kernels=None, fused_evaluate=None, preloaded=None, required=None):
+        # 与AlphaExpressionGraph.evaluate相同的输入输出: 返回(因子结果, 因子异常); preloaded/required见build_tasks
+        return graph.collect(self.evaluate_nodes(graph, data, ops, profiler, batch_kernels, fused_evaluate, preloaded, required))
+
+    def evaluate_nodes(self, graph, data, ops, profiler=None, batch_kernels=None, fused_evaluate=None, preloaded=None, required=None, keep=None):
+        # 与AlphaExpressionGraph.evaluate_nodes相同: 返回全部节点的取值(未计算/已释放的中间结果为None), keep为不释放的中间结果
+        wall_start = time.perf_counter()
+        tasks = self.build_tasks(graph, batch_kernels, fused_evaluate, preloaded, required)
+        node_task = {member: task_id for task_id, (outputs, _) in tasks.items() for member in outputs}
+        pinned = set(graph.outputs.values()) | set(keep or ())  # 因子输出保留到最后
+        consumers, waiting, dependents = {}, {}, {}
+        for task_id, (_, dependencies) in tasks.items():
+            for dependency in dependencies:
+                consumers[dependency] = consumers.get(dependency, 0) + 1
+            upstream = {node_task[dependency] for dependency in dependencies if dependency in node_task}
+            waiting[task_id] = len(upstream)
+            for upstream_id in upstream:
+                dependents.setdefault(upstream_id, []).append(task_id)
+
+        values = {}
+        for node_id, node in enumerate(graph.nodes):
+            if node.kind in ("field", "const"):
+                try:
+                    values[node_id] = graph.evaluate_node(node, [], data, ops)
+                except Exception as e:
+                    values[node_id] = _NodeError(e)
+        values.update(preloaded or {})
+        live_bytes, peak_bytes, total_bytes, freed = 0, 0, 0, 0
+        durations, finish = {}, {}  # task -> 自身耗时 / 关键路径上的最早完成时间(只累计计算耗时)
+        ready = [task_id for task_id, count in waiting.items() if count == 0]
+        heapq.heapify(ready)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while ready or running:
+                # 就绪的task按节点编号从小到大提交, 同时运行的task不超过线程数, 避免过多中间结果同时存活
+                while ready and len(running) < self.max_workers:
+                    task_id = heapq.heappop(ready)
+                    outputs, dependencies = tasks[task_id]
+                    args = {dependency: values[dependency] for dependency in dependencies}
+                    running[pool.submit(self._run_task, graph, task_id, outputs, args, data, ops, batch_kernels, fused_evaluate)] = task_id
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task_id = running.pop(future)
+                    outputs, dependencies = tasks[task_id]
+                    task_values, seconds = future.result()
+                    for member in outputs:
+                        values[member] = task_values[member]
+                        live_bytes += self._nbytes(task_values[member])
+                        total_bytes += self._nbytes(task_values[member])
+                    peak_bytes = max(peak_bytes, live_bytes)
+                    durations[task_id] = seconds
+                    finish[task_id] = seconds + max((finish[node_task[dependency]] for dependency in dependencies if dependency in node_task), default=0.0)
+                    if profiler is not None:
+                        for member in outputs:
+                            profiler.record_node(member, graph.nodes[member], [values[arg] for arg in graph.nodes[member].args if arg in values], values[member], seconds / len(outputs))
+                    # 依赖的最后一个使用者完成后释放中间结果
+                    for dependency in dependencies:
+                        consumers[dependency] -= 1
+                        if consumers[dependency] == 0 and dependency not in pinned and dependency in node_task:
+                            live_bytes -= self._nbytes(values[dependency])
+                            values[dependency] = None
+                            freed += 1
+                    for dependent in dependents.get(task_id, []):
+                        waiting[dependent] -= 1
+                        if waiting[dependent] == 0:
+                            heapq.heappush(ready, dependent)
+
+        stats = self.critical_path(graph, tasks, node_task, durations, finish)
+        stats.update(
+            {
+                "workers": self.max_workers,
+                "tasks": len(tasks),
+                "wall_seconds": time.perf_counter() - wall_start,
+                "work_seconds": sum(durations.values()),
+                "peak_bytes": peak_bytes,  # 同时存活的节点结果(中间结果+因子输出)的最大字节数
+                "total_bytes": total_bytes,  # 全部节点结果的字节数之和, 即不释放中间结果时的占用
+                "freed_nodes": freed,
+            }
+        )
+        stats["parallelism"] = stats["work_seconds"] / stats["critical_path_seconds"] if stats["critical_path_seconds"] else 1.0
+        with self._lock:
+            self.last_stats = stats
+        return [values.get(node_id) for node_id in range(len(graph.nodes))]
+
+    @staticmethod
+    def critical_path(graph, tasks, node_task, durations, finish):
+        # 关键路径: 计算耗时之和最大的依赖链(并行计算时墙钟时间的下界), 从完成最晚的task沿耗时最大的上游回溯
+        if not finish:
+            return {"critical_path_seconds": 0.0, "critical_path": []}
+        task_id, path = max(finish, key=finish.get), []
+        while task_id is not None:
+            path.append(graph.labels[task_id])
+            upstream = [node_task[dependency] for dependency in tasks[task_id][1] if dependency in node_task]
+            task_id = max(upstream, key=finish.get) if upstream else None
+        return {"critical_path_seconds": max(finish.values()), "critical_path": path[::-1]}
@@ -0,0 +1,146 @@
+import ast
+import math
+import operator
+
+
+class AlphaExpressionSimplifier(ast.NodeTransformer):
+    # 编译期的代数化简(自底向上): 常量折叠, 去掉恒等运算, 交换律运算的操作数按规范顺序排列(a*b与b*a在DAG中合并为同一节点)
+    # 只做与原表达式逐位一致的改写: x+0不化简(-0.0+0为+0.0), 比较结果(bool)上的*1/shift(x,0)保留(用于转为数值)
+    FOLD_OPERATORS = {
+        ast.Add: operator.add,
+        ast.Sub: operator.sub,
+        ast.Mult: operator.mul,
+        ast.Div: operator.truediv,
+        ast.Pow: operator.pow,
+        ast.USub: operator.neg,
+        ast.UAdd: operator.pos,
+    }
+    COMMUTATIVE_OPERATORS = (ast.Add, ast.Mult)
+    IDENTITY_CALLS = {"shift": 0, "delay": 0}  # 周期参数为该值时算子等于输入本身
+    # 参数全部为常数时结果仍为常数的算子(算子名 -> 常数结果); 窗口统计量对常数序列的结果即为该常数
+    # 不在表中的算子不折叠(如sequence(n)返回1..n序列, 不是常数)
+    CONSTANT_CALLS = {
+        "abs": abs,
+        "sign": lambda value: (value > 0) - (value < 0) if value == value else math.nan,
+        "log": math.log,
+        "min": min,
+        "max": max,
+        "clip": lambda value, min_value, max_value: min(max(value, min_value), max_value),
+        "signedpower": lambda value, power: math.copysign(abs(value) ** power, value) if value else 0.0,
+        "shift": lambda value, periods: value,
+        "delay": lambda value, periods: value,
+        "mean": lambda value, window: value,
+        "tsmax": lambda value, window: value,
+        "tsmin": lambda value, window: value,
+        "decaylinear": lambda value, window: value,
+        "wma": lambda value, window: value,
+        "sma": lambda value, window, weight=1: value,
+        "quantile": lambda value, window, quantile: value,
+    }
+    NEAR_ZERO = 1e-6  # x/(x+c)中|c|不超过该值时视为近似常数1
+
+    @staticmethod
+    def _number(node):
+        # 数值常量的值(非数值常量为None)
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            return node.value
+        return None
+
+    @staticmethod
+    def _constant(value):
+        return ast.Constant(value=value) if type(value) in (int, float) and math.isfinite(value) else None
+
+    def _is_bool(self, node):
+        # 结果是否为bool: 比较/逻辑运算, 以及bool操作数之间的&/|/^和~
+        if isinstance(node, (ast.Compare, ast.BoolOp)):
+            return True
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr, ast.BitXor)):
+            return self._is_bool(node.left) and self._is_bool(node.right)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Invert, ast.Not)):
+            return self._is_bool(node.operand)
+        return False
+
+    # ------------------------------------------
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        value = self._number(node.operand)
+        if value is not None and type(node.op) in self.FOLD_OPERATORS:
+            folded = self._constant(self.FOLD_OPERATORS[type(node.op)](value))
+            if folded is not None:
+                return folded
+        if isinstance(node.op, ast.UAdd) and not self._is_bool(node.operand):
+            return node.operand
+        if isinstance(node.op, ast.USub) and isinstance(node.operand, ast.UnaryOp) and isinstance(node.operand.op, ast.USub):
+            return node.operand.operand  # --x
+        return node
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        left, right = self._number(node.left), self._number(node.right)
+        if left is not None and right is not None and type(node.op) in self.FOLD_OPERATORS:
+            try:
+                folded = self._constant(self.FOLD_OPERATORS[type(node.op)](left, right))
+            except (ZeroDivisionError, OverflowError):
+                folded = None
+            if folded is not None:
+                return folded
+        # 恒等运算: x*1, 1*x, x/1, x-0, x**1(x为比较结果时保留, 乘1用于把bool转为数值)
+        if isinstance(node.op, ast.Mult) and right == 1 and not self._is_bool(node.left):
+            return node.left
+        if isinstance(node.op, ast.Mult) and left == 1 and not self._is_bool(node.right):
+            return node.right
+        if isinstance(node.op, (ast.Div, ast.Pow)) and right == 1 and not self._is_bool(node.left):
+            return node.left
+        if isinstance(node.op, ast.Sub) and right == 0 and not self._is_bool(node.left):
+            return node.left
+        if isinstance(node.op, self.COMMUTATIVE_OPERATORS):
+            # IEEE浮点加法/乘法满足交换律(不满足结合律, 只交换直接的两个操作数)
+            node.left, node.right = sorted((node.left, node.right), key=ast.dump)
+        return node
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Name) and node.func.id in self.IDENTITY_CALLS and len(node.args) == 2:
+            if self._number(node.args[1]) == self.IDENTITY_CALLS[node.func.id] and not self._is_bool(node.args[0]):
+                return node.args[0]
+        return node
+
+    # ------------------------------------------
+    def constant_value(self, node):
+        # 因子是否为常数(或近似常数), 返回常数值, 否则返回None; 只识别不读取数据即可确定的情形:
+        # 数值常量, x/x(=1), x-x(=0), x/(x+c)(|c|很小, ≈1), 以及参数全部为常数的运算/CONSTANT_CALLS中的算子调用(如mean(close/close,5))
+        # 常数因子在缺失值/除零处仍可能为NaN, 对模型没有信息量
+        value = self._number(node)
+        if value is not None:
+            return value
+        if isinstance(node, ast.BinOp):
+            if ast.dump(node.left) == ast.dump(node.right):
+                if isinstance(node.op, ast.Div):
+                    return 1
+                if isinstance(node.op, ast.Sub):
+                    return 0
+            if isinstance(node.op, ast.Div) and isinstance(node.right, ast.BinOp) and isinstance(node.right.op, ast.Add):
+                for term, offset in ((node.right.left, node.right.right), (node.right.right, node.right.left)):
+                    offset = self._number(offset)
+                    if ast.dump(term) == ast.dump(node.left) and offset is not None and abs(offset) <= self.NEAR_ZERO:
+                        return 1
+            args = [node.left, node.right]
+        elif isinstance(node, ast.UnaryOp):
+            args = [node.operand]
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in self.CONSTANT_CALLS and not node.keywords:
+            args = node.args
+        else:
+            return None
+        values = [self.constant_value(arg) for arg in args]
+        if all(value is not None for value in values):
+            return self.fold(node, values)
+        return None
+
+    def fold(self, node, values):
+        # 常数参数的运算/算子调用结果(无法计算时返回nan, 仍视为常数)
+        try:
+            if isinstance(node, ast.Call):
+                return self.CONSTANT_CALLS[node.func.id](*values)
+            return self.FOLD_OPERATORS[type(node.op)](*values)
+        except (KeyError, ZeroDivisionError, OverflowError, TypeError, ValueError):
+            return math.nan
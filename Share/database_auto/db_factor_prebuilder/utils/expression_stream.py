@@ -0,0 +1,198 @@
+import time
+import pickle
+import numpy as np
+
+from .expression_graph import _NodeError
+
+
+class AlphaRowBuffer:
+    # 节点输出的定长行缓冲: 每行为同一交易日全部股票的截面, 只保留最近capacity行
+    # 底层数组预留2倍空间, 写满后把最近capacity-1行搬回开头, 追加一行摊还O(n_codes), 读取最近k行为连续视图
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.width = width
+        self.size = 0  # 有效行数(不超过capacity)
+        self.end = 0
+        self.data = None  # 首次写入时按行的dtype分配(比较运算的结果保持bool)
+
+    def append(self, row):
+        row = np.broadcast_to(row, (self.width,))
+        if self.data is None:
+            self.data = np.empty((2 * self.capacity, self.width), dtype=row.dtype)
+        if self.end == len(self.data):
+            keep = self.capacity - 1
+            self.data[:keep] = self.data[self.end - keep : self.end]
+            self.end = keep
+        self.data[self.end] = row
+        self.end += 1
+        self.size = min(self.size + 1, self.capacity)
+
+    def append_missing(self):
+        # 节点计算失败时写入缺失行, 保持各缓冲在时间上对齐; bool缓冲写入False(NaN转为bool为True)
+        self.append(False if self.data is not None and self.data.dtype == bool else np.nan)
+
+    def tail(self, rows):
+        # 最近rows行; 历史不足时前面补NaN, 与批量计算的窗口预热期一致
+        if rows <= self.size:
+            return self.data[self.end - rows : self.end]
+        result = np.full((rows, self.width), np.nan)
+        if self.size:
+            result[rows - self.size :] = self.data[self.end - self.size : self.end]
+        return result
+
+
+class AlphaExpressionStream:
+    # 增量计算: 每个节点只保留后续算子需要的最近若干行输出, 每追加一个交易日的截面行情, 各节点只计算新的一行(O(window))
+    # 状态(股票列表/最后日期/节点缓冲)按节点的规范化表达式保存, 次日加载后继续计算; 因子库增删因子不影响其余节点的状态
+    def __init__(self, graph, ops, codes, static_fields=None, profiler=None):
+        self.graph = graph
+        self.ops = ops
+        self.profiler = profiler
+        self.codes = np.asarray(codes)
+        self.static_fields = dict(static_fields or {})  # 不随日期变化的字段(如行业分组编号), 长度n_codes
+        self.last_date = None
+        self.static_values = graph.static_values(ops, self.static_fields)
+        self.input_rows = {}  # 节点编号 -> 每个参数需要的最近行数
+        self.failed = {}  # 节点编号 -> 无法增量计算的原因(如窗口参数不是常量)
+        capacity = {}  # 节点编号 -> 需要保留的行数
+        for node_id, node in enumerate(graph.nodes):
+            if node_id in self.static_values:
+                continue
+            try:
+                rows = self.input_rows[node_id] = graph.input_rows(node_id, self.static_values)
+            except Exception as e:
+                self.failed[node_id] = e
+                continue
+            for arg in node.args:
+                capacity[arg] = max(capacity.get(arg, 1), rows)
+        # 只有需要历史的节点(窗口/位移算子的输入)才保存缓冲, 其余节点的当日值用完即弃
+        self.buffers = {node_id: AlphaRowBuffer(rows, len(self.codes)) for node_id, rows in capacity.items() if rows > 1}
+
+    # ------------------------------------------
+    def _input(self, arg, rows, values):
+        if arg in self.static_values:
+            return self.static_values[arg]
+        value = values[arg]
+        if isinstance(value, _NodeError):
+            raise value.error
+        if rows > 1:
+            return self.buffers[arg].tail(rows)
+        return value if isinstance(value, dict) else value[np.newaxis]
+
+    def update(self, date, data):
+        # data: 字段 -> 当日截面(长度n_codes), 返回alpha_name -> 当日因子值(失败的因子为NaN)
+        values = {}
+        for node_id, node in enumerate(self.graph.nodes):
+            if node_id in self.static_values:
+                continue
+            start = time.perf_counter() if self.profiler is not None else None
+            try:
+                if node_id in self.failed:
+                    raise self.failed[node_id]
+                if node.kind == "field":
+                    if node.name not in data:
+                        raise NameError(f"name '{node.name}' is not defined")
+                    value = np.asarray(data[node.name])
+                else:
+                    rows = self.input_rows[node_id]
+                    args = [self._input(arg, rows, values) for arg in node.args]
+                    value = self.graph.evaluate_node(node, args, data, self.ops)
+                    # 参数为最近rows行, 只取最后一行作为当日结果(select直接取共享节点当日结果中的一项)
+                    if node.kind != "select":
+                        value = {key: item[-1] for key, item in value.items()} if isinstance(value, dict) else np.asarray(value)[-1]
+            except Exception as e:
+                value = _NodeError(e)
+            values[node_id] = value
+            if self.profiler is not None:
+                self.profiler.record_node(node_id, node, [values.get(arg, self.static_values.get(arg)) for arg in node.args], value, time.perf_counter() - start)
+            if node_id in self.buffers:
+                if isinstance(value, _NodeError):
+                    self.buffers[node_id].append_missing()
+                else:
+                    self.buffers[node_id].append(value)
+        self.last_date = date
+        results, errors = {}, dict(self.graph.errors)
+        for alpha_name in self.graph.names:
+            node_id = self.graph.outputs.get(alpha_name)
+            value = self.static_values.get(node_id, values.get(node_id)) if node_id is not None else None
+            if isinstance(value, _NodeError):
+                errors[alpha_name] = value.error
+            if value is None or isinstance(value, _NodeError):
+                value = np.nan
+            results[alpha_name] = np.broadcast_to(np.asarray(value, dtype=np.float64), (len(self.codes),))
+        if self.profiler is not None:
+            self.profiler.record_graph(self.graph, errors, len(self.codes))
+        return results
+
+    def update_panel(self, dates, panel):
+        # 逐日追加面板(n_dates, n_codes)中的行情, 跳过状态中已包含的日期, 返回新日期及对应的因子面板
+        series_fields = {field: array for field, array in panel.items() if np.ndim(array) == 2}
+        new_dates, rows = [], []
+        for date_index, date in enumerate(dates):
+            if self.last_date is not None and date <= self.last_date:
+                continue
+            new_dates.append(date)
+            rows.append(self.update(date, {field: array[date_index] for field, array in series_fields.items()}))
+        panel_results = {alpha_name: np.array([row[alpha_name] for row in rows]).reshape(len(rows), len(self.codes)) for alpha_name in self.graph.names}
+        return np.asarray(new_dates), panel_results
+
+    def warmup(self, dates, panel):
+        # 用历史面板一次批量计算全部节点, 以各节点最后capacity行初始化缓冲(比逐日追加快, 结果与批量计算一致)
+        data = {field: array for field, array in panel.items() if np.ndim(array) == 2}
+        data.update(self.static_fields)
+        values = self.graph.evaluate_nodes(data, self.ops)
+        shape = (len(dates), len(self.codes))
+        for node_id, buffer in self.buffers.items():
+            value = values[node_id]
+            history = np.full(shape, np.nan) if isinstance(value, _NodeError) else np.broadcast_to(value, shape)
+            self.buffers[node_id] = self._restore_buffer(buffer.capacity, history)
+        self.last_date = dates[-1]
+
+    # ------------------------------------------
+    def reindex(self, codes):
+        # 股票列表变化(新股上市/退市): 保留已有股票的历史, 新股票的历史为空(NaN)
+        codes = np.asarray(codes)
+        if np.array_equal(codes, self.codes):
+            return
+        position = {code: index for index, code in enumerate(self.codes)}
+        take = np.array([position.get(code, -1) for code in codes], dtype=np.int64)
+        for node_id, buffer in self.buffers.items():
+            history = buffer.tail(buffer.size) if buffer.size else np.empty((0, len(self.codes)))
+            if (take < 0).any():
+                history = history.astype(np.float64)  # 新股票的历史为NaN(bool缓冲转为float)
+            new_history = np.zeros((len(history), len(codes)), dtype=history.dtype) if history.dtype == bool else np.full((len(history), len(codes)), np.nan)
+            new_history[:, take >= 0] = history[:, take[take >= 0]]
+            self.buffers[node_id] = self._restore_buffer(buffer.capacity, new_history)
+        self.codes = codes
+
+    @staticmethod
+    def _restore_buffer(capacity, history):
+        buffer = AlphaRowBuffer(capacity, history.shape[1])
+        for row in history[-capacity:]:
+            buffer.append(row)
+        return buffer
+
+    def state(self):
+        # 可序列化的状态: 节点缓冲按规范化表达式保存
+        return {
+            "codes": self.codes,
+            "last_date": self.last_date,
+            "buffers": {self.graph.labels[node_id]: buffer.tail(buffer.size).copy() for node_id, buffer in self.buffers.items() if buffer.size},
+        }
+
+    def load_state(self, state):
+        # 恢复状态并对齐到当前股票列表; 状态中没有的节点(新增因子)从空历史开始
+        codes, self.last_date = self.codes, state["last_date"]
+        self.codes = np.asarray(state["codes"])
+        for node_id, buffer in list(self.buffers.items()):
+            history = state["buffers"].get(self.graph.labels[node_id])
+            self.buffers[node_id] = AlphaRowBuffer(buffer.capacity, len(self.codes)) if history is None else self._restore_buffer(buffer.capacity, history)
+        self.reindex(codes)
+
+    def save(self, state_path):
+        with open(state_path, "wb") as f:
+            pickle.dump(self.state(), f)
+
+    def load(self, state_path):
+        with open(state_path, "rb") as f:
+            self.load_state(pickle.load(f))
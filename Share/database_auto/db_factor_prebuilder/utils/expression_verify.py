@@ -0,0 +1,350 @@
+import os
+import json
+import time
+import pickle
+import numpy as np
+import pandas as pd
+from scipy.stats import linregress
+
+from .expression_benchmark import BENCHMARK_LIBRARIES, make_random_market
+from .expression_graph import AlphaExpressionGraph
+from .expression_excutor import AlphaBaseOperations, AlphaExpressionExcutor
+from .expression_numba import NUMBA_AVAILABLE
+from .expression_fusion import NUMEXPR_AVAILABLE
+
+# 算子/因子库的差分校验与基准(在Share/database_auto目录下运行):
+#   python -m db_factor_prebuilder.utils.expression_verify
+# 在模拟行情(含缺失值、连续停牌、一字板常数段、上市前空白、并列值)上, 把每个算子和因子库中的每个因子分别交给参照实现与其他执行后端计算,
+# 逐元素比较(np.isclose, NaN位置须一致), 并记录每个算子的ops/sec与每个因子库的factors/sec;
+# 完整报告(含耗时, 与机器有关)写入VERIFY_REPORT(不纳入版本管理), 已知差异(每个因子的不一致个数与最大误差)写入VERIFY_BASELINE
+# 单只股票模式: 参照为原始的pandas实现(AlphaReferenceOperations: rolling.apply + scipy.stats.linregress), 对比Series算子(backend="series")与ndarray算子(backend="numpy")
+# 面板模式: 参照为numpy内核逐节点计算, 对比Numba内核 / numexpr融合 / 按时间分块计算 / 逐日增量计算(未安装的依赖自动跳过)
+# float32精度的偏差不在此校验(不是同一精度的实现), 见expression_benchmark.run_precision_check
+
+VERIFY_REPORT = "./db_factor_prebuilder/factor_ref/verify_report.json"
+VERIFY_BASELINE = "./db_factor_prebuilder/factor_ref/verify_baseline.json"
+VERIFY_CHUNK_SIZE = 97  # 分块后端的块大小(不整除交易日数, 覆盖最后一个不完整的块)
+
+# 每个算子的探测表达式(算子名 -> 表达式), 覆盖全部面板算子与单只股票算子
+OPERATOR_PROBES = {
+    "abs": "abs(returns)",
+    "clip": "clip(returns, -0.02, 0.02)",
+    "correlation": "correlation(close, volume, 10)",
+    "count": "count(close > open, 10)",
+    "covariance": "covariance(close, volume, 10)",
+    "decaylinear": "decaylinear(close, 10)",
+    "demean": "demean(returns)",
+    "diff": "diff(close, 3)",
+    "highday": "highday(high, 10)",
+    "idxmax": "idxmax(close, 10)",
+    "idxmin": "idxmin(close, 10)",
+    "indneutralize": "indneutralize(returns, industry)",
+    "industry_neutralize": "industry_neutralize(returns)",
+    "linregress": "slope(close, 20) + rsquare(close, 20) + resi(close, 20)",
+    "log": "log(volume)",
+    "lowday": "lowday(low, 10)",
+    "max": "max(open, close)",
+    "mean": "mean(close, 10)",
+    "min": "min(open, close)",
+    "product": "product(1 + returns, 10)",
+    "quantile": "quantile(close, 10, 0.25)",
+    "rank": "rank(returns)",
+    "regbeta": "regbeta(close, 10)",
+    "resi": "resi(close, 10)",
+    "rsquare": "rsquare(close, 10)",
+    "scale": "scale(returns)",
+    "sequence": "close * sequence(1)",
+    "shift": "shift(close, 5)",
+    "sign": "sign(returns)",
+    "signedpower": "signedpower(returns, 2)",
+    "slope": "slope(close, 10)",
+    "sma": "sma(close, 10, 2)",
+    "std": "std(close, 10)",
+    "sum": "sum(volume, 10)",
+    "tsargmax": "tsargmax(close, 10)",
+    "tsargmin": "tsargmin(close, 10)",
+    "tsmax": "tsmax(high, 10) + tsmax(high, 60)",
+    "tsmin": "tsmin(low, 10) + tsmin(low, 60)",
+    "tsrank": "tsrank(close, 10) + tsrank(close, 60)",
+    "where": "where(close > open, high, low)",
+    "wma": "wma(close, 10)",
+}
+
+
+class AlphaReferenceOperations(AlphaBaseOperations):
+    # 单只股票模式的参照实现: 由内核实现替换掉的算子保留原始的pandas写法(逐窗口rolling.apply, 回归逐窗口调用scipy.stats.linregress),
+    # 与Series/ndarray算子的实现互相独立; 其余算子(rolling std/corr/sum等)本身即为pandas实现, 沿用AlphaBaseOperations
+    @staticmethod
+    def tsargmax(series, window):
+        return series.rolling(window=window).apply(lambda x: np.argmax(x), raw=True)
+
+    @staticmethod
+    def tsargmin(series, window):
+        return series.rolling(window=window).apply(lambda x: np.argmin(x), raw=True)
+
+    @staticmethod
+    def tsrank(series, window):
+        return series.rolling(window=window).apply(lambda x: x.rank(pct=True).iloc[-1], raw=False)
+
+    @staticmethod
+    def idxmax(series, window):
+        return series.rolling(window=window).apply(lambda x: (window - 1) - np.argmax(x), raw=True)
+
+    @staticmethod
+    def highday(series, window):
+        return series.rolling(window=window).apply(lambda x: (window - 1) - np.argmax(x), raw=True)
+
+    @staticmethod
+    def idxmin(series, window):
+        return series.rolling(window=window).apply(lambda x: (window - 1) - np.argmin(x), raw=True)
+
+    @staticmethod
+    def lowday(series, window):
+        return series.rolling(window=window).apply(lambda x: (window - 1) - np.argmax(x), raw=True)
+
+    @staticmethod
+    def linregress(series, window):
+        # slope/rsquare/resi/regbeta在DAG中共享同一个linregress节点, 参照逐项调用scipy.stats.linregress
+        def fit(y_values):
+            return linregress(np.arange(len(y_values)), y_values)
+
+        def last_residual(y_values):
+            result = fit(y_values)
+            return y_values[-1] - (result.slope * (len(y_values) - 1) + result.intercept)
+
+        rolling = series.rolling(window=window)
+        return {
+            "slope": rolling.apply(lambda y: fit(y).slope, raw=True),
+            "rsquare": rolling.apply(lambda y: fit(y).rvalue**2, raw=True),
+            "resi": rolling.apply(last_residual, raw=True),
+        }
+
+    @staticmethod
+    def decaylinear(series, window):
+        weights = np.arange(1, window + 1)
+        return series.rolling(window=window).apply(lambda x: np.dot(x, weights) / np.sum(weights), raw=True)
+
+    @staticmethod
+    def sma(series, window, weight=1):
+        weights = np.full(window, weight)
+        return series.rolling(window=window).apply(lambda x: np.dot(x, weights) / np.sum(weights), raw=True)
+
+    @staticmethod
+    def wma(series, window):
+        weights = np.power(0.9, np.arange(window)[::-1])
+        return series.rolling(window=window).apply(lambda x: np.dot(x, weights) / np.sum(weights), raw=True)
+
+    @staticmethod
+    def count(condition_series, window):
+        return condition_series.rolling(window=window).sum()
+
+    @staticmethod
+    def product(series, window):
+        return series.rolling(window=window).apply(np.prod, raw=True)
+
+
+def reference_operations():
+    ops = AlphaReferenceOperations()
+    return {func.lower(): getattr(ops, func) for func in dir(ops) if callable(getattr(ops, func)) and not func.startswith("_")}
+
+
+def make_verify_market(n_dates, n_codes, seed=2024, suspended_ratio=0.01):
+    # 在make_random_market的基础上加入: 连续停牌(整段缺失), 一字板(开高低收相同且多日不变), 上市前空白, 1位小数价格(并列值)
+    rng = np.random.default_rng(seed)
+    panel = make_random_market(n_dates, n_codes, seed=seed, suspended_ratio=suspended_ratio)
+    prices = ("open", "high", "low", "close")
+    for code in range(n_codes):
+        if code % 4 == 0:
+            start = rng.integers(0, n_dates - 20)
+            for field in ("open", "high", "low", "close", "volume", "amount"):
+                panel[field][start : start + rng.integers(5, 20), code] = np.nan
+        if code % 4 == 1:
+            start, length = rng.integers(0, n_dates - 20), rng.integers(10, 20)
+            for field in prices:
+                panel[field][start : start + length, code] = panel["close"][start, code]
+            panel["volume"][start : start + length, code] = panel["volume"][start, code]
+        if code % 4 == 2:
+            for field in prices:
+                panel[field][:, code] = np.round(panel[field][:, code], 1)
+        if code % 8 == 3:
+            for field in ("open", "high", "low", "close", "volume", "amount"):
+                panel[field][: n_dates // 5, code] = np.nan
+    panel["amount"] = panel["volume"] * panel["close"]
+    panel["vwap"] = (panel["open"] + panel["high"] + panel["low"] + panel["close"]) / 4
+    panel["returns"] = np.vstack([np.full((1, n_codes), np.nan), panel["close"][1:] / panel["close"][:-1] - 1])
+    return panel
+
+
+def compare_values(reference, value, rtol, atol):
+    # 逐元素比较: 不满足np.isclose(±inf须相等, NaN位置须一致)的元素个数, 及双方都有限处的最大绝对/相对误差
+    reference, value = np.asarray(reference, dtype=np.float64), np.asarray(value, dtype=np.float64)
+    mismatch = ~np.isclose(value, reference, rtol=rtol, atol=atol, equal_nan=True)
+    finite = np.isfinite(reference) & np.isfinite(value)
+    error = np.abs(value[finite] - reference[finite])
+    return {
+        "mismatch": int(mismatch.sum()),
+        "nan_mismatch": int((np.isnan(reference) != np.isnan(value)).sum()),
+        "max_abs_diff": float(error.max()) if error.size else 0.0,
+        "max_rel_diff": float((error / np.maximum(np.abs(reference[finite]), atol)).max()) if error.size else 0.0,
+        "all_nan": bool(np.isnan(reference).all()),  # 参照结果全为NaN(计算失败或窗口不足)时比较没有意义
+    }
+
+
+# ------------------------------------------
+def panel_backends():
+    # 面板模式中与参照对比的执行后端(未安装numba/numexpr时跳过对应后端)
+    return [backend for backend, available in (("numba", NUMBA_AVAILABLE), ("fused", NUMEXPR_AVAILABLE), ("chunked", True), ("stream", True)) if available]
+
+
+def run_panel_backend(excutor, backend, graph, panel):
+    # 参照及分块后端使用numpy内核逐节点计算, numba/fused后端只打开对应的实现
+    kernel_backend, fused_evaluate = excutor.kernel_backend, excutor.fused_evaluate
+    excutor.set_kernel_backend("numba" if backend == "numba" else "numpy")
+    excutor.fused_evaluate = fused_evaluate if backend == "fused" else None
+    try:
+        start = time.perf_counter()
+        if backend == "chunked":
+            chunks = [{alpha_name: result.copy() for alpha_name, result in results.items()} for _, _, results in excutor.execute_panel_chunks(graph, panel, VERIFY_CHUNK_SIZE)]
+            results = {alpha_name: np.concatenate([results[alpha_name] for results in chunks]) for alpha_name in graph.names}
+        elif backend == "stream":
+            results = run_stream(excutor, graph, panel)
+        else:
+            results = excutor.execute_panel(graph, panel)
+        return time.perf_counter() - start, results
+    finally:
+        excutor.kernel_backend, excutor.fused_evaluate = kernel_backend, fused_evaluate
+
+
+def run_stream(excutor, graph, panel):
+    # 逐日增量计算: 前VERIFY_CHUNK_SIZE个交易日批量初始化状态(warmup), 保存并重新加载状态后逐日追加其余交易日;
+    # 初始化部分的结果取批量计算, 只有追加部分为增量计算的结果
+    n_dates, n_codes = next(array.shape for array in panel.values() if np.ndim(array) == 2)
+    dates, codes = np.arange(n_dates), np.arange(n_codes)
+    series_fields = {field: array for field, array in panel.items() if np.ndim(array) == 2}
+    alpha_stream = excutor.create_stream(graph, codes, {field: array for field, array in panel.items() if np.ndim(array) == 1})
+    alpha_stream.warmup(dates[:VERIFY_CHUNK_SIZE], {field: array[:VERIFY_CHUNK_SIZE] for field, array in series_fields.items()})
+    alpha_stream.load_state(pickle.loads(pickle.dumps(alpha_stream.state())))
+    warmup_results = excutor.execute_panel(graph, {field: array[:VERIFY_CHUNK_SIZE] if np.ndim(array) == 2 else array for field, array in panel.items()})
+    _, stream_results = alpha_stream.update_panel(dates, panel)
+    return {alpha_name: np.concatenate([warmup_results[alpha_name], stream_results[alpha_name]]) for alpha_name in graph.names}
+
+
+def run_stock_backend(excutor, backend, graph, frames):
+    # 单只股票模式: 逐只股票执行, 结果按列拼为(日期 x 股票)面板; backend="pandas"为参照实现(计算失败的因子为NaN)
+    start = time.perf_counter()
+    if backend == "pandas":
+        ops = reference_operations()
+        results = []
+        for frame in frames:
+            values, _ = graph.evaluate({col_name.lower(): frame[col_name] for col_name in frame.columns}, ops)
+            results.append({alpha_name: np.broadcast_to(np.asarray(values.get(alpha_name, np.nan), dtype=np.float64), (len(frame),)) for alpha_name in graph.names})
+    else:
+        results = [excutor.execute_graph(graph, frame, backend=backend) for frame in frames]
+    seconds = time.perf_counter() - start
+    return seconds, {alpha_name: np.column_stack([np.asarray(result[alpha_name], dtype=np.float64) for result in results]) for alpha_name in graph.names}
+
+
+def verify_graph(excutor, graph, panel, frames, rtol, atol):
+    # 一张图在全部后端上的结果与参照逐因子比较, 返回(比较结果行, 各后端耗时)
+    rows, timings = [], {}
+    if frames is not None:
+        timings["pandas"], reference = run_stock_backend(excutor, "pandas", graph, frames)
+        for backend in ("series", "numpy"):
+            timings[backend], results = run_stock_backend(excutor, backend, graph, frames)
+            rows += [{"mode": "stock", "backend": backend, "factor": alpha_name, **compare_values(reference[alpha_name], results[alpha_name], rtol, atol)} for alpha_name in graph.names]
+    timings["reference"], reference = run_panel_backend(excutor, "reference", graph, panel)
+    for backend in panel_backends():
+        timings[backend], results = run_panel_backend(excutor, backend, graph, panel)
+        rows += [{"mode": "panel", "backend": backend, "factor": alpha_name, **compare_values(reference[alpha_name], results[alpha_name], rtol, atol)} for alpha_name in graph.names]
+    return rows, timings
+
+
+def run_verification(alpha_dict_paths=BENCHMARK_LIBRARIES, n_dates=300, n_codes=24, seed=2024, rtol=1e-7, atol=1e-9):
+    # 全部算子 + 全部因子库的差分校验, 返回报告(dict, 可直接保存为JSON)
+    excutor = AlphaExpressionExcutor()
+    panel = make_verify_market(n_dates, n_codes, seed=seed)
+    fields = [field for field in panel if field != "industry"]
+    frames = [pd.DataFrame({field: panel[field][:, code] for field in fields}) for code in range(n_codes)]
+    report = {
+        "config": {"n_dates": n_dates, "n_codes": n_codes, "seed": seed, "rtol": rtol, "atol": atol, "numba": NUMBA_AVAILABLE, "numexpr": NUMEXPR_AVAILABLE},
+        "operators": [],
+        "libraries": [],
+        "failures": [],
+    }
+    cells = n_dates * n_codes
+    for operator_name, expression in OPERATOR_PROBES.items():
+        graph = AlphaExpressionGraph({operator_name: excutor.compile(expression)}, excutor.op_names)
+        stock_mode = operator_name in excutor.op_funcs  # 行业中性化/去均值只有截面语义, 只在面板模式校验
+        rows, timings = verify_graph(excutor, graph, panel, frames if stock_mode else None, rtol, atol)
+        for row in rows:
+            row["factor"], row["expression"] = operator_name, expression
+        report["operators"].append({"operator": operator_name, "expression": expression, "ops_per_sec": {backend: 1 / seconds for backend, seconds in timings.items()}, "cells_per_sec": {backend: cells / seconds for backend, seconds in timings.items()}, "checks": rows})
+        report["failures"] += [row for row in rows if row["mismatch"]]
+    for alpha_dict_path in alpha_dict_paths:
+        graph = excutor.compile_graph(alpha_dict_path)
+        rows, timings = verify_graph(excutor, graph, panel, frames, rtol, atol)
+        report["libraries"].append(
+            {
+                "library": alpha_dict_path,
+                "factors": len(graph.names),
+                "failed_compile": len(graph.errors),
+                "factors_per_sec": {backend: len(graph.names) / seconds for backend, seconds in timings.items()},
+                "mismatched_factors": sorted({row["factor"] for row in rows if row["mismatch"]}),
+            }
+        )
+        report["failures"] += [{"library": alpha_dict_path, **row} for row in rows if row["mismatch"]]
+    return report
+
+
+def failure_key(row):
+    return " ".join((row.get("library", "operator"), row["mode"], row["backend"], row["factor"]))
+
+
+def make_baseline(report):
+    # 基线: 校验配置 + 每个已知差异(库/模式/后端/因子)的不一致个数与最大绝对误差, 不含耗时(与机器无关, 纳入版本管理)
+    return {
+        "config": {key: value for key, value in report["config"].items() if key in ("n_dates", "n_codes", "seed", "rtol", "atol")},
+        "known": {failure_key(row): {"mismatch": row["mismatch"], "nan_mismatch": row["nan_mismatch"], "max_abs_diff": row["max_abs_diff"]} for row in report["failures"]},
+    }
+
+
+def assert_verification(report, baseline=None):
+    # 不一致超出基线时抛出AssertionError(列出前20个): 基线中没有的差异, 或不一致个数/NaN位置不一致个数/最大绝对误差超过基线记录的值
+    # 基线中记录的是已知差异: 单只股票模式下pandas滚动std/cov/corr在常数窗口上的舍入噪声(内核为精确的0/NaN),
+    # 以及舍入误差(~1e-16)改变rank/tsrank的并列关系; 面板模式下分块/增量计算的长窗口(分段前缀和)与参照只差舍入误差, 同样可能改变下游tsrank/tsargmin的并列关系
+    known = baseline["known"] if baseline is not None else {}
+    if baseline is not None and baseline["config"] != make_baseline(report)["config"]:
+        raise AssertionError(f"verification config {make_baseline(report)['config']} differs from the baseline {baseline['config']}")
+    failures = []
+    for row in report["failures"]:
+        limit = known.get(failure_key(row))
+        if limit is None or row["mismatch"] > limit["mismatch"] or row["nan_mismatch"] > limit["nan_mismatch"] or row["max_abs_diff"] > limit["max_abs_diff"]:
+            failures.append(row)
+    if failures:
+        lines = [f"{failure_key(row)}: mismatch={row['mismatch']} max_abs_diff={row['max_abs_diff']:.3g} (baseline: {known.get(failure_key(row))})" for row in failures[:20]]
+        raise AssertionError(f"{len(failures)} checks exceed the baseline:\n" + "\n".join(lines))
+
+
+def load_report(report_path=VERIFY_REPORT):
+    if not os.path.exists(report_path):
+        return None
+    with open(report_path, "r") as f:
+        return json.load(f)
+
+
+def save_report(report, report_path=VERIFY_REPORT):
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    # 与基线对比, 没有超出基线的不一致时才更新基线(已修复的差异从基线中去掉); 首次运行时当前的差异即作为基线保存
+    verify_baseline = load_report(VERIFY_BASELINE)
+    verify_report = run_verification()
+    for library in verify_report["libraries"]:
+        print(library["library"], {backend: round(value, 1) for backend, value in library["factors_per_sec"].items()}, f"mismatched: {len(library['mismatched_factors'])}")
+    save_report(verify_report)
+    if verify_baseline is not None:
+        assert_verification(verify_report, verify_baseline)
+    save_report(make_baseline(verify_report), VERIFY_BASELINE)
+    print(f"已知差异: {len(verify_report['failures'])}, 报告已保存: {VERIFY_REPORT}, 基线已保存: {VERIFY_BASELINE}")